@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MarkPy - github.com/obag/MarkPy
+# Copyright © 2014 Gabriele Farina <gabr.farina@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Benchmarks of MarkPy, run on the synthetic documents of
+benchmarks.generators. See benchmarks.suite, and benchmarks.__main__ for
+the command line interface:
+
+	python -m benchmarks [--size BYTES] [--output FILE] [--baseline FILE]
+
+benchmarks.adversarial checks that parsing stays linear on documents made to
+defeat the parser.
+"""
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MarkPy - github.com/obag/MarkPy
+# Copyright © 2014 Gabriele Farina <gabr.farina@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Command line interface of the benchmarks: run them, print the results,
+optionally save them as JSON and compare them to a saved baseline.
+
+	python -m benchmarks [--size BYTES] [--depth N] [--seed N] [--repeat N]
+		[--output FILE] [--baseline FILE] [--tolerance FRACTION] [NAME...]
+
+The exit status is 1 if a metric regressed with respect to the baseline.
+"""
+
+import argparse
+import json
+import sys
+
+from .generators import GENERATORS
+from .suite import compare, run
+
+
+def main(argv = None):
+	arg_parser = argparse.ArgumentParser(prog = 'python -m benchmarks',
+		description = 'Benchmark MarkPy on synthetic documents.')
+	arg_parser.add_argument('names', metavar = 'NAME', nargs = '*',
+		help = 'generators to run (default: all of them: %s)' %
+			', '.join(sorted(GENERATORS)))
+	arg_parser.add_argument('--size', type = int, default = 1 << 20,
+		help = 'size of the documents, in characters (default: 1MB)')
+	arg_parser.add_argument('--depth', type = int, default = 3,
+		help = 'nesting depth of the documents (default: 3)')
+	arg_parser.add_argument('--seed', type = int, default = 0)
+	arg_parser.add_argument('--repeat', type = int, default = 5,
+		help = 'timings per measure, the best one is kept (default: 5)')
+	arg_parser.add_argument('--output', metavar = 'FILE',
+		help = 'save the results as JSON to FILE')
+	arg_parser.add_argument('--baseline', metavar = 'FILE',
+		help = 'compare the results to the ones saved in FILE')
+	arg_parser.add_argument('--tolerance', type = float, default = 0.1,
+		help = 'fraction by which a metric may be worse than in the '
+			'baseline (default: 0.1)')
+	args = arg_parser.parse_args(argv)
+
+	for name in args.names:
+		if name not in GENERATORS:
+			arg_parser.error('unknown generator %s' % name)
+
+	results = run(args.names or None, args.size, args.depth, args.seed,
+		args.repeat)
+
+	sys.stdout.write('%-10s %10s %9s %11s %12s %10s %10s %11s\n' % (
+		'name', 'nodes', 'MB/s', 'nodes/s', 'peak memory', 'find_any',
+		'filter', 'to_string'))
+	for (name, metrics) in sorted(results['results'].items()):
+		sys.stdout.write('%-10s %10d %9.2f %11.0f %12s %9.4fs %9.4fs %10.4fs\n' % (
+			name,
+			metrics['nodes'],
+			metrics['parse_mb_s'],
+			metrics['nodes_s'],
+			'-' if metrics['peak_memory'] is None else metrics['peak_memory'],
+			metrics['find_any_s'],
+			metrics['filter_s'],
+			metrics['to_string_s'],
+		))
+
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(results, f, indent = 1, sort_keys = True)
+
+	if args.baseline:
+		with open(args.baseline) as f:
+			baseline = json.load(f)
+		regressions = compare(results, baseline, args.tolerance)
+		for (name, metric, base, value) in regressions:
+			sys.stdout.write('regression: %s %s %.6g -> %.6g\n' % (
+				name, metric, base, value))
+		if regressions:
+			return 1
+
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MarkPy - github.com/obag/MarkPy
+# Copyright © 2014 Gabriele Farina <gabr.farina@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Adversarial documents, made to trigger super-linear behaviour in the
+parser, and a check that parsing them stays linear: every generator is
+parsed at doubling sizes, and its throughput must not drop by more than a
+given factor from the smallest size to the largest.
+
+	python -m benchmarks.adversarial [--size CHARS] [--steps N] [--factor F]
+		[NAME...]
+
+The exit status is 1 if some throughput dropped by more than the factor.
+"""
+
+import argparse
+import sys
+import timeit
+
+from markpy.parser import Limits, Parser
+
+
+def _repeat(head, unit, size, tail = '\n'):
+	return head + unit * max(1, (size - len(head)) // len(unit)) + tail
+
+def deep_sections(size):
+	""" Sections nested 128 levels deep, over and over """
+
+	levels = ''.join('%s s\n\n' % ('=' * level) for level in range(1, 129))
+	return _repeat('', levels + 'text\n\n', size).rstrip('\n') + '\n'
+
+def continuations(size):
+	""" A single paragraph continued on many lines """
+
+	return _repeat('= t\n\nstart\n', '->more text\n', size, '')
+
+def long_run(size):
+	""" A single line of plain text """
+
+	return _repeat('= t\n\n', 'plain text ', size)
+
+def escapes(size):
+	""" A single line of escaped special characters """
+
+	return _repeat('= t\n\n', '\\* \\$ \\/ \\+ \\% ', size)
+
+def formula_spans(size):
+	""" Many inline formulas on a single line """
+
+	return _repeat('= t\n\n', '$x$ \\(y\\) ', size)
+
+def span_toggles(size):
+	""" Spans opened and closed many times, and nested """
+
+	return _repeat('= t\n\n', '*b /i +t+ i/ b* ', size)
+
+def code_fences(size):
+	""" Many tiny code snippets """
+
+	return _repeat('= t\n\n', '~~~\nx\n~~~\n\n', size, '').rstrip('\n') + '\n'
+
+def formulas(size):
+	""" Many formulas """
+
+	return _repeat('= t\n\n', '$$ x $$\n\\[ y \\]\n', size, '').rstrip('\n') + '\n'
+
+def alert_levels(size):
+	""" Alerts with very long runs of ! """
+
+	return _repeat('= t\n\n', '!' * 1000 + ' a\n', size, '')
+
+def blank_lines(size):
+	""" Paragraphs separated by many blank lines """
+
+	return _repeat('= t\n\n', 'p\n' + '\n' * 100, size, '').rstrip('\n') + '\n'
+
+def comments(size):
+	""" Many comment lines """
+
+	return _repeat('= t\n\n', '# comment\n', size, 'p\n')
+
+def list_items(size):
+	""" Many list items """
+
+	return _repeat('= t\n\n', '- item *b*\n', size, '')
+
+CORPUS = dict(
+	(generator.__name__, generator)
+	for generator in (
+		deep_sections, continuations, long_run, escapes, formula_spans,
+		span_toggles, code_fences, formulas, alert_levels, blank_lines,
+		comments, list_items,
+	)
+)
+
+# Limits loose enough for the whole corpus, as a hardened parse would use
+LIMITS = Limits(max_size = None, max_depth = 512, max_nodes = None,
+	max_time = None)
+
+def throughputs(name, size = 1 << 16, steps = 4, repeat = 3):
+	""" Returns the throughputs (in MB/s) of the hardened parse of the
+	document of the generator name, at size, 2 * size, ... (steps sizes)
+	"""
+
+	results = []
+	for step in range(steps):
+		doc = CORPUS[name](size << step)
+		best = min(timeit.repeat(
+			lambda: Parser.parse_document(doc, limits = LIMITS),
+			number = 1,
+			repeat = repeat,
+		))
+		results.append(len(doc) / best / 1e6)
+	return results
+
+def main(argv = None):
+	arg_parser = argparse.ArgumentParser(prog = 'python -m benchmarks.adversarial',
+		description = 'Check that parsing adversarial documents takes linear time.')
+	arg_parser.add_argument('names', metavar = 'NAME', nargs = '*',
+		help = 'generators to run (default: all of them: %s)' %
+			', '.join(sorted(CORPUS)))
+	arg_parser.add_argument('--size', type = int, default = 1 << 16,
+		help = 'size of the smallest documents, in characters (default: 64K)')
+	arg_parser.add_argument('--steps', type = int, default = 4,
+		help = 'number of doubling sizes (default: 4)')
+	arg_parser.add_argument('--factor', type = float, default = 2.0,
+		help = 'maximum drop of throughput from the smallest to the largest '
+			'size (default: 2)')
+	args = arg_parser.parse_args(argv)
+
+	for name in args.names:
+		if name not in CORPUS:
+			arg_parser.error('unknown generator %s' % name)
+
+	failures = 0
+	for name in args.names or sorted(CORPUS):
+		results = throughputs(name, args.size, args.steps)
+		drop = results[0] / results[-1]
+		failed = drop > args.factor
+		failures += failed
+		sys.stdout.write('%-14s %s  drop %.2f%s\n' % (
+			name,
+			' '.join('%7.2f' % result for result in results),
+			drop,
+			'  SUPER-LINEAR' if failed else '',
+		))
+
+	return 1 if failures else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
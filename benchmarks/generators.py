@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MarkPy - github.com/obag/MarkPy
+# Copyright © 2014 Gabriele Farina <gabr.farina@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Seeded generators of synthetic MarkPy documents.
+
+Every generator is a function (size, depth, seed) returning a document of
+about size characters, rich in one of the constructs of the language;
+depth bounds the nesting of sections and spans, and the level of alerts.
+The same arguments always give the same document, on any Python version.
+"""
+
+import random
+
+
+_WORDS = (
+	'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod '
+	'tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam '
+	'quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo'
+).split()
+
+# Inline spans, by opening and closing tag
+_SPANS = [('*', '*'), ('/', '/'), ('+', '+')]
+
+_LATEX = ['x^2', 'a+b', '\\frac{1}{n}', '\\sum_{i=0}^{n} i', '\\alpha \\beta']
+
+_CODE = [
+	'def f(x):',
+	'\treturn x * 2 + 1 # $not$ *markup*',
+	'if a < b and c > d:',
+	'\tprint("%s" % s)',
+	'x = [i ** 2 for i in range(10)]',
+]
+
+# random.Random.randint and choice changed in Python 3.2, random does not:
+# these keep the documents the same on every version
+def _randint(rnd, low, high):
+	return low + int(rnd.random() * (high - low + 1))
+
+def _choice(rnd, items):
+	return items[int(rnd.random() * len(items))]
+
+def _words(rnd, count):
+	return ' '.join(_choice(rnd, _WORDS) for _ in range(count))
+
+def _inline(rnd, depth, spans = True, formulas = True):
+	""" Some text with spans nested up to depth levels and inline formulas """
+
+	parts = []
+	for _ in range(_randint(rnd, 3, 8)):
+		choice = rnd.random()
+		if spans and depth > 0 and choice < 0.3:
+			parts.append(_span(rnd, depth, []))
+		elif formulas and choice < 0.4:
+			parts.append(_formula_span(rnd))
+		else:
+			parts.append(_words(rnd, _randint(rnd, 1, 6)))
+	return ' '.join(parts)
+
+def _span(rnd, depth, open_tags):
+	""" A span, possibly containing other spans of other types """
+
+	(start, end) = _choice(rnd, [tags for tags in _SPANS if tags not in open_tags])
+	inner = _words(rnd, _randint(rnd, 1, 4))
+	if depth > 1 and len(open_tags) + 1 < len(_SPANS) and start != '+':
+		inner += ' ' + _span(rnd, depth - 1, open_tags + [(start, end)])
+		inner += ' ' + _words(rnd, _randint(rnd, 1, 3))
+	return start + inner + end
+
+def _formula_span(rnd):
+	if rnd.random() < 0.5:
+		return '$%s$' % _choice(rnd, _LATEX)
+	return '\\(%s\\)' % _choice(rnd, _LATEX)
+
+def _paragraph(rnd, depth):
+	lines = [_inline(rnd, depth)]
+	if rnd.random() < 0.2:
+		lines.append('->' + _inline(rnd, depth))
+	return '\n'.join(lines) + '\n\n'
+
+########################################################################
+# Bodies of the sections, one per construct                            #
+########################################################################
+
+def _section_body(rnd, depth):
+	return _paragraph(rnd, 1)
+
+def _list_body(rnd, depth):
+	items = [
+		'- %s\n' % _inline(rnd, depth)
+		for _ in range(_randint(rnd, 2, 10))
+	]
+	return ''.join(items) + '\n'
+
+def _alert_body(rnd, depth):
+	level = _randint(rnd, 1, max(1, depth))
+	return '%s %s\n\n' % ('!' * level, _inline(rnd, depth))
+
+def _code_body(rnd, depth):
+	lines = [_choice(rnd, _CODE) for _ in range(_randint(rnd, 1, 12))]
+	return '~~~\n%s\n~~~\n\n' % '\n'.join(lines)
+
+def _formula_body(rnd, depth):
+	latex = ' '.join(_choice(rnd, _LATEX) for _ in range(_randint(rnd, 1, 4)))
+	if rnd.random() < 0.3:
+		return _paragraph(rnd, 0)
+	if rnd.random() < 0.5:
+		return '$$ %s $$\n\n' % latex
+	return '\\[ %s \\]\n\n' % latex
+
+def _span_body(rnd, depth):
+	return _paragraph(rnd, depth)
+
+def _image_body(rnd, depth):
+	return '^images/%s%d.png^ %s\n\n' % (
+		_choice(rnd, _WORDS),
+		_randint(rnd, 0, 999),
+		_inline(rnd, depth),
+	)
+
+def _block_body(rnd, depth):
+	return _paragraph(rnd, depth) + '%\n'
+
+def _comment_body(rnd, depth):
+	comments = [
+		'# %s\n' % _words(rnd, _randint(rnd, 2, 10))
+		for _ in range(_randint(rnd, 1, 4))
+	]
+	return ''.join(comments) + _paragraph(rnd, depth)
+
+_BODIES = {
+	'sections': _section_body,
+	'lists': _list_body,
+	'alerts': _alert_body,
+	'code': _code_body,
+	'formulas': _formula_body,
+	'spans': _span_body,
+	'images': _image_body,
+	'blocks': _block_body,
+	'comments': _comment_body,
+}
+
+def _document(body, size, depth, seed, sections_only = False):
+	""" A document of sections nested up to depth levels, whose contents are
+	made by body
+	"""
+
+	rnd = random.Random(seed)
+	parts = []
+	length = 0
+	level = 0
+	while length < size:
+		# Go at most one level deeper than the current section
+		level = _randint(rnd, 1, min(level + 1, max(1, depth)))
+		part = '%s %s\n\n' % ('=' * level, _words(rnd, _randint(rnd, 1, 5)))
+		for _ in range(1 if sections_only else _randint(rnd, 1, 4)):
+			part += body(rnd, depth)
+		parts.append(part)
+		length += len(part)
+	# Documents cannot end with blank lines
+	return ''.join(parts).rstrip('\n') + '\n'
+
+def _generator(name):
+	body = _BODIES[name]
+	def generate(size, depth = 3, seed = 0):
+		return _document(body, size, depth, seed, name == 'sections')
+	generate.__name__ = name
+	generate.__doc__ = 'A document rich in %s' % name
+	return generate
+
+GENERATORS = dict((name, _generator(name)) for name in _BODIES)
+
+def mixed(size, depth = 3, seed = 0):
+	""" A document with all the constructs """
+
+	bodies = [_BODIES[name] for name in sorted(_BODIES)]
+	def body(rnd, depth):
+		return _choice(rnd, bodies)(rnd, depth)
+	return _document(body, size, depth, seed)
+
+GENERATORS['mixed'] = mixed
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MarkPy - github.com/obag/MarkPy
+# Copyright © 2014 Gabriele Farina <gabr.farina@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" The benchmark suite: parse throughput, memory and traversal costs on
+every generator, results as JSON-compatible dicts and their comparison to a
+baseline.
+"""
+
+import platform
+import timeit
+
+try:
+	import tracemalloc
+except ImportError: # Python < 3.4
+	tracemalloc = None
+
+from markpy import __version__
+from markpy.elementnode import (BoldfaceSpanNode, ItalicSpanNode,
+	RawHTMLNode, SectionNode)
+from markpy.parser import Parser
+
+from .generators import GENERATORS
+
+
+# Whether higher values of a metric are better; the others are costs
+HIGHER_IS_BETTER = {
+	'parse_mb_s': True,
+	'nodes_s': True,
+	'peak_memory': False,
+	'find_any_s': False,
+	'filter_s': False,
+	'to_string_s': False,
+}
+
+def _best_time(function, repeat):
+	""" The best of repeat timings of function() """
+
+	best = None
+	for _ in range(repeat):
+		start = timeit.default_timer()
+		function()
+		elapsed = timeit.default_timer() - start
+		if best is None or elapsed < best:
+			best = elapsed
+	return best
+
+def _peak_memory(function):
+	""" The peak of memory allocated by function(), in bytes, or None if it
+	cannot be measured
+	"""
+
+	if tracemalloc is None:
+		return None
+	tracemalloc.start()
+	try:
+		function()
+		return tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+
+def run_one(name, size, depth = 3, seed = 0, repeat = 5):
+	""" Returns the metrics of the document made by the generator name """
+
+	doc = GENERATORS[name](size, depth, seed)
+	root = Parser.parse_document(doc)
+	nodes = sum(1 for _ in root.iter_preorder())
+
+	parse = _best_time(lambda: Parser.parse_document(doc), repeat)
+	return {
+		'bytes': len(doc.encode('utf-8')),
+		'nodes': nodes,
+		'parse_mb_s': len(doc.encode('utf-8')) / parse / 1e6,
+		'nodes_s': nodes / parse,
+		'peak_memory': _peak_memory(lambda: Parser.parse_document(doc)),
+		# A type the parser never makes, so the whole tree is visited
+		'find_any_s': _best_time(lambda: root.find_any([RawHTMLNode]), repeat),
+		'filter_s': _best_time(
+			lambda: root.filter([SectionNode, BoldfaceSpanNode, ItalicSpanNode]),
+			repeat,
+		),
+		'to_string_s': _best_time(lambda: root.to_string(), repeat),
+	}
+
+def run(names = None, size = 1 << 20, depth = 3, seed = 0, repeat = 5):
+	""" Run the benchmarks of the generators in names (all of them by
+	default) and returns the results, with the parameters of the run
+	"""
+
+	names = sorted(GENERATORS) if names is None else names
+	return {
+		'markpy': __version__,
+		'python': platform.python_version(),
+		'parameters': {
+			'size': size,
+			'depth': depth,
+			'seed': seed,
+			'repeat': repeat,
+		},
+		'results': dict(
+			(name, run_one(name, size, depth, seed, repeat))
+			for name in names
+		),
+	}
+
+def compare(results, baseline, tolerance = 0.1):
+	""" Compare results to baseline (both as returned by run) and returns
+	the list of regressions, as (name, metric, baseline value, value) tuples:
+	the metrics more than tolerance (a fraction) worse than in the baseline.
+	Benchmarks and metrics missing in either are ignored.
+	"""
+
+	regressions = []
+	for (name, metrics) in sorted(results['results'].items()):
+		base_metrics = baseline['results'].get(name, {})
+		for (metric, higher) in sorted(HIGHER_IS_BETTER.items()):
+			value = metrics.get(metric)
+			base = base_metrics.get(metric)
+			if not value or not base:
+				continue
+			if higher:
+				worse = value < base * (1 - tolerance)
+			else:
+				worse = value > base * (1 + tolerance)
+			if worse:
+				regressions.append((name, metric, base, value))
+	return regressions
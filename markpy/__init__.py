@@ -16,8 +16,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+__version__ = '1.0'
+
 __all__ = [
 	'parser',
 	'elementnode',
+	'cache',
+	'selector',
+	'render',
+	'diff',
+	'binary',
+	'flat',
+	'grammar',
+	'lines',
 	# 'elementstack' # It is more "internal stuff" than other
+	# 'aio' # Requires Python 3.6
 ]
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MarkPy - github.com/obag/MarkPy
+# Copyright © 2014 Gabriele Farina <gabr.farina@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+""" Command line interface: parse MarkPy files with a pool of worker
+processes and report, for each of them, the number of nodes of the resulting
+tree or the reason why it could not be parsed.
+
+	python -m markpy [-j WORKERS] [--unordered] [--tree] FILE...
+"""
+
+import argparse
+import sys
+
+from .parser import Parser
+
+
+def main(argv = None):
+	arg_parser = argparse.ArgumentParser(prog = 'python -m markpy',
+		description = 'Parse MarkPy files.')
+	arg_parser.add_argument('files', metavar = 'FILE', nargs = '+')
+	arg_parser.add_argument('-j', '--workers', type = int, default = None,
+		help = 'number of worker processes (default: number of CPUs)')
+	arg_parser.add_argument('--unordered', action = 'store_true',
+		help = 'report the files as soon as they are parsed')
+	arg_parser.add_argument('--tree', action = 'store_true',
+		help = 'print the tree of every file')
+	args = arg_parser.parse_args(argv)
+
+	failures = 0
+	for result in Parser.parse_many(args.files, workers = args.workers,
+		ordered = not args.unordered):
+
+		if result.error is not None:
+			failures += 1
+			sys.stderr.write('%s: error: %s\n' % (result.path, result.error))
+			continue
+
+		nodes = sum(1 for _ in result.root.iter_preorder())
+		sys.stdout.write('%s: %d nodes\n' % (result.path, nodes))
+		if args.tree:
+			result.root.to_string(sink = sys.stdout)
+
+	return 1 if failures else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
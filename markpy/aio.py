@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MarkPy - github.com/obag/MarkPy
+# Copyright © 2014 Gabriele Farina <gabr.farina@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# This module requires Python 3.6 or newer (async generators) and is not
+# imported by the markpy package.
+
+import codecs
+
+from .parser import IncrementalParser
+
+
+async def parse_stream(reader, encoding = 'utf-8', chunk_size = 65536):
+	""" Parse the document read from an asyncio.StreamReader (or any object
+	with a coroutine read(n) method returning bytes) and return the root of
+	the resulting tree.
+	"""
+
+	parser = IncrementalParser()
+	async for _ in _feed_stream(parser, reader, encoding, chunk_size):
+		pass
+	return parser.close()
+
+async def iterparse_stream(reader, encoding = 'utf-8', chunk_size = 65536,
+	discard = False):
+	""" Asynchronous counterpart of Parser.iterparse: yield the parse events
+	of the document read from an asyncio.StreamReader as soon as the lines
+	producing them have been received.
+	"""
+
+	parser = IncrementalParser(events = True, discard = discard)
+	async for _ in _feed_stream(parser, reader, encoding, chunk_size):
+		for event in parser.read_events():
+			yield event
+	parser.close()
+	for event in parser.read_events():
+		yield event
+
+async def _feed_stream(parser, reader, encoding, chunk_size):
+	""" Feed parser with the decoded content of reader, yielding after every
+	chunk
+	"""
+
+	decoder = codecs.getincrementaldecoder(encoding)()
+	while True:
+		chunk = await reader.read(chunk_size)
+		if not chunk:
+			break
+		parser.feed(decoder.decode(chunk))
+		yield
+	parser.feed(decoder.decode(b'', final = True))
+	yield
@@ -0,0 +1,416 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MarkPy - github.com/obag/MarkPy
+# Copyright © 2014 Gabriele Farina <gabr.farina@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" A compact, versioned binary format for ElementNode trees.
+
+dumps(root) returns the bytes of the tree whose root is root, and loads
+rebuilds it; dump and load do the same with files. The format is made of:
+
+- a header: magic, version, and the sizes of the sections below;
+- the type table: the string index of the "module:Class" name of every node
+  type used;
+- the string table: the end offsets of the (deduplicated, UTF-8 encoded)
+  strings in the string blob;
+- the nodes in preorder, as parallel columns: type index, size of the
+  subtree (the offset of the next sibling), depth (-1 if none), attrib and
+  extra dict references (offset + 1 in the dict blob, 0 if none) and
+  content string index (0xFFFFFFFF if none);
+- the dict blob, where the attribs (but depth) and extra dicts are encoded;
+- the string blob.
+
+All the integers are little-endian. Parent links are rebuilt on load. Node
+types are looked up among the ElementNode subclasses defined when loading,
+so the modules defining custom ones must have been imported; loading never
+imports anything. Malformed data raises ValueError.
+
+With lazy = True, loads and load do not decode the contents of the
+StringNodes: they slice them from the buffer (a memoryview over the bytes or
+over the mmapped file) whenever they are accessed.
+"""
+
+import array
+import codecs
+import mmap
+import struct
+import sys
+
+from .elementnode import ElementNode, StringNode, _NO_CHILDREN
+
+
+MAGIC = b'MKPY'
+VERSION = 1
+
+# magic, version, flags, then the number of types, strings and nodes, and
+# the size of the dict and string blobs
+_HEADER = struct.Struct('<4sHHIIIII')
+
+_NO_STRING = 0xFFFFFFFF
+
+# Tags of the values in the dict blob
+_NONE, _INT, _STRING, _FLOAT, _TRUE, _FALSE = range(6)
+_COUNT = struct.Struct('<I')
+_ITEM = struct.Struct('<IB')
+_INT_VALUE = struct.Struct('<q')
+_FLOAT_VALUE = struct.Struct('<d')
+
+def _column(typecode, items = ()):
+	column = array.array(typecode, items)
+	assert column.itemsize == {'H': 2, 'I': 4, 'i': 4}[typecode]
+	return column
+
+def _column_bytes(column):
+	if sys.byteorder != 'little':
+		column = array.array(column.typecode, column)
+		column.byteswap()
+	return column.tobytes() if hasattr(column, 'tobytes') else column.tostring()
+
+def _read_column(typecode, data, offset, count):
+	""" Returns the column of count items at offset in data, and the offset
+	following it
+	"""
+
+	column = _column(typecode)
+	end = offset + count * column.itemsize
+	chunk = _bytes(data, offset, end)
+	if len(chunk) != end - offset:
+		raise ValueError('truncated MarkPy binary tree')
+	if hasattr(column, 'frombytes'):
+		column.frombytes(chunk)
+	else:
+		column.fromstring(chunk)
+	if sys.byteorder != 'little':
+		column.byteswap()
+	return (column, end)
+
+def _bytes(data, start, end):
+	chunk = data[start : end]
+	return chunk.tobytes() if isinstance(chunk, memoryview) else chunk
+
+class _Strings(object):
+	""" The string table being built by dumps """
+
+	def __init__(self):
+		self.indices = {}
+		self.ends = _column('I')
+		self.blob = []
+		self.size = 0
+
+	def add(self, s):
+		if s is None:
+			return _NO_STRING
+		index = self.indices.get(s)
+		if index is None:
+			data = s if isinstance(s, bytes) else s.encode('utf-8')
+			index = self.indices[s] = len(self.ends)
+			self.blob.append(data)
+			self.size += len(data)
+			self.ends.append(self.size)
+		return index
+
+class _BufferSource(object):
+	""" Source of the StringNodes loaded lazily: slicing it decodes the
+	UTF-8 bytes of the buffer in the range
+	"""
+
+	__slots__ = ('buffer',)
+
+	def __init__(self, buffer):
+		self.buffer = buffer
+
+	def __getitem__(self, span):
+		return codecs.utf_8_decode(self.buffer[span.start : span.stop])[0]
+
+def _node_classes():
+	""" Returns the ElementNode subclasses defined so far, by their
+	"module:Class" names
+	"""
+
+	classes = {}
+	pending = [ElementNode]
+	while pending:
+		cls = pending.pop()
+		classes['%s:%s' % (cls.__module__, cls.__name__)] = cls
+		pending.extend(cls.__subclasses__())
+	return classes
+
+def dumps(root):
+	""" Returns the binary representation (bytes) of the tree whose root is
+	root
+	"""
+
+	strings = _Strings()
+	type_ids = {}
+	type_names = _column('I')
+
+	types = _column('H')
+	sizes = _column('I')
+	depths = _column('i')
+	attribs = _column('I')
+	extras = _column('I')
+	contents = _column('I')
+	dicts = []
+	dicts_size = 0
+
+	# Preorder, with the position of every node to fill in its size once
+	# its subtree is done
+	stack = [(root, False)]
+	while stack:
+		(node, done) = stack.pop()
+		if done:
+			# node is the position of a node whose subtree is done
+			sizes[node] = len(types) - sizes[node]
+			continue
+
+		cls = type(node)
+		type_id = type_ids.get(cls)
+		if type_id is None:
+			type_id = type_ids[cls] = len(type_names)
+			type_names.append(strings.add('%s:%s' % (cls.__module__, cls.__name__)))
+
+		depth = node._depth
+		attrib = node._attrib
+		if attrib:
+			depth = attrib.get('depth')
+			if depth is not None:
+				attrib = dict(attrib)
+				del attrib['depth']
+
+		position = len(types)
+		types.append(type_id)
+		sizes.append(position)
+		depths.append(-1 if depth is None else depth)
+		for (column, value) in ((attribs, attrib), (extras, node._extra)):
+			if value:
+				data = _dict_bytes(value, strings)
+				dicts.append(data)
+				column.append(dicts_size + 1)
+				dicts_size += len(data)
+			else:
+				column.append(0)
+		contents.append(strings.add(getattr(node, 'content', None)))
+
+		stack.append((position, True))
+		stack.extend((child, False) for child in reversed(node._children))
+
+	header = _HEADER.pack(
+		MAGIC, VERSION, 0,
+		len(type_names), len(strings.ends), len(types),
+		dicts_size, strings.size,
+	)
+	return b''.join(
+		[header] +
+		[
+			_column_bytes(column)
+			for column in (
+				type_names, strings.ends,
+				types, sizes, depths, attribs, extras, contents,
+			)
+		] +
+		dicts + strings.blob
+	)
+
+def dump(root, f):
+	""" Write the binary representation of the tree whose root is root to
+	the binary file f
+	"""
+
+	f.write(dumps(root))
+
+def loads(data, lazy = False):
+	""" Rebuilds a tree from its binary representation and returns its root.
+	data is any bytes-like object; with lazy = True, the contents of the
+	StringNodes are sliced from it on demand, so that it is kept alive by
+	the tree and must not change. Raises ValueError if data is not a valid
+	tree.
+	"""
+
+	try:
+		return _loads(data, lazy)
+	except (IndexError, KeyError, struct.error) as e:
+		raise ValueError('corrupted MarkPy binary tree (%s)' % e)
+
+def _loads(data, lazy):
+	try:
+		view = memoryview(data)
+	except TypeError:
+		# Python 2 mmaps, whose slices are strings
+		view = data
+	if len(view) < _HEADER.size:
+		raise ValueError('not a MarkPy binary tree')
+	(magic, version, _, type_count, string_count, node_count, dicts_size,
+		strings_size) = _HEADER.unpack(_bytes(view, 0, _HEADER.size))
+	if magic != MAGIC:
+		raise ValueError('not a MarkPy binary tree')
+	if version != VERSION:
+		raise ValueError('unsupported MarkPy binary version %d' % version)
+
+	offset = _HEADER.size
+	(type_names, offset) = _read_column('I', view, offset, type_count)
+	(ends, offset) = _read_column('I', view, offset, string_count)
+	columns = []
+	for typecode in 'HIiIII':
+		(column, offset) = _read_column(typecode, view, offset, node_count)
+		columns.append(column)
+	(types, sizes, depths, attribs, extras, contents) = columns
+	dicts = _bytes(view, offset, offset + dicts_size)
+	offset += dicts_size
+	blob = view[offset : offset + strings_size]
+	if len(dicts) != dicts_size or len(blob) != strings_size:
+		raise ValueError('truncated MarkPy binary tree')
+	if string_count and ends[-1] > strings_size:
+		raise ValueError('corrupted MarkPy binary tree')
+
+	decoded = {}
+	def string(index):
+		if index == _NO_STRING:
+			return None
+		s = decoded.get(index)
+		if s is None:
+			start = ends[index-1] if index else 0
+			s = decoded[index] = codecs.utf_8_decode(blob[start : ends[index]])[0]
+		return s
+
+	known = _node_classes()
+	classes = []
+	for index in type_names:
+		name = string(index)
+		if name not in known:
+			raise ValueError('unknown node type %s' % name)
+		classes.append(known[name])
+	has_content = [hasattr(cls, 'content') for cls in classes]
+	is_lazy = [lazy and issubclass(cls, StringNode) for cls in classes]
+	own_slots = [
+		[
+			slot
+			for base in cls.__mro__[:cls.__mro__.index(ElementNode)]
+			for slot in base.__dict__.get('__slots__', ())
+		]
+		for cls in classes
+	]
+	source = _BufferSource(blob) if lazy else None
+
+	root = None
+	# The open nodes, with the position where their subtree ends
+	stack = []
+	for position in range(node_count):
+		type_id = types[position]
+		cls = classes[type_id]
+		node = cls.__new__(cls)
+
+		depth = depths[position]
+		depth = None if depth < 0 else depth
+		attrib = attribs[position]
+		if attrib:
+			attrib = _load_dict(dicts, attrib, string)
+			if depth is not None:
+				attrib['depth'] = depth
+			node._attrib = attrib
+			node._depth = None
+		else:
+			node._attrib = None
+			node._depth = depth
+		extra = extras[position]
+		node._extra = _load_dict(dicts, extra, string) if extra else None
+		node._children = [] if sizes[position] > 1 else _NO_CHILDREN
+		node._hash = None
+		for slot in own_slots[type_id]:
+			setattr(node, slot, None)
+		if is_lazy[type_id] and contents[position] != _NO_STRING:
+			index = contents[position]
+			node.source = source
+			node.start = ends[index-1] if index else 0
+			node.end = ends[index]
+		elif has_content[type_id]:
+			node._content = string(contents[position])
+
+		while stack and stack[-1][1] <= position:
+			stack.pop()
+		if stack:
+			parent = stack[-1][0]
+			node.parent = parent
+			parent._children.append(node)
+		else:
+			if root is not None:
+				raise ValueError('corrupted MarkPy binary tree')
+			node.parent = None
+			root = node
+		if sizes[position] > 1:
+			stack.append((node, position + sizes[position]))
+
+	if root is None:
+		raise ValueError('corrupted MarkPy binary tree')
+	return root
+
+def load(f, lazy = False):
+	""" Rebuilds a tree from the binary file f and returns its root. With
+	lazy = True the file is mmapped, and the contents of the StringNodes
+	are sliced from the mapping on demand.
+	"""
+
+	if lazy:
+		return loads(mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ), True)
+	return loads(f.read())
+
+def _dict_bytes(d, strings):
+	""" Encode the dict d in the dict blob format """
+
+	parts = [_COUNT.pack(len(d))]
+	for (key, value) in sorted(d.items()):
+		key = strings.add(key)
+		if value is None:
+			parts.append(_ITEM.pack(key, _NONE))
+		elif value is True or value is False:
+			parts.append(_ITEM.pack(key, _TRUE if value else _FALSE))
+		elif isinstance(value, (int, type(sys.maxsize + 1))):
+			parts += [_ITEM.pack(key, _INT), _INT_VALUE.pack(value)]
+		elif isinstance(value, float):
+			parts += [_ITEM.pack(key, _FLOAT), _FLOAT_VALUE.pack(value)]
+		elif isinstance(value, (bytes, type(u''))):
+			parts += [_ITEM.pack(key, _STRING), _COUNT.pack(strings.add(value))]
+		else:
+			raise TypeError('cannot serialize %s values' % type(value).__name__)
+	return b''.join(parts)
+
+def _load_dict(dicts, reference, string):
+	""" Decode the dict at reference (offset + 1, or 0) in the dict blob """
+
+	if not reference:
+		return None
+
+	offset = reference - 1
+	(count,) = _COUNT.unpack_from(dicts, offset)
+	offset += _COUNT.size
+
+	d = {}
+	for _ in range(count):
+		(key, tag) = _ITEM.unpack_from(dicts, offset)
+		offset += _ITEM.size
+		if tag == _INT:
+			(value,) = _INT_VALUE.unpack_from(dicts, offset)
+			offset += _INT_VALUE.size
+		elif tag == _FLOAT:
+			(value,) = _FLOAT_VALUE.unpack_from(dicts, offset)
+			offset += _FLOAT_VALUE.size
+		elif tag == _STRING:
+			(value,) = _COUNT.unpack_from(dicts, offset)
+			value = string(value)
+			offset += _COUNT.size
+		else:
+			value = {_NONE: None, _TRUE: True, _FALSE: False}[tag]
+		d[string(key)] = value
+	return d
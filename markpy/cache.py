@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MarkPy - github.com/obag/MarkPy
+# Copyright © 2014 Gabriele Farina <gabr.farina@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import collections
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+
+from . import __version__, grammar
+from .elementnode import ElementNode
+from .parser import Parser
+
+
+class ParseCache(object):
+	""" A cache in front of Parser.parse_document, keyed by a hash of the
+	source, of the parser version and of the grammar (see grammar.fingerprint),
+	so that trees parsed with other handlers registered are not reused.
+
+	Trees are kept in the packed form of ElementNode.pack, in a LRU bounded
+	by the total number of nodes (max_nodes) rather than by the number of
+	entries and, if directory is given, in files there, so that they survive
+	restarts. Every call returns a new tree, so callers can modify it
+	without affecting the cache.
+
+	The hits, misses (documents actually parsed), evictions, disk_hits and
+	disk_writes counters are available as attributes and through stats().
+	"""
+
+	def __init__(self, max_nodes = 1000000, directory = None):
+		self.max_nodes = max_nodes
+		self.directory = directory
+		self._entries = collections.OrderedDict()
+		self._nodes = 0
+		self._lock = threading.Lock()
+
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.disk_hits = 0
+		self.disk_writes = 0
+
+	@staticmethod
+	def key(s):
+		""" Returns the cache key of the string s """
+
+		data = s if isinstance(s, bytes) else s.encode('utf-8')
+		digest = hashlib.sha1()
+		digest.update(('%s\0%s\0' % (__version__, type(s).__name__)).encode('ascii'))
+		digest.update(grammar.fingerprint().encode('utf-8') + b'\0')
+		digest.update(data)
+		return digest.hexdigest()
+
+	def parse_document(self, s):
+		""" Returns the root of the tree of s, parsing it only if needed """
+
+		key = ParseCache.key(s)
+
+		with self._lock:
+			packed = self._entries.pop(key, None)
+			if packed is not None:
+				self._entries[key] = packed
+				self.hits += 1
+
+		if packed is None:
+			packed = self._load(key)
+			if packed is not None:
+				with self._lock:
+					self.disk_hits += 1
+					self.hits += 1
+			else:
+				packed = Parser.parse_document(s).pack()
+				with self._lock:
+					self.misses += 1
+				self._store(key, packed)
+			self._add(key, packed)
+
+		return ElementNode.unpack(packed)
+
+	def stats(self):
+		""" Returns the counters of the cache and its current size """
+
+		with self._lock:
+			return {
+				'hits': self.hits,
+				'misses': self.misses,
+				'evictions': self.evictions,
+				'disk_hits': self.disk_hits,
+				'disk_writes': self.disk_writes,
+				'entries': len(self._entries),
+				'nodes': self._nodes,
+			}
+
+	def clear(self):
+		""" Empty the in-memory cache (files on disk are kept) """
+
+		with self._lock:
+			self._entries.clear()
+			self._nodes = 0
+
+	def _add(self, key, packed):
+		""" Add an entry to the LRU, evicting the least recently used ones to
+		stay within max_nodes
+		"""
+
+		size = ParseCache._size(packed)
+		if size > self.max_nodes:
+			return
+
+		with self._lock:
+			if key in self._entries:
+				return
+			self._entries[key] = packed
+			self._nodes += size
+
+			while self._nodes > self.max_nodes:
+				(_, evicted) = self._entries.popitem(last = False)
+				self._nodes -= ParseCache._size(evicted)
+				self.evictions += 1
+
+	@staticmethod
+	def _size(packed):
+		""" Number of nodes of a packed tree """
+
+		return len(packed[1]) // 5
+
+	def _path(self, key):
+		return os.path.join(self.directory, key[:2], key + '.pickle')
+
+	def _load(self, key):
+		""" Returns the packed tree stored on disk for key, if any """
+
+		if self.directory is None:
+			return None
+		try:
+			with open(self._path(key), 'rb') as f:
+				return pickle.load(f)
+		except (IOError, OSError, EOFError, pickle.UnpicklingError):
+			return None
+
+	def _store(self, key, packed):
+		""" Store a packed tree on disk, atomically """
+
+		if self.directory is None:
+			return
+
+		path = self._path(key)
+		folder = os.path.dirname(path)
+		if not os.path.isdir(folder):
+			try:
+				os.makedirs(folder)
+			except OSError:
+				if not os.path.isdir(folder):
+					raise
+
+		(fd, temp_path) = tempfile.mkstemp(dir = folder)
+		try:
+			with os.fdopen(fd, 'wb') as f:
+				pickle.dump(packed, f, pickle.HIGHEST_PROTOCOL)
+			os.rename(temp_path, path)
+		except:
+			os.unlink(temp_path)
+			raise
+
+		with self._lock:
+			self.disk_writes += 1
+
+class FragmentCache(object):
+	""" A cache of rendered fragments, used by HTMLRenderer to reuse the
+	output of the subtrees (sections and blocks) that did not change from a
+	render to the next, even across parses.
+
+	Fragments are kept in a LRU bounded by their total length (max_size,
+	in characters). Keys are made by the renderer from the structural hashes
+	of the subtrees; a cache must only be shared by renderers that render
+	nodes in the same way.
+
+	The hits, misses and evictions counters are available as attributes and
+	through stats().
+	"""
+
+	def __init__(self, max_size = 1 << 24):
+		self.max_size = max_size
+		self._entries = collections.OrderedDict()
+		self._size = 0
+		self._lock = threading.Lock()
+
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def get(self, key):
+		""" Returns the fragment cached for key, or None """
+
+		with self._lock:
+			fragment = self._entries.pop(key, None)
+			if fragment is None:
+				self.misses += 1
+			else:
+				self._entries[key] = fragment
+				self.hits += 1
+			return fragment
+
+	def put(self, key, fragment):
+		""" Cache fragment for key, evicting the least recently used fragments
+		to stay within max_size
+		"""
+
+		if len(fragment) > self.max_size:
+			return
+
+		with self._lock:
+			old = self._entries.pop(key, None)
+			if old is not None:
+				self._size -= len(old)
+			self._entries[key] = fragment
+			self._size += len(fragment)
+
+			while self._size > self.max_size:
+				(_, evicted) = self._entries.popitem(last = False)
+				self._size -= len(evicted)
+				self.evictions += 1
+
+	def stats(self):
+		""" Returns the counters of the cache and its current size """
+
+		with self._lock:
+			return {
+				'hits': self.hits,
+				'misses': self.misses,
+				'evictions': self.evictions,
+				'entries': len(self._entries),
+				'size': self._size,
+			}
+
+	def clear(self):
+		""" Empty the cache """
+
+		with self._lock:
+			self._entries.clear()
+			self._size = 0
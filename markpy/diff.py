@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MarkPy - github.com/obag/MarkPy
+# Copyright © 2014 Gabriele Farina <gabr.farina@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Structural diff of ElementNode trees.
+
+diff(old, new) returns the list of Operations turning the tree old into the
+tree new. Subtrees are first matched by their structural hash (see
+ElementNode.structural_hash), so that unchanged subtrees cost nothing
+wherever they are; the children of matched nodes whose subtrees differ are
+then aligned, pairing the unmatched ones by type between the matches.
+Subtrees left unmatched are matched by hash across the whole trees, which
+finds the subtrees moved to another parent, and the rest are inserted or
+deleted.
+
+On typical edits the cost is linear in the size of the trees, and mostly
+spent computing the hashes, which the nodes keep for the next diffs until
+their subtree changes, whether through the setters or in place through the
+children and attrib of a node.
+"""
+
+import bisect
+
+
+class Operation(object):
+	""" One operation of a diff. kind is one of:
+
+	- 'update': the matched nodes old and new differ in their attribs (but
+	  depth) or content;
+	- 'move': the subtree old is the subtree new, now at another position;
+	  its own differences are reported by other operations;
+	- 'insert': the subtree new is not in the old tree (old is None);
+	- 'delete': the subtree old is not in the new tree (new is None).
+
+	parent and index tell where the node is: in the new tree for inserts,
+	moves and updates, in the old tree for deletes. They are None for the
+	roots.
+	"""
+
+	def __init__(self, kind, old, new, parent = None, index = None):
+		self.kind = kind
+		self.old = old
+		self.new = new
+		self.parent = parent
+		self.index = index
+
+	def __repr__(self):
+		return '<Operation %s %s at %s>' % (
+			self.kind,
+			type(self.old if self.new is None else self.new).__name__,
+			self.index,
+		)
+
+def diff(old, new):
+	""" Returns the list of Operations turning the tree old into the tree new.
+
+	The updates and moves of the nodes matched while walking the trees
+	come first, parents before their children, followed by the moves
+	across parents and the inserts, and then by the deletes.
+	"""
+
+	if type(old) is not type(new):
+		return [Operation('delete', old, None), Operation('insert', None, new)]
+
+	ops = []
+	unmatched_old = []
+	unmatched_new = []
+
+	stack = [(old, new, None, None)]
+	while stack:
+		(a, b, parent, index) = stack.pop()
+		if a.structural_hash() == b.structural_hash():
+			continue
+
+		if _label(a) != _label(b):
+			ops.append(Operation('update', a, b, parent, index))
+
+		(pairs, only_old, only_new) = _align(a._children, b._children)
+
+		kept = _increasing(pairs)
+		changed = []
+		for (position, (i, j)) in enumerate(pairs):
+			if position not in kept:
+				ops.append(Operation('move', a._children[i], b._children[j], b, j))
+			changed.append((a._children[i], b._children[j], b, j))
+		stack.extend(reversed(changed))
+
+		unmatched_old += [(a._children[i], a, i) for i in only_old]
+		unmatched_new += [(b._children[j], b, j) for j in only_new]
+
+	# The subtrees moved across parents
+	by_hash = {}
+	for entry in reversed(unmatched_old):
+		by_hash.setdefault(entry[0].structural_hash(), []).append(entry)
+
+	for (node, parent, index) in unmatched_new:
+		candidates = by_hash.get(node.structural_hash())
+		if candidates:
+			ops.append(Operation('move', candidates.pop()[0], node, parent, index))
+		else:
+			ops.append(Operation('insert', None, node, parent, index))
+
+	for entries in by_hash.values():
+		for (node, parent, index) in entries:
+			ops.append(Operation('delete', node, None, parent, index))
+
+	return ops
+
+def _label(node):
+	""" What a node is, regardless of its children and depth """
+
+	attrib = dict(node._attrib or {})
+	attrib.pop('depth', None)
+	return (type(node), attrib, getattr(node, 'content', None))
+
+def _align(old, new):
+	""" Align two lists of children. Returns the list of matched (old index,
+	new index) pairs, ordered by new index, and the indices of the old and
+	new children left unmatched.
+
+	The common head and tail are matched first, then the children with
+	equal hashes, in order. Each of the others is matched to the first
+	unmatched old child of the same type between the old children of the
+	closest previous and next matches.
+	"""
+
+	matches = [None] * len(new)
+	used = [False] * len(old)
+
+	# The common head and tail
+	head = 0
+	while (head < len(old) and head < len(new) and
+		old[head].structural_hash() == new[head].structural_hash()):
+		matches[head] = head
+		used[head] = True
+		head += 1
+	tail = 0
+	while (tail < len(old) - head and tail < len(new) - head and
+		old[-1-tail].structural_hash() == new[-1-tail].structural_hash()):
+		matches[len(new)-1-tail] = len(old) - 1 - tail
+		used[len(old)-1-tail] = True
+		tail += 1
+
+	free = {}
+	for i in range(head, len(old) - tail):
+		free.setdefault(old[i].structural_hash(), []).append(i)
+
+	# Among equal children, prefer the first one after the previous match
+	lower = head
+	for j in range(head, len(new) - tail):
+		child = new[j]
+		indices = free.get(child.structural_hash())
+		if indices:
+			position = bisect.bisect_left(indices, lower)
+			if position == len(indices):
+				position = 0
+			i = matches[j] = indices.pop(position)
+			used[i] = True
+			lower = i + 1
+
+	# The unmatched old children by type, in order
+	by_type = {}
+	for (i, child) in enumerate(old):
+		if not used[i]:
+			by_type.setdefault(type(child), []).append(i)
+
+	# For every new child, the old index of the next exact match
+	upper = [len(old)] * len(new)
+	bound = len(old)
+	for j in range(len(new) - 1, -1, -1):
+		upper[j] = bound
+		if matches[j] is not None:
+			bound = matches[j]
+
+	lower = 0
+	only_new = []
+	for (j, child) in enumerate(new):
+		if matches[j] is not None:
+			lower = matches[j] + 1
+			continue
+
+		indices = by_type.get(type(child), [])
+		position = bisect.bisect_left(indices, lower)
+		if position < len(indices) and indices[position] < upper[j]:
+			i = matches[j] = indices.pop(position)
+			used[i] = True
+			lower = i + 1
+		else:
+			only_new.append(j)
+
+	pairs = [(i, j) for (j, i) in enumerate(matches) if i is not None]
+	only_old = [i for i in range(len(old)) if not used[i]]
+	return (pairs, only_old, only_new)
+
+def _increasing(pairs):
+	""" Returns the set of positions in pairs of a longest run of pairs with
+	increasing old indices: these keep their order, the others are moves.
+	"""
+
+	tails = []
+	tail_positions = []
+	previous = [None] * len(pairs)
+	for (position, (i, _)) in enumerate(pairs):
+		k = bisect.bisect_left(tails, i)
+		if k == len(tails):
+			tails.append(i)
+			tail_positions.append(position)
+		else:
+			tails[k] = i
+			tail_positions[k] = position
+		previous[position] = tail_positions[k-1] if k else None
+
+	kept = set()
+	position = tail_positions[-1] if tail_positions else None
+	while position is not None:
+		kept.add(position)
+		position = previous[position]
+	return kept
@@ -16,18 +16,248 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import array
+import bisect
+import hashlib
+import heapq
+
+
+class _NoChildren(list):
+	""" Immutable empty list shared by all the nodes without children. Nodes
+	get their own list on the first append_child, or the first time a list
+	of their children is changed.
+	"""
+
+	__slots__ = ()
+
+	def _immutable(self, *args, **kwargs):
+		raise TypeError('nodes without children share an immutable empty '
+			'list, use append_child instead')
+
+	append = extend = insert = remove = pop = _immutable
+	sort = reverse = _immutable
+	__setitem__ = __delitem__ = __iadd__ = __imul__ = _immutable
+	__setslice__ = __delslice__ = _immutable
+
+	def __reduce__(self):
+		return '_NO_CHILDREN'
+
+_NO_CHILDREN = _NoChildren()
+
+class _Children(list):
+	""" The list returned by ElementNode.children. Changing it in place drops
+	the structural hashes of the node and of its ancestors, and the node-type
+	index of the document, as setting the children does.
+
+	For a node without children, the list is not kept by the node until
+	something is added to it, so reading the children of the leaves does not
+	allocate a list for each. A list that is no longer the children of its
+	node, because they were set or added to since, changes nothing but itself.
+	"""
+
+	__slots__ = ('_node', )
+
+	def __init__(self, node, children = ()):
+		list.__init__(self, children)
+		self._node = node
+
+	def _changing(self):
+		node = self._node
+		if node._children is _NO_CHILDREN:
+			node._children = self
+		if node._children is self:
+			node._children_changed()
+
+	def __reduce__(self):
+		return (list, (), None, iter(self))
+
+class _Attrib(dict):
+	""" The dict returned by ElementNode.attrib. Changing it in place drops
+	the structural hashes of the node and of its ancestors, as setting the
+	attribs does.
+	"""
+
+	__slots__ = ('_node', )
+
+	def __init__(self, node, attrib = ()):
+		dict.__init__(self, attrib)
+		self._node = node
+
+	def _changing(self):
+		node = self._node
+		if node._attrib is self:
+			node._changed()
+
+	def __reduce__(self):
+		return (dict, (), None, None, iter(self.items()))
+
+def _changing(cls, names):
+	""" Make the methods of cls named in names call self._changing first """
+
+	def wrap(method):
+		def changing(self, *args, **kwargs):
+			self._changing()
+			return method(self, *args, **kwargs)
+		changing.__name__ = method.__name__
+		return changing
+
+	for name in names:
+		method = getattr(cls.__base__, name, None)
+		if method is not None:
+			setattr(cls, name, wrap(method))
+
+_changing(_Children, (
+	'append', 'extend', 'insert', 'remove', 'pop', 'sort', 'reverse', 'clear',
+	'__setitem__', '__delitem__', '__iadd__', '__imul__',
+	'__setslice__', '__delslice__',
+))
+_changing(_Attrib, (
+	'update', 'pop', 'popitem', 'clear', 'setdefault',
+	'__setitem__', '__delitem__', '__ior__',
+))
+
+# Per node class: the bytes hashed first and whether it has a content
+_HASH_PREFIXES = {}
+
+def _hash_bytes(s):
+	return s if isinstance(s, bytes) else s.encode('utf-8')
+
+class ResultForest(object):
+	""" This implements a simple forest (of trees) and is used by 
+	ElementNode.filter as the return type
+	"""
+
+	class ResultNode(object):
+		""" Basic tree implementation. Every node in the tree maintains
+		a pointer (nodePtr) to the original node in the ElementNode tree
+		"""
+
+		def __init__(self, node_ptr = None):
+			self.children = []
+			self.node_ptr = node_ptr
+
+		def append_child(self, nodes):
+			if not isinstance(nodes, list):
+				nodes = [nodes]
+			self.children += nodes
+			
+			for child in nodes:
+				child.parent = self
+
+	def __init__(self):
+		self.trees = []
 
 class ElementNode(object):
 	"""	Base class that all the specific elements (such as sections,
 	code blocks, pictures) extend. It provides simple and general methods to
 	manage the resulting tree.
+
+	Nodes are slotted and only allocate their attrib and extra dicts when
+	they are first accessed. Until then, the depth assigned by the
+	ElementStack is kept in a slot of its own. Nodes without children share
+	a single immutable empty list internally: reading their children returns
+	a new empty list, which becomes their own the first time it is changed.
+	Children is thus always a list that can be changed in place.
+
+	Every node also has a structural hash of its subtree, computed on demand
+	by structural_hash and kept until the subtree changes, through
+	append_child, the children, attrib or content setters, or in place
+	through the children list or the attrib dict. The setters copy the list
+	or dict they are given, so later changes to it are not seen by the node.
 	"""
 
-	def __init__(self, attrib = {}):
-		self.attrib = attrib.copy()
+	__slots__ = ('parent', '_attrib', '_extra', '_children', '_depth', '_hash')
+
+	def __init__(self, attrib = None):
+		self._attrib = dict(attrib) if attrib else None
 		self.parent = None
-		self.extra = {}
-		self.children = []
+		self._extra = None
+		self._children = _NO_CHILDREN
+		self._depth = None
+		self._hash = None
+
+	@property
+	def attrib(self):
+		attrib = self._attrib
+		# Not the dict of self if self is a shallow copy
+		if type(attrib) is not _Attrib or attrib._node is not self:
+			attrib = self._attrib = _Attrib(self, attrib or ())
+			if self._depth is not None:
+				dict.__setitem__(attrib, 'depth', self._depth)
+				self._depth = None
+		return attrib
+
+	@attrib.setter
+	def attrib(self, attrib):
+		self._attrib = _Attrib(self, attrib)
+		self._depth = None
+		self._changed()
+
+	@property
+	def extra(self):
+		if self._extra is None:
+			self._extra = {}
+		return self._extra
+
+	@extra.setter
+	def extra(self, extra):
+		self._extra = extra
+
+	@property
+	def children(self):
+		children = self._children
+		if children is _NO_CHILDREN:
+			return _Children(self)
+		if type(children) is not _Children or children._node is not self:
+			children = self._children = _Children(self, children)
+		return children
+
+	@children.setter
+	def children(self, children):
+		self._children = _Children(self, children)
+		self._children_changed()
+
+	def _children_changed(self):
+		""" Drop the structural hashes of self and of its ancestors and the
+		node-type index of the document, after the children of self have
+		changed other than through append_child.
+		"""
+
+		root = self._changed()
+		if isinstance(root, DocumentNode):
+			# The index cannot follow arbitrary changes
+			root._index = root._positions = None
+
+	def _set_depth(self, depth):
+		""" Set the 'depth' attrib without allocating the attrib dict """
+
+		if self._attrib is None:
+			self._depth = depth
+		else:
+			# The depth is not hashed, there is nothing to drop
+			dict.__setitem__(self._attrib, 'depth', depth)
+
+	def _attrib_items(self):
+		""" Returns the attribs as a dict, without allocating it on self """
+
+		if self._attrib is not None:
+			return self._attrib
+		if self._depth is not None:
+			return {'depth': self._depth}
+		return {}
+
+	def __getstate__(self):
+		state = dict(getattr(self, '__dict__', {}))
+		for cls in type(self).__mro__:
+			for slot in cls.__dict__.get('__slots__', ()):
+				if slot != '__weakref__' and hasattr(self, slot):
+					state[slot] = getattr(self, slot)
+		return state
+
+	def __setstate__(self, state):
+		self._hash = None
+		for (slot, value) in state.items():
+			setattr(self, slot, value)
 
 	def matches_type(self, types):
 		""" Returns true if this node matches any of the types supplied """
@@ -41,33 +271,150 @@ class ElementNode(object):
 		return False		
 
 	def append_child(self, nodes):
-		""" Append one or more nodes to self """
+		""" Append one or more nodes to self. The node-type index of the
+		document self belongs to, if any, is updated.
+		"""
 
 		if not isinstance(nodes, list):
 			nodes = [nodes]
-		self.children += nodes
+
+		root = self
+		while root.parent is not None:
+			root = root.parent
+		rebuild = (
+			isinstance(root, DocumentNode) and root._index is not None and
+			not root._index_insert(self, nodes)
+		)
+
+		self._append_child(nodes)
+		self._changed()
+		if rebuild:
+			root.build_index()
+
+	def _append_child(self, nodes):
+		""" Append one or more nodes to self, without invalidating the index
+		of the document (if any) and the structural hashes. This is what
+		ElementStack uses while parsing, when the index is being built in
+		document order and no hash has been computed yet.
+		"""
+
+		if not isinstance(nodes, list):
+			nodes = [nodes]
+		if self._children is _NO_CHILDREN:
+			self._children = []
+		list.extend(self._children, nodes)
 		
 		for child in nodes:
 			child.parent = self
 
-	def find_any(self, types = []):
-		""" Performs a simple DFS in the subtree whose root is self and returns
-		the first node whose type matches any of the supplied types.
+	def _changed(self):
+		""" Drop the structural hashes of self and of its ancestors, since
+		the subtree has changed. Returns the root of the tree.
 		"""
-		if not isinstance(types, list):
-			types = [types]
 
-		if self.matches_type(types):
-			return self
+		root = self
+		root._hash = None
+		while root.parent is not None:
+			root = root.parent
+			root._hash = None
+		return root
+
+	def structural_hash(self):
+		""" Returns a digest (bytes) of the subtree whose root is self, made
+		from the type, the attribs but depth and the content of every node, and
+		from the structure of the subtree. Equal subtrees have equal hashes,
+		wherever they are and in whichever tree.
+		"""
 
-		if not self.children:
-			return None
+		if self._hash is not None:
+			return self._hash
+
+		stack = [(self, False)]
+		while stack:
+			(node, expanded) = stack.pop()
+			if not expanded:
+				stack.append((node, True))
+				stack.extend(
+					(child, False)
+					for child in node._children
+					if child._hash is None
+				)
+				continue
+
+			cls = type(node)
+			entry = _HASH_PREFIXES.get(cls)
+			if entry is None:
+				entry = _HASH_PREFIXES[cls] = (
+					('%s.%s\0' % (cls.__module__, cls.__name__)).encode('ascii'),
+					hasattr(cls, 'content'),
+				)
+
+			parts = [entry[0]]
+			if node._attrib:
+				attrib = sorted(
+					(key, value)
+					for (key, value) in node._attrib.items()
+					if key != 'depth'
+				)
+				if attrib:
+					parts.append(_hash_bytes(repr(attrib)))
+			parts.append(b'\0')
+			if entry[1] and node.content is not None:
+				content = _hash_bytes(node.content)
+				parts += [str(len(content)).encode('ascii'), b':', content]
+			parts.append(b'\0')
+			parts += [child._hash for child in node._children]
+
+			node._hash = hashlib.sha1(b''.join(parts)).digest()
+
+		return self._hash
+
+	def iter_preorder(self):
+		""" Yields the nodes of the subtree whose root is self, parents
+		before their children
+		"""
+
+		stack = [self]
+		while stack:
+			node = stack.pop()
+			yield node
+			stack.extend(reversed(node._children))
+
+	def iter_postorder(self):
+		""" Yields the nodes of the subtree whose root is self, children
+		before their parents
+		"""
+
+		stack = [(self, 0)]
+		while stack:
+			(node, index) = stack[-1]
+			if index < len(node._children):
+				stack[-1] = (node, index + 1)
+				stack.append((node._children[index], 0))
+			else:
+				stack.pop()
+				yield node
+
+	def find_all(self, types = []):
+		""" Yields, in document order, the nodes of the subtree whose root is
+		self whose type matches any of the supplied types.
+		"""
+		types = tuple(types) if isinstance(types, list) else types
+
+		stack = [self]
+		while stack:
+			node = stack.pop()
+			if isinstance(node, types):
+				yield node
+			stack.extend(reversed(node._children))
 
-		for child in self.children:
-			res = child.find_any(types)
-			if res:
-				return res
+	def find_any(self, types = []):
+		""" Performs a simple DFS in the subtree whose root is self and returns
+		the first node whose type matches any of the supplied types.
+		"""
 
+		for node in self.find_all(types):
+			return node
 		return None
 
 	def filter(self, types = []):
@@ -78,76 +425,158 @@ class ElementNode(object):
 		The nodes of the result (of type ResultNode) contain references to the
 		original nodes.
 		"""
+		types = tuple(types) if isinstance(types, list) else types
 
-		class ResultForest(object):
-			""" This implements a simple forest (of trees) and is used by 
-			ElementNode.filter as the return type
-			"""
-
-			class ResultNode(object):
-				""" Basic tree implementation. Every node in the tree maintains
-				a pointer (nodePtr) to the original node in the ElementNode tree
-				"""
-
-				def __init__(self, node_ptr = None):
-					self.children = []
-					self.node_ptr = node_ptr
-
-				def append_child(self, nodes):
-					if not isinstance(nodes, list):
-						nodes = [nodes]
-					self.children += nodes
-					
-					for child in nodes:
-						child.parent = self
+		res = ResultForest()
 
-			def __init__(self):
-				self.trees = []
+		# Every node comes with the ResultNode of its closest matching
+		# ancestor, if any
+		stack = [(self, None)]
+		while stack:
+			(node, ancestor) = stack.pop()
 
-		if not isinstance(types, list):
-			types = [types]
+			if isinstance(node, types):
+				result_node = ResultForest.ResultNode(node)
+				if ancestor is None:
+					res.trees.append(result_node)
+				else:
+					ancestor.append_child(result_node)
+				ancestor = result_node
 
-		res = ResultForest()
+			stack.extend((child, ancestor) for child in reversed(node._children))
 
-		this_node_matches = self.matches_type(types)
+		return res
 
-		if this_node_matches:
-			res.trees += [ResultForest.ResultNode(self)]
+	def to_string(self, prefix = '', sink = None):
+		""" Returns an ASCII version of the tree or, if a file-like sink is
+		supplied, writes it there line by line
+		"""
 
-		for child in self.children:
-			sub = child.filter(types)
-			if sub.trees:
-				if this_node_matches:
-					res.trees[0].append_child(sub.trees)
+		if sink is None:
+			lines = []
+			self.to_string(prefix, sink = lines)
+			return ''.join(lines)
+
+		write = sink.append if isinstance(sink, list) else sink.write
+
+		stack = [(self, prefix)]
+		while stack:
+			(node, prefix) = stack.pop()
+
+			s = ''
+			if prefix:
+				s += prefix[:-3]
+				s += '  +--%s ' % ('*' if node._children else '-')
+			s += '%s [%s] %s %s\n' % (
+				node.__class__.__name__,
+				hex(id(node)),
+				str(node._attrib_items()),
+				str(node._extra or {}),
+			)
+			write(s)
+
+			children = node._children
+			for index in range(len(children) - 1, -1, -1):
+				if index + 1 == len(children):
+					sub_prefix = prefix + '   '
 				else:
-					res.trees += sub.trees
-
-		return res
+					sub_prefix = prefix + '  |'
+				stack.append((children[index], sub_prefix))
+
+	def pack(self):
+		""" Returns a compact representation of the subtree whose root is
+		self, made only of lists, tuples, dicts, strings and numbers, that is
+		much faster to pickle than the tree itself. Use ElementNode.unpack to
+		rebuild the tree.
+
+		The nodes are listed in preorder, each one as five consecutive items:
+		type index, number of children, attrib (an int when it only holds the
+		depth), extra and content.
+		"""
 
-	def to_string(self, prefix = ''):
-		""" Returns an ASCII version of the tree """
-
-		s = ''
-		if prefix:
-			s += prefix[:-3]
-			s += '  +--%s ' % ('*' if self.children else '-')
-		s += '%s [%s] %s %s' % (
-			self.__class__.__name__,
-			hex(id(self)),
-			str(self.attrib),
-			str(self.extra),
-		)
-		s += '\n'
+		types = []
+		type_ids = {}
+		flat = []
+
+		stack = [self]
+		while stack:
+			node = stack.pop()
+
+			cls = type(node)
+			if cls not in type_ids:
+				type_ids[cls] = len(types)
+				types.append((cls.__module__, cls.__name__))
+
+			flat += [
+				type_ids[cls],
+				len(node._children),
+				node._depth if node._attrib is None else node._attrib,
+				node._extra or None,
+				getattr(node, 'content', None),
+			]
+			stack.extend(reversed(node._children))
+
+		return (types, flat)
+
+	@staticmethod
+	def unpack(packed):
+		""" Rebuilds a tree from the output of ElementNode.pack and returns
+		its root. The attrib and extra dicts of the nodes are copies, so the
+		packed tree can be unpacked again after the tree is changed.
+		"""
 
-		for (index, child) in enumerate(self.children):
-			if index + 1 == len(self.children):
-				sub_prefix = prefix + '   '
+		(types, flat) = packed
+		classes = [
+			getattr(__import__(module, fromlist = [name]), name)
+			for (module, name) in types
+		]
+		has_content = [hasattr(cls, 'content') for cls in classes]
+		# The slots added by subclasses, which are all optional
+		own_slots = [
+			[
+				slot
+				for base in cls.__mro__[:cls.__mro__.index(ElementNode)]
+				for slot in base.__dict__.get('__slots__', ())
+			]
+			for cls in classes
+		]
+
+		root = None
+		stack = []
+		for index in range(0, len(flat), 5):
+			(type_id, children, attrib, extra, content) = flat[index : index+5]
+
+			cls = classes[type_id]
+			node = cls.__new__(cls)
+			if isinstance(attrib, dict):
+				node._attrib = dict(attrib)
+				node._depth = None
+			else:
+				node._attrib = None
+				node._depth = attrib
+			node._extra = dict(extra) if extra else None
+			node._children = [] if children else _NO_CHILDREN
+			node._hash = None
+			for slot in own_slots[type_id]:
+				setattr(node, slot, None)
+			if has_content[type_id]:
+				node._content = content
+
+			if stack:
+				parent = stack[-1]
+				node.parent = parent[0]
+				parent[0]._children.append(node)
+				parent[1] -= 1
+				if not parent[1]:
+					stack.pop()
 			else:
-				sub_prefix = prefix + '  |'
+				node.parent = None
+				root = node
 
-			s += child.to_string(prefix = sub_prefix)
+			if children:
+				stack.append([node, children])
 
-		return s
+		return root
 
 class DocumentNode(ElementNode):
 	"""This node is the root of the parsed page. There shall be only one such
@@ -158,17 +587,223 @@ class DocumentNode(ElementNode):
 	#marksc:setraw key value
 	syntax at the beginning of the file, i.e. before the beginning of any
 	section.
+
+	Documents parsed by Parser.parse_editable also keep their source, and
+	the table of its top-level sections used by Parser.reparse.
+
+	A document can also have an index of its nodes by type, either built
+	while parsing (see Parser.parse_document) or by build_index. While the
+	index is there, find_all, find_any and filter on the document only cost
+	as much as the number of matching nodes. append_child keeps the index
+	up to date, setting children drops it, and changes made to the children
+	lists in place are not noticed: call build_index again after them.
+
+	The index holds, for every node type, the list of the nodes of that
+	type and an array of their positions in document order. Nodes appended
+	later get positions between those of their neighbours.
 	"""
 
-	def __init__(self, attrib={}):
+	__slots__ = ('source', '_chunks', '_index', '_positions')
+
+	def __init__(self, attrib = None):
 		ElementNode.__init__(self, attrib)
+		self.source = None
+		self._chunks = None
+		self._index = None
+		self._positions = None
+
+	def build_index(self):
+		""" Build the node-type index of the document """
+
+		index = {}
+		for (position, node) in enumerate(self.iter_preorder()):
+			entry = index.get(type(node))
+			if entry is None:
+				entry = index[type(node)] = ([], array.array('d'))
+			entry[0].append(node)
+			entry[1].append(position)
+		self._index = index
+		self._positions = None
+
+	def _index_insert(self, parent, nodes):
+		""" Add to the index the subtrees of nodes, about to be appended to
+		parent. Returns False if the index must be built again instead.
+		"""
+
+		# The positions of the nodes by id, only made on the first update
+		positions = self._positions
+		if positions is None:
+			positions = self._positions = {}
+			for (indexed, indexed_positions) in self._index.values():
+				for (node, position) in zip(indexed, indexed_positions):
+					positions[id(node)] = position
+
+		new = [node for subtree in nodes for node in subtree.iter_preorder()]
+		if any(id(node) in positions for node in new):
+			# Nodes moved within the document
+			return False
+
+		# The new nodes go after the last node of the subtree of parent...
+		last = parent
+		while last._children:
+			last = last._children[-1]
+		low = positions.get(id(last))
+		if low is None:
+			return False
+
+		# ...and before the node that follows it in document order
+		high = None
+		node = parent
+		while high is None and node.parent is not None:
+			siblings = node.parent._children
+			index = siblings.index(node) + 1
+			if index < len(siblings):
+				high = positions.get(id(siblings[index]))
+				if high is None:
+					return False
+			node = node.parent
+		if high is None:
+			high = low + len(new) + 1
+
+		step = (high - low) / (len(new) + 1)
+		if not low < low + step < low + step * len(new) < high:
+			# Out of room between the positions
+			return False
+
+		for (offset, node) in enumerate(new):
+			position = low + step * (offset + 1)
+			positions[id(node)] = position
+			entry = self._index.get(type(node))
+			if entry is None:
+				entry = self._index[type(node)] = ([], array.array('d'))
+			index = bisect.bisect_right(entry[1], position)
+			entry[0].insert(index, node)
+			entry[1].insert(index, position)
+		return True
+
+	def find_all(self, types = []):
+		if self._index is None:
+			return ElementNode.find_all(self, types)
+
+		types = tuple(types) if isinstance(types, list) else types
+		entries = [
+			entry
+			for (cls, entry) in self._index.items()
+			if issubclass(cls, types)
+		]
+
+		if not entries:
+			return iter(())
+		if len(entries) == 1:
+			return iter(entries[0][0])
+		# Merge the lists of the different types by position
+		return (
+			node
+			for (_, node) in heapq.merge(*[
+				zip(positions, nodes) for (nodes, positions) in entries
+			])
+		)
+	find_all.__doc__ = ElementNode.find_all.__doc__
+
+	def filter(self, types = []):
+		if self._index is None:
+			return ElementNode.filter(self, types)
+
+		res = ResultForest()
+
+		# Attach every match to the ResultNode of its closest matching
+		# ancestor
+		result_nodes = {}
+		for node in self.find_all(types):
+			result_node = ResultForest.ResultNode(node)
+			result_nodes[id(node)] = result_node
+
+			ancestor = node.parent
+			while ancestor is not None and id(ancestor) not in result_nodes:
+				ancestor = ancestor.parent
+			if ancestor is None:
+				res.trees.append(result_node)
+			else:
+				result_nodes[id(ancestor)].append_child(result_node)
+
+		return res
+	filter.__doc__ = ElementNode.filter.__doc__
 
 class SectionNode(ElementNode):
-	"""This node represents a section in the document."""
+	"""This node represents a section in the document.
+
+	In the documents returned by Parser.skim, the body of a section (what
+	comes between its title and its first subsection) is only parsed the
+	first time its children are accessed, in any way. Until then, title,
+	subsections and loaded can be used to walk the outline of the document
+	without parsing it. The title is then parsed from its line alone: if it
+	continues on the following lines, its children are replaced when the
+	body is parsed. A body that cannot be parsed on its own is taken from a
+	parse of the whole document, which may also change the outline (see
+	Parser.skim).
+	"""
 
-	def __init__(self, attrib={}):
+	__slots__ = ('_pending',)
+
+	def __init__(self, attrib = None):
 		ElementNode.__init__(self, attrib)
 
+	@property
+	def _children(self):
+		if self._pending is not None:
+			(pending, self._pending) = (self._pending, None)
+			outline = _CHILDREN_SLOT.__get__(self)
+			try:
+				body = pending(self)
+			except Exception:
+				self._pending = pending
+				raise
+			# None if pending has set the children itself
+			if body is not None:
+				for node in body:
+					node.parent = self
+				_CHILDREN_SLOT.__set__(self, body + outline[1:])
+		return _CHILDREN_SLOT.__get__(self)
+
+	@_children.setter
+	def _children(self, children):
+		self._pending = None
+		_CHILDREN_SLOT.__set__(self, children)
+
+	@property
+	def title(self):
+		""" The SectionTitleNode of the section, or None """
+
+		children = _CHILDREN_SLOT.__get__(self)
+		if children and isinstance(children[0], SectionTitleNode):
+			return children[0]
+		return None
+
+	@property
+	def subsections(self):
+		""" The list of the SectionNodes among the children """
+
+		return [
+			child
+			for child in _CHILDREN_SLOT.__get__(self)
+			if isinstance(child, SectionNode)
+		]
+
+	@property
+	def loaded(self):
+		""" False until the body of a skimmed section is parsed """
+
+		return self._pending is None
+
+	def __getstate__(self):
+		# The pending body is parsed rather than pickled with the source
+		self._children
+		return ElementNode.__getstate__(self)
+
+# The storage of the children in the slot of ElementNode, which SectionNode
+# wraps in a property
+_CHILDREN_SLOT = ElementNode.__dict__['_children']
+
 class BlockNode(ElementNode):
 	"""Blocks are groups of one ore more paragraphs, pictures, code snippets,
 	alerts, lists and so forth. If no block break is used, the sectionNode will
@@ -178,7 +813,9 @@ class BlockNode(ElementNode):
 	line.
 	"""
 
-	def __init__(self, attrib={}):
+	__slots__ = ()
+
+	def __init__(self, attrib = None):
 		ElementNode.__init__(self, attrib)
 
 class ParagraphNode(ElementNode):
@@ -189,7 +826,9 @@ class ParagraphNode(ElementNode):
 	is not added to the content of the paragraph. 
 	"""
 
-	def __init__(self, attrib={}):
+	__slots__ = ()
+
+	def __init__(self, attrib = None):
 		ElementNode.__init__(self, attrib)
 
 class CodeNode(ElementNode):
@@ -197,7 +836,9 @@ class CodeNode(ElementNode):
 	child, whose content will be the actual code
 	"""
 
-	def __init__(self, attrib={}):
+	__slots__ = ()
+
+	def __init__(self, attrib = None):
 		ElementNode.__init__(self, attrib)
 
 class RawHTMLNode(ElementNode):
@@ -205,19 +846,82 @@ class RawHTMLNode(ElementNode):
 	MarkPy cannot produce the desired html code (such as a custom script or div)
 	"""
 
-	def __init__(self, string, attrib={}):
-		self.content = string
+	__slots__ = ('_content',)
+
+	def __init__(self, string, attrib = None):
+		self._content = string
 		ElementNode.__init__(self, attrib)
+
+	@property
+	def content(self):
+		return self._content
+
+	@content.setter
+	def content(self, string):
+		self._content = string
+		self._changed()
 		
 class StringNode(ElementNode):
 	""" This node represents standard strings, and as such it is usually a leaf
 	in the tree.
+
+	A StringNode may also record where it comes from: source is the text
+	it was parsed from and source[start:end] the span it covers. If no
+	string is supplied, the content is sliced from the source whenever it
+	is accessed, so that no copy of the text is kept by the node.
 	"""
 
-	def __init__(self, string, attrib={}):
-		self.content = string
+	__slots__ = ('_content', 'source', 'start', 'end')
+
+	def __init__(self, string, attrib = None, source = None, start = None,
+		end = None):
+		self._content = string
+		self.source = source
+		self.start = start
+		self.end = end
 		ElementNode.__init__(self, attrib)
 
+	@property
+	def content(self):
+		content = self._content
+		if content is None and self.source is not None:
+			return self.source[self.start : self.end]
+		if type(content) is list:
+			content = self._content = ''.join(content)
+		return content
+
+	@content.setter
+	def content(self, string):
+		self._content = string
+		self._changed()
+
+	def _append(self, string):
+		""" Append string to the content. The pieces are only joined when
+		the content is read, so that appending many of them takes linear time.
+		"""
+
+		content = self.content if self._content is None else self._content
+		if type(content) is list:
+			content.append(string)
+		else:
+			self._content = [content, string]
+		self._changed()
+
+	def position(self):
+		""" Returns the (line, column) where the node starts in its source,
+		both starting from 1, or None if the source is not known (or not a
+		string)
+		"""
+
+		if not isinstance(self.source, (bytes, type(u''))):
+			return None
+
+		line_start = self.source.rfind('\n', 0, self.start) + 1
+		return (
+			self.source.count('\n', 0, self.start) + 1,
+			self.start - line_start + 1,
+		)
+
 class AlertNode(ElementNode):
 	""" This node represent an alert box.
 
@@ -225,47 +929,78 @@ class AlertNode(ElementNode):
 	- level: the level of the warning. This corresponds to the number of ! used.
 	"""
 
-	def __init__(self, level, attrib={}):
-		attrib.update({'level': level})
+	__slots__ = ()
+
+	def __init__(self, level, attrib = None):
+		attrib = dict(attrib or {}, level = level)
 		ElementNode.__init__(self, attrib)
 		
 class ListContainerNode(ElementNode):
-	def __init__(self, attrib={}):
+	__slots__ = ()
+
+	def __init__(self, attrib = None):
 		ElementNode.__init__(self, attrib)
 		
 class ListItemNode(ElementNode):
-	def __init__(self, attrib={}):
+	__slots__ = ()
+
+	def __init__(self, attrib = None):
 		ElementNode.__init__(self, attrib)
 		
 class BoxedNode(ElementNode):
-	def __init__(self, attrib={}):
+	__slots__ = ()
+
+	def __init__(self, attrib = None):
 		ElementNode.__init__(self, attrib)
 
 class ImageNode(ElementNode):
-	def __init__(self, path, attrib={}):
-		attrib.update({'path': path})
+	__slots__ = ()
+
+	def __init__(self, path, attrib = None):
+		attrib = dict(attrib or {}, path = path)
 		ElementNode.__init__(self, attrib)
 
 class TypewriterSpanNode(ElementNode):
-	def __init__(self, attrib={}):
+	__slots__ = ()
+
+	def __init__(self, attrib = None):
 		ElementNode.__init__(self, attrib)
 
 class FormulaSpanNode(ElementNode):
-	def __init__(self, attrib={}):
+	__slots__ = ()
+
+	def __init__(self, attrib = None):
 		ElementNode.__init__(self, attrib)
 
 class SectionTitleNode(ElementNode):
-	def __init__(self, attrib={}):
+	__slots__ = ()
+
+	def __init__(self, attrib = None):
 		ElementNode.__init__(self, attrib)
 		
 class FormulaNode(ElementNode):
-	def __init__(self, attrib={}):
+	""" This node represents a display formula.
+
+	Default attribs:
+	- delimiter: the delimiter opening the formula, $$ or \\[. The content of
+	  $$ formulas starts with the second $.
+	"""
+
+	__slots__ = ()
+
+	def __init__(self, attrib = None, delimiter = None):
+		if delimiter is not None:
+			attrib = dict(attrib or {}, delimiter = delimiter)
 		ElementNode.__init__(self, attrib)
 		
 class BoldfaceSpanNode(ElementNode):
-	def __init__(self, attrib={}):
+	__slots__ = ()
+
+	def __init__(self, attrib = None):
 		ElementNode.__init__(self, attrib)
 		
 class ItalicSpanNode(ElementNode):
-	def __init__(self, attrib={}):
+	__slots__ = ()
+
+	def __init__(self, attrib = None):
 		ElementNode.__init__(self, attrib)
\ No newline at end of file
@@ -16,6 +16,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import array
+
+from .elementnode import StringNode
 
 class ElementStack(object):
 	""" This provides a stack designed to serve as a bridge between the raw
@@ -23,15 +26,46 @@ class ElementStack(object):
 	pops the ElementNodes corresponding to the the different parts of the
 	document, ElementStack builds of the resulting tree, adding parents/
 	child relationships and keeping track of the depth of each node.
+
+	The stack also keeps, for every class, the number of open nodes that are
+	instances of it, so that count() and the checks done by pop() do not need
+	to walk the stack.
+
+	If an events list is supplied, ("start", node) is appended to it on every
+	push and ("end", node) on every pop, preceded by ("text", content) for
+	StringNodes. If discard is True, popped nodes are not appended to their
+	parent's children (but their parent attribute is still set).
+
+	If an index dict is supplied, it is filled, as nodes are pushed (that is,
+	in document order), in the format of DocumentNode.build_index.
 	"""
 
-	def __init__(self):
+	def __init__(self, events = None, discard = False, index = None):
 		self._stack = []
+		self._open = {}
+		self._events = events
+		self._discard = discard
+		self._index = index
+		self._pushed = 0
 	
 	def push(self, obj):
-		obj.attrib['depth'] = len(self._stack)
+		obj._set_depth(len(self._stack))
 		self._stack.append(obj)
 
+		if self._index is not None:
+			entry = self._index.get(type(obj))
+			if entry is None:
+				entry = self._index[type(obj)] = ([], array.array('d'))
+			entry[0].append(obj)
+			entry[1].append(self._pushed)
+			self._pushed += 1
+
+		if self._events is not None:
+			self._events.append(('start', obj))
+
+		for cls in type(obj).__mro__:
+			self._open[cls] = self._open.get(cls, 0) + 1
+
 	def top(self):
 		assert len(self._stack) > 0
 		return self._stack[-1]
@@ -42,13 +76,14 @@ class ElementStack(object):
 		"""
 
 		if not isinstance(types, list):
-			types = [types]
+			return self._open.get(types, 0)
 
 		count = 0
-		for obj in self._stack:
-			if obj.matches_type(types):
-				count += 1
-				break
+		for type in types:
+			# Nodes of a subclass are already counted with their base class
+			if any(issubclass(type, other) for other in types if other is not type):
+				continue
+			count += self._open.get(type, 0)
 		
 		return count
 		
@@ -60,13 +95,62 @@ class ElementStack(object):
 			assert len(self._stack) > 0
 			
 			if len(self._stack) > 1:
-				self._stack[-2].append_child(self._stack[-1])
-			self._stack.pop()
+				if self._discard:
+					self._stack[-1].parent = self._stack[-2]
+				else:
+					self._stack[-2]._append_child(self._stack[-1])
+			obj = self._stack.pop()
+
+			for cls in type(obj).__mro__:
+				self._open[cls] -= 1
+
+			if self._events is not None:
+				if isinstance(obj, StringNode):
+					self._events.append(('text', obj.content))
+				self._events.append(('end', obj))
 			
 		else:
 			if not self.count(until):
 				# Skip pop request
 				return
 			
-			while not self.top().matches_type(until):
+			until = tuple(until)
+			while not isinstance(self._stack[-1], until):
 				self.pop()
+
+class CountingElementStack(ElementStack):
+	""" An ElementStack that also counts the calls to push, pop and count,
+	and records the maximum depth reached. Parser.parse_document uses it
+	when it collects ParseStats. Only the calls made from outside are
+	counted, not the ones pop makes internally.
+	"""
+
+	def __init__(self, events = None, discard = False, index = None):
+		ElementStack.__init__(self, events, discard, index)
+		self.pushes = 0
+		self.pops = 0
+		self.counts = 0
+		self.max_depth = 0
+		self._inside = False
+
+	def push(self, obj):
+		self.pushes += 1
+		ElementStack.push(self, obj)
+		if len(self._stack) > self.max_depth:
+			self.max_depth = len(self._stack)
+
+	def count(self, types):
+		if not self._inside:
+			self.counts += 1
+		return ElementStack.count(self, types)
+
+	def pop(self, until = []):
+		if self._inside:
+			return ElementStack.pop(self, until)
+
+		self.pops += 1
+		self._inside = True
+		try:
+			return ElementStack.pop(self, until)
+		finally:
+			self._inside = False
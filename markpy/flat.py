@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MarkPy - github.com/obag/MarkPy
+# Copyright © 2014 Gabriele Farina <gabr.farina@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" A flat, struct-of-arrays representation of parsed trees, for jobs over
+many or large documents where an object per node is too expensive.
+"""
+
+import array
+import re
+
+from .elementnode import ElementNode
+
+
+class FlatTree(object):
+	""" A tree stored as parallel arrays, one item per node, with the nodes
+	numbered in document order (preorder) from 0, the root:
+
+	- types: index of the class of the node in classes;
+	- parents, first_children, next_siblings: indices of the related nodes,
+	  or -1;
+	- depths: the depth attrib, or -1;
+	- sizes: number of nodes in the subtree, so that the descendants of i
+	  are the nodes from i + 1 to i + sizes[i] (excluded);
+	- starts, ends: the content of the node is text[starts[i]:ends[i]], or
+	  None if starts[i] is -1.
+
+	The other attribs and the extra dicts, which few nodes have, are kept in
+	the attribs and extras dicts, by node index. The arrays support the
+	buffer protocol, so they can be wrapped by numpy.frombuffer without
+	copies.
+
+	Use Parser.parse_flat, FlatTree.from_events or FlatTree.from_tree to
+	build one, and to_tree to get back the ElementNodes.
+	"""
+
+	def __init__(self):
+		self.classes = []
+		self.types = array.array('B')
+		self.parents = array.array('l')
+		self.first_children = array.array('l')
+		self.next_siblings = array.array('l')
+		self.depths = array.array('l')
+		self.sizes = array.array('l')
+		self.starts = array.array('l')
+		self.ends = array.array('l')
+		self.text = ''
+		self.attribs = {}
+		self.extras = {}
+
+	def __len__(self):
+		return len(self.types)
+
+	@staticmethod
+	def from_events(events):
+		""" Build a FlatTree from ("start", node) and ("end", node) events,
+		as yielded by Parser.iterparse; the "text" events are ignored. With
+		Parser.iterparse(s, discard = True), only the open nodes are kept in
+		memory while the tree is built.
+		"""
+
+		tree = FlatTree()
+		codes = {}
+		text = []
+		offset = 0
+
+		types = tree.types
+		parents = tree.parents
+		first_children = tree.first_children
+		next_siblings = tree.next_siblings
+		sizes = tree.sizes
+		starts = tree.starts
+		ends = tree.ends
+
+		# The open nodes, and the last child of each of them
+		stack = []
+		last_children = []
+		for (event, node) in events:
+			if event == 'start':
+				index = len(types)
+
+				cls = type(node)
+				code = codes.get(cls)
+				if code is None:
+					if len(tree.classes) == 256:
+						raise ValueError('too many node types for a FlatTree')
+					code = codes[cls] = len(tree.classes)
+					tree.classes.append(cls)
+				types.append(code)
+
+				attrib = node._attrib
+				if attrib:
+					tree.depths.append(attrib.get('depth', -1))
+					if len(attrib) > ('depth' in attrib):
+						attrib = dict(attrib)
+						attrib.pop('depth', None)
+						tree.attribs[index] = attrib
+				else:
+					tree.depths.append(-1 if node._depth is None else node._depth)
+				if node._extra:
+					tree.extras[index] = dict(node._extra)
+
+				if stack:
+					parent = stack[-1]
+					if last_children[-1] < 0:
+						first_children[parent] = index
+					else:
+						next_siblings[last_children[-1]] = index
+					last_children[-1] = index
+				else:
+					parent = -1
+				parents.append(parent)
+				first_children.append(-1)
+				next_siblings.append(-1)
+				sizes.append(0)
+				starts.append(-1)
+				ends.append(-1)
+
+				stack.append(index)
+				last_children.append(-1)
+
+			elif event == 'end':
+				index = stack.pop()
+				last_children.pop()
+				sizes[index] = len(types) - index
+
+				content = getattr(node, 'content', None)
+				if content is not None:
+					starts[index] = offset
+					text.append(content)
+					offset += len(content)
+					ends[index] = offset
+
+		tree.text = ''.join(text)
+		return tree
+
+	@staticmethod
+	def from_tree(root):
+		""" Build a FlatTree from the tree whose root is root """
+
+		return FlatTree.from_events(_tree_events(root))
+
+	def to_tree(self):
+		""" Returns the root of a tree of ElementNodes equal to self """
+
+		types = [(cls.__module__, cls.__name__) for cls in self.classes]
+		flat = []
+		for index in range(len(self.types)):
+			attrib = self.attribs.get(index)
+			depth = self.depths[index]
+			if attrib is not None:
+				attrib = dict(attrib)
+				if depth >= 0:
+					attrib['depth'] = depth
+			elif depth >= 0:
+				attrib = depth
+			extra = self.extras.get(index)
+
+			flat += [
+				self.types[index],
+				self._child_count(index),
+				attrib,
+				dict(extra) if extra else None,
+				self.content(index),
+			]
+		return ElementNode.unpack((types, flat))
+
+	def _child_count(self, index):
+		count = 0
+		child = self.first_children[index]
+		while child >= 0:
+			count += 1
+			child = self.next_siblings[child]
+		return count
+
+	def node_type(self, index):
+		""" Returns the class of the node index """
+
+		return self.classes[self.types[index]]
+
+	def content(self, index):
+		""" Returns the content of the node index, or None """
+
+		start = self.starts[index]
+		if start < 0:
+			return None
+		return self.text[start : self.ends[index]]
+
+	def children(self, index):
+		""" Yields the indices of the children of the node index """
+
+		child = self.first_children[index]
+		while child >= 0:
+			yield child
+			child = self.next_siblings[child]
+
+	def descendants(self, index):
+		""" Returns the range of the indices of the descendants of the node
+		index
+		"""
+
+		return range(index + 1, index + self.sizes[index])
+
+	def count(self):
+		""" Returns a dict with the number of nodes of every class """
+
+		data = _array_bytes(self.types)
+		return dict(
+			(cls, data.count(_code_bytes([code])))
+			for (code, cls) in enumerate(self.classes)
+		)
+
+	def find_all(self, types, within = None):
+		""" Returns an array with the indices, in document order, of the nodes
+		whose type matches any of the supplied types. If within is given, only
+		its descendants are considered.
+		"""
+
+		types = tuple(types) if isinstance(types, list) else types
+		codes = [
+			code
+			for (code, cls) in enumerate(self.classes)
+			if issubclass(cls, types)
+		]
+
+		(start, end) = (0, len(self.types))
+		if within is not None:
+			(start, end) = (within + 1, within + self.sizes[within])
+
+		found = array.array('l')
+		if not codes:
+			return found
+
+		data = _array_bytes(self.types)
+		if len(codes) == 1:
+			code = _code_bytes(codes)
+			position = data.find(code, start, end)
+			while position >= 0:
+				found.append(position)
+				position = data.find(code, position + 1, end)
+		else:
+			pattern = re.compile(b'[' + re.escape(_code_bytes(codes)) + b']')
+			found.extend(match.start() for match in pattern.finditer(data, start, end))
+		return found
+
+def _array_bytes(column):
+	return column.tobytes() if hasattr(column, 'tobytes') else column.tostring()
+
+def _code_bytes(codes):
+	return _array_bytes(array.array('B', codes))
+
+def _tree_events(root):
+	""" Yields the ("start", node) and ("end", node) events of the tree whose
+	root is root
+	"""
+
+	stack = [(root, False)]
+	while stack:
+		(node, done) = stack.pop()
+		if done:
+			yield ('end', node)
+			continue
+
+		yield ('start', node)
+		stack.append((node, True))
+		stack.extend((child, False) for child in reversed(node._children))
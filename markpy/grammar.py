@@ -0,0 +1,585 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MarkPy - github.com/obag/MarkPy
+# Copyright © 2014 Gabriele Farina <gabr.farina@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" The grammar of MarkPy, as tables of handlers keyed by the character that
+starts a construct: NEW_LINE_HANDLERS at the beginning of a line and
+INLINE_HANDLERS elsewhere. The parser looks up every character (or backslash
+pair) in the table of its state, and falls back to paragraphs and text
+respectively.
+
+A handler is a function (context, chid, ch), where context is the
+ParseContext of the parse, chid the position of ch in context.s and ch the
+character (or backslash pair) found there. It pushes and pops nodes on
+context.stack and returns the position to continue from and whether it is
+at the beginning of a line, or the result of context.need_data if the
+construct goes past the end of the text. Handlers are named after the
+construct they handle, as reported in ParseStats.
+
+register_handler, register_block and register_span (also available on
+Parser) add custom constructs to the tables, for all the parses started
+afterwards. The registrations made inside a "with extensions():" block (or
+Parser.extensions) are undone at its end. Registrations are not seen by
+other processes: Parser.parse_many and Parser.parse_parallel parse in the
+calling process when the tables are not the default ones (see is_default),
+and ParseCache keys include the fingerprint of the tables.
+"""
+
+import contextlib
+import re
+
+from .elementnode import *
+
+
+# Escape sequences that are replaced by the escaped character. Any other
+# backslash pair is kept verbatim.
+_ESCAPES = {
+	"\\$": "$",
+	"\\%": "%",
+	"\\+": "+",
+	"\\*": "*",
+	"\\!": "!",
+	"\\/": "/",
+	"\\\\": "\\",
+}
+
+_ESCAPE_PAIR = re.compile(r'\\.', re.DOTALL)
+
+def _unescape(text):
+	""" Resolve all the escape sequences in a run of text """
+
+	if '\\' not in text:
+		return text
+	return _ESCAPE_PAIR.sub(lambda m: _ESCAPES.get(m.group(0), m.group(0)), text)
+
+class ParseContext(object):
+	""" The state of a parse shared with the handlers: the text s, the
+	ElementStack stack, and whether the parse is partial (see Parser._parse)
+	or lazy (see Parser.parse_document).
+	"""
+
+	def __init__(self, s, stack, partial = False, lazy = False):
+		self.s = s
+		self.stack = stack
+		self.partial = partial
+		self.lazy = lazy
+		self.end_tag = None
+
+	def string(self, start, end, content = None):
+		""" Returns a StringNode for s[start:end], or for content if its
+		text differs from the source
+		"""
+
+		if not self.lazy:
+			return StringNode(string = self.s[start:end] if content is None else content)
+		return StringNode(string = content, source = self.s, start = start, end = end)
+
+	def need_data(self, error, end_tag = None):
+		""" What a handler returns when its construct goes past the end of s:
+		in partial mode, the parser then waits for more text and tries again,
+		otherwise error is raised. If the construct ends with end_tag, which
+		was not found in s, the parser only tries again once end_tag comes.
+		"""
+
+		if not self.partial:
+			raise error
+		self.end_tag = end_tag
+		return None
+
+########################################################################
+# Line-start constructs                                                #
+########################################################################
+
+def comments(context, chid, ch):
+	# Skip the line
+	return (context.s.index('\n', chid) + 1, True)
+
+def images(context, chid, ch):
+	s = context.s
+	end_of_tag = s.find('^', chid+1)
+	if end_of_tag < 0:
+		return context.need_data(ValueError('substring not found'), '^')
+	path = s[chid+1 : end_of_tag]
+
+	# Images are block-level elements
+	context.stack.pop(until = BlockNode)
+
+	context.stack.push(
+		ImageNode(path = path)
+	)
+	context.stack.push(
+		ParagraphNode()
+	)
+
+	return (end_of_tag + 1, False)
+
+def alerts(context, chid, ch):
+	s = context.s
+
+	# Alerts are block-level elements
+	context.stack.pop(until = BlockNode)
+
+	alert_level = 0
+	while s[chid] == '!':
+		alert_level += 1
+		chid += 1
+
+	context.stack.push(
+		AlertNode(level = alert_level)
+	)
+	context.stack.push(
+		ParagraphNode()
+	)
+
+	return (chid, False)
+
+def sections(context, chid, ch):
+	s = context.s
+	stack = context.stack
+
+	title_depth = 0
+	while s[chid] == '=':
+		title_depth += 1
+		chid += 1
+
+	stack.pop(until = SectionNode)
+	while stack.top().attrib['depth'] >= title_depth:
+		stack.pop()
+		stack.pop(until = SectionNode)
+	if title_depth - stack.top().attrib['depth'] > 1:
+		raise ValueError('section nested more than one level deeper than its parent')
+
+	stack.push(
+		SectionNode()
+	)
+	stack.push(
+		SectionTitleNode()
+	)
+	stack.push(
+		ParagraphNode()
+	)
+
+	return (chid, False)
+
+def blank_lines(context, chid, ch):
+	s = context.s
+	stack = context.stack
+
+	while chid < len(s) and s[chid] == '\n':
+		chid += 1
+	if chid == len(s):
+		return context.need_data(IndexError('string index out of range'))
+
+	if not stack.count(types = BlockNode):
+		if not isinstance(stack.top(), DocumentNode):
+			stack.pop(until = SectionNode)
+			stack.push(
+				BlockNode()
+			)
+	else:
+		stack.pop(until = BlockNode)
+
+	return (chid, True)
+
+def lists(context, chid, ch):
+	s = context.s
+	stack = context.stack
+
+	# Paragraph continuation
+	if s[chid+1] == '>':
+		return (chid + 2, False)
+
+	if s[chid+1] != ' ':
+		return paragraphs(context, chid, ch)
+
+	if not stack.count(types = ListContainerNode):
+		stack.pop(until = [BoxedNode, BlockNode])
+		stack.push(
+			ListContainerNode()
+		)
+	else:
+		stack.pop(until = ListItemNode)
+		stack.pop()
+
+	stack.push(
+		ListItemNode()
+	)
+	stack.push(
+		ParagraphNode()
+	)
+
+	return (chid + 1, False)
+
+def formulas(context, chid, ch):
+	s = context.s
+	stack = context.stack
+
+	if ch == '$' and s[chid+1] != '$':
+		return paragraphs(context, chid, ch)
+
+	if not stack.count(FormulaNode):
+		end_tag = '$$' if ch == '$' else '\\]'
+		end_of_formula = s.find(end_tag, chid+1)
+		if end_of_formula < 0:
+			return context.need_data(ValueError('substring not found'), end_tag)
+		stack.pop(until = BlockNode)
+
+		stack.push(
+			FormulaNode(delimiter = '$$' if ch == '$' else ch)
+		)
+		stack.push(
+			context.string(chid+1, end_of_formula)
+		)
+		stack.pop()
+		stack.pop()
+
+		chid = end_of_formula+len(end_tag)
+	else:
+		stack.pop(until = BlockNode)
+
+	return (chid, False)
+
+def code(context, chid, ch):
+	s = context.s
+	stack = context.stack
+
+	if s[chid : chid+3] != '~~~':
+		raise ValueError('code blocks start with ~~~')
+
+	end_of_code = s.find('~~~\n', chid+1)
+	if end_of_code < 0:
+		return context.need_data(ValueError('substring not found'), '~~~\n')
+
+	stack.pop(until = BlockNode)
+
+	stack.push(
+		CodeNode()
+	)
+	stack.push(
+		context.string(chid+3, end_of_code)
+	)
+	stack.pop()
+	stack.pop()
+
+	return (end_of_code + 4, False)
+
+def block_ends(context, chid, ch):
+	stack = context.stack
+
+	# Pop last block
+	if not stack.count(types = BlockNode):
+		raise ValueError('block end outside of a block')
+
+	stack.pop(until = BlockNode)
+	stack.pop()
+
+	stack.push(
+		BlockNode()
+	)
+
+	if context.s[chid+1] != '\n':
+		raise ValueError('block ends take a whole line')
+	return (chid + 2, True)
+
+def paragraphs(context, chid, ch):
+	""" Any other character at the beginning of a line: the text is then
+	parsed inline, from the same position
+	"""
+
+	stack = context.stack
+
+	# After multiple \n
+	if not stack.count(types = ParagraphNode):
+		return (chid, False)
+	# There is a title
+	elif stack.count(types = SectionTitleNode):
+		stack.pop(until = SectionNode)
+		stack.push(
+			BlockNode()
+		)
+		return (chid, False)
+	else:
+		raise NotImplementedError
+
+########################################################################
+# Inline constructs                                                    #
+########################################################################
+
+# The nodes that inline formulas close up to: paragraphs and spans (kept
+# up to date with INLINE_HANDLERS by _inline_changed)
+_SPAN_CONTAINERS = [
+	ParagraphNode,
+	BoldfaceSpanNode,
+	ItalicSpanNode,
+	TypewriterSpanNode
+]
+
+def formula_spans(context, chid, ch):
+	s = context.s
+	stack = context.stack
+
+	if not stack.count(FormulaSpanNode):
+		end_tag = '$' if ch == '$' else '\\)'
+		end_of_formula = s.find(end_tag, chid+1)
+		if end_of_formula < 0:
+			return context.need_data(ValueError('substring not found'), end_tag)
+		stack.pop(
+			until = _SPAN_CONTAINERS
+		)
+
+		stack.push(
+			FormulaSpanNode()
+		)
+		stack.push(
+			context.string(chid+1, end_of_formula)
+		)
+		stack.pop()
+		stack.pop()
+
+		chid = end_of_formula+len(end_tag)
+
+	else:
+		stack.pop(
+			until = _SPAN_CONTAINERS
+		)
+
+	return (chid, False)
+
+def span_handler(node_class):
+	""" Returns the handler of a span of node_class: the character opens the
+	span, or closes it if it is open
+	"""
+
+	def spans(context, chid, ch):
+		stack = context.stack
+		if not stack.count(node_class):
+			stack.pop(until = ParagraphNode)
+
+			stack.push(
+				node_class()
+			)
+		else:
+			stack.pop(until = ParagraphNode)
+
+		return (chid + 1, False)
+
+	spans.node_class = node_class
+	return spans
+
+def line_ends(context, chid, ch):
+	return (chid + 1, True)
+
+def text(context, chid, ch):
+	""" Any other character: the whole run of plain text (and escapes) is
+	taken at once
+	"""
+
+	s = context.s
+	stack = context.stack
+
+	if ch[0] == '\\':
+		chid -= 1
+	run = _TEXT_RUN.match(s, chid)
+	raw = run.group(0)
+	text = _unescape(raw)
+
+	if not stack.count(types = ParagraphNode):
+		stack.push(
+			ParagraphNode()
+		)
+
+	if not stack.count(types = StringNode):
+		stack.push(
+			context.string(run.start(), run.end(), None if text is raw else text)
+		)
+	else:
+		assert isinstance(stack.top(), StringNode)
+
+		stack.top()._append(text)
+		if context.lazy:
+			stack.top().end = run.end()
+
+	return (run.end(), False)
+
+########################################################################
+# Tables and registration                                              #
+########################################################################
+
+NEW_LINE_HANDLERS = {
+	'#': comments,
+	'^': images,
+	'!': alerts,
+	'=': sections,
+	'\n': blank_lines,
+	'-': lists,
+	'$': formulas,
+	'\\[': formulas,
+	'~': code,
+	'%': block_ends,
+}
+
+INLINE_HANDLERS = {
+	'$': formula_spans,
+	'\\(': formula_spans,
+	'*': span_handler(BoldfaceSpanNode),
+	'/': span_handler(ItalicSpanNode),
+	'+': span_handler(TypewriterSpanNode),
+	'\n': line_ends,
+}
+
+def _text_run():
+	""" Compile the regex of a run of plain text: anything but the
+	characters starting inline constructs, plus backslash pairs other than
+	the ones starting inline constructs (like the \\( of inline formulas)
+	"""
+
+	special = ''.join(sorted(
+		ch for ch in INLINE_HANDLERS if len(ch) == 1 and ch != '\n'
+	))
+	pairs = ''.join(sorted(ch[1] for ch in INLINE_HANDLERS if len(ch) == 2))
+	escape = r'\\[^%s]' % re.escape(pairs) if pairs else r'\\.'
+	return re.compile(
+		r'(?:[^%s\\\n]+|%s)+' % (re.escape(special), escape), re.DOTALL)
+
+_TEXT_RUN = _text_run()
+
+# The tables as shipped, see is_default
+_DEFAULT_TABLES = (dict(NEW_LINE_HANDLERS), dict(INLINE_HANDLERS))
+
+def _inline_changed():
+	""" Update what depends on INLINE_HANDLERS after it has changed """
+
+	global _TEXT_RUN
+
+	_TEXT_RUN = _text_run()
+	_SPAN_CONTAINERS[:] = [ParagraphNode] + [
+		handler.node_class
+		for (ch, handler) in sorted(INLINE_HANDLERS.items())
+		if hasattr(handler, 'node_class')
+	]
+
+def register_handler(ch, handler, inline = False):
+	""" Set the handler of the constructs starting with ch (a character or
+	a backslash pair) at the beginning of a line or, if inline is True,
+	elsewhere. A handler of None removes the current one. Returns the
+	handler that was replaced, if any.
+
+	This affects all the parses that start afterwards (see extensions).
+	"""
+
+	if not (len(ch) == 1 or (len(ch) == 2 and ch[0] == '\\')):
+		raise ValueError('constructs start with a character or a backslash pair')
+
+	table = INLINE_HANDLERS if inline else NEW_LINE_HANDLERS
+	previous = table.pop(ch, None)
+	if handler is not None:
+		table[ch] = handler
+	if inline:
+		_inline_changed()
+	return previous
+
+@contextlib.contextmanager
+def extensions():
+	""" Context manager restoring, on exit, the handler tables as they were
+	on entry, undoing the registrations made inside it
+	"""
+
+	saved = (dict(NEW_LINE_HANDLERS), dict(INLINE_HANDLERS))
+	try:
+		yield
+	finally:
+		for (table, handlers) in zip((NEW_LINE_HANDLERS, INLINE_HANDLERS), saved):
+			table.clear()
+			table.update(handlers)
+		_inline_changed()
+
+def _check_construct(ch, node_class):
+	if len(ch) != 1 or ch in '\\\n':
+		raise ValueError('custom constructs start with a character other than '
+			'a backslash or a new line')
+	if not (isinstance(node_class, type) and issubclass(node_class, ElementNode)):
+		raise TypeError('node_class must be a subclass of ElementNode')
+
+def register_block(ch, node_class):
+	""" Make the lines starting with ch open a block-level node_class (like
+	alerts), holding a paragraph with the rest of the line. node_class is
+	instantiated without arguments. Returns the handler that was replaced,
+	if any.
+	"""
+
+	_check_construct(ch, node_class)
+
+	def blocks(context, chid, ch):
+		# Block-level elements
+		context.stack.pop(until = BlockNode)
+
+		context.stack.push(
+			node_class()
+		)
+		context.stack.push(
+			ParagraphNode()
+		)
+
+		return (chid + 1, False)
+
+	blocks.node_class = node_class
+	return register_handler(ch, blocks)
+
+def register_span(ch, node_class):
+	""" Make ch open and close spans of node_class (like * for boldface)
+	inside paragraphs. node_class is instantiated without arguments. Returns
+	the handler that was replaced, if any.
+	"""
+
+	_check_construct(ch, node_class)
+	return register_handler(ch, span_handler(node_class), inline = True)
+
+def is_default():
+	""" Returns True if the handler tables are the default ones, that is,
+	if no registration is in effect
+	"""
+
+	return (NEW_LINE_HANDLERS, INLINE_HANDLERS) == _DEFAULT_TABLES
+
+def _name(value):
+	""" The module and qualified name of a class or function """
+
+	return '%s.%s' % (
+		getattr(value, '__module__', None) or type(value).__module__,
+		getattr(value, '__qualname__', None) or
+			getattr(value, '__name__', None) or type(value).__name__,
+	)
+
+def fingerprint():
+	""" Returns a string identifying the handler tables, empty for the
+	default ones. Handlers are identified by their name and, for the ones
+	made by register_block and register_span, by their node class, so the
+	fingerprint of the same registrations is the same in every process.
+	"""
+
+	if is_default():
+		return ''
+
+	entries = []
+	for (table, handlers) in (('line', NEW_LINE_HANDLERS), ('inline', INLINE_HANDLERS)):
+		for (ch, handler) in sorted(handlers.items()):
+			node_class = getattr(handler, 'node_class', None)
+			entries.append('%s %r %s %s' % (
+				table, ch, _name(handler),
+				'' if node_class is None else _name(node_class),
+			))
+	return '\n'.join(entries)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MarkPy - github.com/obag/MarkPy
+# Copyright © 2014 Gabriele Farina <gabr.farina@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" A table of the lines of a document, classified by the construct they
+start with in one sweep before parsing. Parser.skim and the splitting of
+documents at their sections (Parser.parse_parallel, parse_editable) look
+for titles in it instead of in the text. They, and Parser.parse_document
+when it collects ParseStats or enforces Limits, take from it the text to
+parse and map positions in it back to the original string. The parser
+itself still dispatches on the characters it reads, through the handler
+tables of markpy.grammar, which custom constructs can extend.
+"""
+
+import array
+import bisect
+import operator
+import re
+
+try:
+	from itertools import accumulate
+except ImportError: # Python 2
+	def accumulate(iterable):
+		total = 0
+		for item in iterable:
+			total += item
+			yield total
+
+
+# The kinds of line, from the construct they start with. Each is a byte, so
+# that the kinds column can be searched with regexes.
+BLANK = ord('\n')
+COMMENT = ord('#')
+TITLE = ord('=')
+LIST = ord('-')		# List items and paragraph continuations (->)
+ALERT = ord('!')
+IMAGE = ord('^')
+CODE = ord('~')
+BLOCK_END = ord('%')
+FORMULA = ord('$')	# $$ or \[
+TEXT = ord(' ')
+
+_KINDS = {
+	'': BLANK,
+	'#': COMMENT,
+	'=': TITLE,
+	'-': LIST,
+	'!': ALERT,
+	'^': IMAGE,
+	'~': CODE,
+	'%': BLOCK_END,
+	'$': FORMULA,
+	'\\': FORMULA,
+}
+
+# Lines that may hide the following ones: CODE and FORMULA
+_BLOCK_START = re.compile(b'[~$]')
+
+_first = operator.itemgetter(slice(0, 1))
+
+class LineTable(object):
+	""" The lines of a string, as parallel arrays with one item per line:
+
+	- starts: the offset of the line in the string;
+	- ends: where the trailing blanks of the line begin in the string (or
+	  where it ends, if it has none);
+	- offsets: the offset of the line in text, the string with the trailing
+	  blanks of every line removed, which is what the parser reads;
+	- kinds: the kind of the line (BLANK, TITLE, CODE...), from its first
+	  characters, as a bytearray. Lines the parser does not read from their
+	  beginning are TEXT: those inside code blocks and formulas, and the
+	  line after a code block, which the parser goes on with inline;
+	- levels: the number of '=' that titles start with, 0 for other lines.
+
+	The columns are built by loops over the lines that only look at the
+	first two characters of each (and at the '=' of titles), mostly run by
+	map in C.
+	"""
+
+	def __init__(self, s):
+		lines = s.split('\n')
+		stripped = [line.rstrip() for line in lines]
+		self.text = '\n'.join(stripped)
+		self.size = len(s)
+
+		lengths = list(map(len, lines))
+		self.longest_line = max(lengths)
+		self.starts = array.array('l', [0])
+		self.starts.extend(accumulate(length + 1 for length in lengths[:-1]))
+		stripped_lengths = list(map(len, stripped))
+		self.ends = array.array('l', map(operator.add, self.starts,
+			stripped_lengths))
+		self.offsets = array.array('l', [0])
+		self.offsets.extend(accumulate(length + 1
+			for length in stripped_lengths[:-1]))
+
+		kinds = self.kinds = bytearray(map(_KINDS.get, map(_first, stripped),
+			[TEXT] * len(stripped)))
+		self.levels = array.array('l', [0]) * len(stripped)
+
+		# Only $$ and \[ open formulas
+		line = kinds.find(b'$')
+		while line >= 0:
+			if stripped[line][:2] not in ('$$', '\\['):
+				kinds[line] = TEXT
+			line = kinds.find(b'$', line + 1)
+
+		# Skip the code blocks and formulas, as the parser would
+		line = 0
+		while True:
+			m = _BLOCK_START.search(kinds, line)
+			if m is None:
+				break
+
+			line = m.start()
+			start = self.offsets[line]
+			if kinds[line] == CODE:
+				end_tag = '~~~\n'
+			elif self.text[start] == '$':
+				end_tag = '$$'
+			else:
+				end_tag = '\\]'
+			end = self.text.find(end_tag, start + 1)
+			if end < 0:
+				following = len(kinds)
+			else:
+				following = bisect.bisect_left(self.offsets, end + len(end_tag),
+					line + 1)
+				if kinds[line] == CODE:
+					# The code block ends at the beginning of this line
+					following += 1
+				following = min(following, len(kinds))
+			kinds[line + 1 : following] = bytearray([TEXT]) * (following - line - 1)
+			line = following
+
+		line = kinds.find(b'=')
+		while line >= 0:
+			self.levels[line] = stripped_lengths[line] - len(stripped[line].lstrip('='))
+			line = kinds.find(b'=', line + 1)
+
+	def __len__(self):
+		return len(self.kinds)
+
+	def line(self, offset):
+		""" Returns the index of the line holding offset of text """
+
+		return bisect.bisect_right(self.offsets, offset) - 1
+
+	def original_offset(self, offset):
+		""" Map an offset of text to the same position in the string """
+
+		line = self.line(offset)
+		return self.starts[line] + offset - self.offsets[line]
+
+	def titles(self):
+		""" Yields the index and the level of every line that opens a
+		section, outside code blocks and formulas
+		"""
+
+		kinds = self.kinds
+		line = kinds.find(b'=')
+		while line >= 0:
+			yield (line, self.levels[line])
+			line = kinds.find(b'=', line + 1)
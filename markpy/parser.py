@@ -17,9 +17,473 @@
 # limitations under the License.
 
 
-import string
-from elementnode import *
-from elementstack import ElementStack
+import bisect
+import codecs
+import functools
+import mmap
+import multiprocessing
+import os
+import timeit
+from . import grammar
+from .elementnode import *
+from .elementnode import _NO_CHILDREN
+from .elementstack import CountingElementStack, ElementStack
+from .flat import FlatTree
+from .lines import LineTable
+
+def _strip_blanks(s):
+	""" Strip the trailing blanks of every line """
+
+	return "\n".join([line.rstrip() for line in s.split("\n")])
+
+# Yielded by Parser._parse, in partial mode, when it needs more input
+_NEED_DATA = object()
+
+def _parse_many_worker(job):
+	""" Parse one of the documents of Parser.parse_many. This runs in the
+	worker processes and returns the tree in packed form.
+	"""
+
+	(index, item, strings) = job
+	path = None if strings else item
+	try:
+		if strings:
+			root = Parser.parse_document(item)
+		else:
+			root = Parser.parse_file(item)
+		return (index, path, root.pack(), None)
+	except Exception as e:
+		return (index, path, None, '%s: %s' % (type(e).__name__, e))
+
+# Appended to every chunk but the last by Parser.parse_parallel. The last
+# child of the parsed chunk must be the empty section it produces, otherwise
+# the serial parse would not have started a new section there.
+_CHUNK_SENTINEL = '=\n'
+
+def _split_sections(table, min_chunk):
+	""" Split the text of a LineTable at the beginning of lines opening a
+	top-level section, outside code blocks and formulas, in chunks of at least
+	min_chunk characters (except possibly the last one). Returns the indices
+	of the lines where the chunks start, the first one being 0.
+	"""
+
+	offsets = table.offsets
+	lines = [0]
+	for (line, level) in table.titles():
+		if (level == 1 and line > lines[-1] and
+			offsets[line] - offsets[lines[-1]] >= min_chunk):
+			lines.append(line)
+	return lines
+
+def _parse_chunk(chunk, last):
+	""" Parse a chunk produced by _split_sections on its own and return its
+	DocumentNode, or None if it cannot be parsed independently from the text
+	that follows it (see _CHUNK_SENTINEL). last tells whether the chunk ends
+	the document.
+	"""
+
+	_element_stack = ElementStack()
+	try:
+		for _ in Parser._parse(chunk if last else chunk + _CHUNK_SENTINEL, _element_stack):
+			pass
+	except Exception:
+		return None
+	root = _element_stack.top()
+
+	if not last:
+		sentinel = root.children[-1] if root.children else None
+		title = sentinel.children[0] if sentinel and len(sentinel.children) == 1 else None
+		if not (
+			isinstance(sentinel, SectionNode) and
+			isinstance(title, SectionTitleNode) and
+			len(title.children) == 1 and
+			isinstance(title.children[0], ParagraphNode) and
+			not title.children[0].children
+		):
+			return None
+		root.children = root.children[:-1]
+
+	return root
+
+def _parse_chunk_worker(job):
+	""" Parse one of the chunks of Parser.parse_parallel. This runs in the
+	worker processes and returns the DocumentNode in packed form, or None if
+	the chunk cannot be parsed on its own.
+	"""
+
+	root = _parse_chunk(*job)
+	return None if root is None else root.pack()
+
+def _parse_chunks(original, last):
+	""" Parse original, a text starting at a top-level section (or at the
+	beginning of the document), one top-level section at a time. last tells
+	whether the text ends the document. Returns a list of [start, nodes]
+	entries, one per chunk, where start is the offset of the chunk in
+	original and nodes the top-level nodes it produced, or None if the text
+	cannot be split.
+	"""
+
+	table = LineTable(original)
+	lines = _split_sections(table, 0)
+	bounds = [table.offsets[line] for line in lines] + [len(table.text)]
+
+	chunks = []
+	for index in range(len(lines)):
+		root = _parse_chunk(
+			table.text[bounds[index] : bounds[index+1]],
+			last and index + 1 == len(lines),
+		)
+		if root is None:
+			return None
+		chunks.append([table.starts[lines[index]], list(root.children)])
+
+	return chunks
+
+def _section_body(original, start, end, section):
+	""" Parse the body of a section of a document returned by Parser.skim.
+	original[start:end] holds its title, without the level leading '='s, and
+	the text up to the next title. Returns the nodes that come before the
+	subsections among the children of the section, the first being its
+	title, or None if the section cannot be parsed on its own.
+	"""
+
+	root = _parse_chunk('=' + _strip_blanks(original[start:end]),
+		end == len(original))
+	if root is None or len(root.children) != 1 or not root.children[0].children:
+		return None
+
+	# The chunk was parsed as a top-level section
+	depth = section._attrib_items()['depth']
+	nodes = list(root.children[0].children)
+	for top in nodes:
+		for node in top.iter_preorder():
+			if node._attrib is None:
+				node._depth += depth - 1
+			else:
+				node._attrib['depth'] += depth - 1
+
+	_keep_title(section, nodes)
+	return nodes
+
+def _keep_title(section, nodes):
+	""" Put the title node of the outline of section in place of the first
+	of nodes, its parsed title, with the children of the latter, as the
+	title may continue past its line
+	"""
+
+	title = section.title
+	if title is not None:
+		for node in nodes[0].children:
+			node.parent = title
+		title.children = nodes[0].children
+		nodes[0] = title
+
+def _title_key(section):
+	""" The depth and the title text of a section, to match the sections of
+	different parses
+	"""
+
+	title = section.title
+	text = u'' if title is None else u''.join(
+		node.content
+		for node in title.iter_preorder()
+		if isinstance(node, StringNode)
+	)
+	return (section._attrib_items()['depth'], text)
+
+def _same_section(outline_key, full_key):
+	""" Whether the keys (see _title_key) of a section of a skimmed document
+	and of a section of the full parse belong to the same section. The
+	title of the former is parsed from its line only.
+	"""
+
+	return (outline_key[0] == full_key[0] and
+		full_key[1].startswith(outline_key[1]))
+
+class _SkimmedDocument(object):
+	""" The state shared by the sections of a document returned by
+	Parser.skim. The first time the body of one of them cannot be parsed on
+	its own, the whole document is parsed, and that section takes the body
+	of its counterpart in the full tree.
+
+	If the sections of the full tree are not those of the outline (a line
+	looking like a title was inside a multi-line construct), the document
+	is rebuilt from the full tree instead: the sections of the outline that
+	match those of the full tree, in order, take their place in it, and the
+	others are detached.
+	"""
+
+	def __init__(self, s, root, sections):
+		self.s = s
+		self.root = root
+		self.sections = sections
+		self.full_sections = None
+
+	def body(self, index, start, end, section):
+		""" The pending body of sections[index] (see SectionNode) """
+
+		nodes = _section_body(self.s, start, end, section)
+		if nodes is not None:
+			return nodes
+
+		if self.full_sections is None:
+			full = Parser.parse_document(self.s)
+			self.full_sections = list(full.find_all(SectionNode))
+			keys = [_title_key(full_section) for full_section in self.full_sections]
+			if len(keys) != len(self.sections) or not all(
+				_same_section(_title_key(outline_section), key)
+				for (outline_section, key) in zip(self.sections, keys)
+			):
+				self._rebuild(full, keys)
+				return None
+
+		# Take the body, without the subsections
+		full_section = self.full_sections[index]
+		nodes = []
+		for node in full_section.children:
+			if isinstance(node, SectionNode):
+				break
+			nodes.append(node)
+		_keep_title(section, nodes)
+		return nodes
+
+	def _rebuild(self, full, keys):
+		""" Replace the children of the root with those of full, the
+		DocumentNode of the full parse, whose sections have keys. The lists
+		of children are changed in place, so that loops over them already
+		running go on over the new children.
+		"""
+
+		for section in self.sections:
+			section._pending = None
+
+		# Pair the sections in order, skipping those of the outline that are
+		# not in the full tree
+		pairs = []
+		detached = set()
+		for section in self.sections:
+			if (len(pairs) < len(keys) and
+				_same_section(_title_key(section), keys[len(pairs)])):
+				pairs.append((section, self.full_sections[len(pairs)]))
+			else:
+				detached.add(id(section))
+
+		# In preorder, so that the parent of every section is already in
+		# place
+		for (section, full_section) in pairs:
+			parent = full_section.parent
+			siblings = parent._children
+			siblings[siblings.index(full_section)] = section
+			section.parent = parent
+			children = list(full_section.children)
+			_keep_title(section, children)
+			_replace_children(section, children)
+
+		for section in self.sections:
+			if id(section) in detached and id(section.parent) not in detached:
+				section.parent = None
+
+		_replace_children(self.root, full.children)
+
+def _replace_children(node, children):
+	""" Replace the children of node with children, in place """
+
+	for child in children:
+		child.parent = node
+	if node._children is _NO_CHILDREN:
+		node._children = []
+	list.__setitem__(node._children, slice(None), children)
+	# Let node know about the change
+	node._children_changed()
+
+class ParseResult(object):
+	""" The outcome of parsing one of the documents given to
+	Parser.parse_many: index is its position in the input, path its path
+	(None for strings), and either root is the resulting tree or error
+	describes why it could not be parsed.
+	"""
+
+	def __init__(self, index, path, root = None, error = None):
+		self.index = index
+		self.path = path
+		self.root = root
+		self.error = error
+
+class ParseStats(object):
+	""" Statistics collected by Parser.parse_document when a ParseStats is
+	supplied as its stats argument:
+
+	- calls and times: by construct, that is by name of handler (see
+	  markpy.grammar: sections, lists, alerts, code, formulas, images,
+	  comments, blank_lines, block_ends, paragraphs, formula_spans, spans,
+	  line_ends and text), the number of steps taken by its handler and the
+	  time spent there, in seconds. A step handed over to another handler
+	  without consuming any input (paragraphs to the inline handlers, at the
+	  start of a paragraph) is only counted once, for the first handler;
+	- pushes, pops and counts: the calls to the ElementStack methods, and
+	  max_depth the maximum depth of the stack;
+	- chars, lines and longest_line: the size of the input;
+	- total_time: the time spent parsing, in seconds.
+
+	If a callback is supplied, it is called with the stats at the end of
+	every parse, even a failed one, for instance to forward them to a
+	metrics system. The same ParseStats can be used for many parses, and
+	then sums them up (longest_line and max_depth are maxima).
+	"""
+
+	def __init__(self, callback = None):
+		self.callback = callback
+		self.calls = {}
+		self.times = {}
+		self.pushes = 0
+		self.pops = 0
+		self.counts = 0
+		self.max_depth = 0
+		self.chars = 0
+		self.lines = 0
+		self.longest_line = 0
+		self.total_time = 0.0
+		self._current = None
+		self._since = None
+		self._started = None
+
+	def as_dict(self):
+		""" Returns the stats as a dict of plain values """
+
+		return {
+			'calls': dict(self.calls),
+			'times': dict(self.times),
+			'pushes': self.pushes,
+			'pops': self.pops,
+			'counts': self.counts,
+			'max_depth': self.max_depth,
+			'chars': self.chars,
+			'lines': self.lines,
+			'longest_line': self.longest_line,
+			'total_time': self.total_time,
+		}
+
+	def _enter(self, construct, step = True):
+		""" The parser starts handling construct (None at the end), in a new
+		step or in the same as the previous construct
+		"""
+
+		now = timeit.default_timer()
+		if self._current is not None:
+			self.times[self._current] = (
+				self.times.get(self._current, 0.0) + now - self._since)
+		if construct is not None and step:
+			self.calls[construct] = self.calls.get(construct, 0) + 1
+		self._current = construct
+		self._since = now
+
+	def _start(self, table):
+		self.chars += table.size
+		self.lines += len(table)
+		self.longest_line = max(self.longest_line, table.longest_line)
+		self._started = timeit.default_timer()
+
+	def _finish(self, element_stack):
+		self._enter(None)
+		self.total_time += timeit.default_timer() - self._started
+		self.pushes += element_stack.pushes
+		self.pops += element_stack.pops
+		self.counts += element_stack.counts
+		self.max_depth = max(self.max_depth, element_stack.max_depth)
+		if self.callback is not None:
+			self.callback(self)
+
+class Limits(object):
+	""" Limits on the resources used to parse a document, for untrusted
+	input (see Parser.parse_document): the length of the input in characters
+	(max_size), the depth of the tree (max_depth), the number of its nodes
+	(max_nodes) and the wall time of the parse in seconds (max_time). Any of
+	them can be None, for no limit.
+	"""
+
+	def __init__(self, max_size = 1 << 24, max_depth = 256,
+		max_nodes = 1 << 22, max_time = 10.0):
+		self.max_size = max_size
+		self.max_depth = max_depth
+		self.max_nodes = max_nodes
+		self.max_time = max_time
+
+class ParseError(ValueError):
+	""" Raised by Parser.parse_document, when limits are supplied, if the
+	document is malformed or exceeds them. line and column (from 1) tell
+	where the failing construct starts, and offset is its position in the
+	input.
+	"""
+
+	def __init__(self, message, line, column, offset):
+		ValueError.__init__(self, '%s at line %d, column %d' % (message, line,
+			column))
+		self.line = line
+		self.column = column
+		self.offset = offset
+
+# The exceptions of malformed documents
+_PARSE_FAILURES = (ValueError, IndexError, AssertionError, NotImplementedError)
+
+class _Guard(object):
+	""" Enforces Limits while Parser._parse runs, and locates its failures.
+	The parser calls step at every construct, before handling it.
+	"""
+
+	def __init__(self, limits, table, element_stack):
+		self.limits = limits
+		self.table = table
+		self.element_stack = element_stack
+		self.position = 0
+		self.handler = None
+		self.steps = 0
+		self.deadline = None
+		if limits.max_time is not None:
+			self.deadline = timeit.default_timer() + limits.max_time
+
+	def step(self, chid):
+		self.check()
+		self.position = chid
+		self.handler = None
+
+	def check(self):
+		""" Raise a ParseError if a limit has been exceeded (by the previous
+		construct)
+		"""
+
+		limits = self.limits
+		if (limits.max_depth is not None and
+			self.element_stack.max_depth > limits.max_depth):
+			raise self.error('tree deeper than %d levels' % limits.max_depth)
+		if (limits.max_nodes is not None and
+			self.element_stack.pushes > limits.max_nodes):
+			raise self.error('more than %d nodes' % limits.max_nodes)
+
+		# The clock is only read every 1024 constructs
+		self.steps += 1
+		if (self.deadline is not None and not self.steps & 1023 and
+			timeit.default_timer() > self.deadline):
+			raise self.error('parse longer than %gs' % limits.max_time)
+
+	def failure(self, error):
+		""" Returns the ParseError for an exception raised by a handler """
+
+		construct = 'input' if self.handler is None else self.handler.__name__
+		if isinstance(error, IndexError):
+			message = 'unexpected end of %s' % construct
+		elif isinstance(error, ValueError) and str(error) == 'substring not found':
+			message = 'unterminated %s' % construct
+		else:
+			message = 'malformed %s' % construct
+		return self.error(message)
+
+	def error(self, message):
+		""" Returns a ParseError at the current position """
+
+		line = self.table.line(self.position)
+		column = self.position - self.table.offsets[line] + 1
+		return ParseError(message, line + 1, column,
+			self.table.original_offset(self.position))
 
 class Parser:
 	""" This is the parser for the MarkSC language. It provides a static
@@ -27,405 +491,551 @@ class Parser:
 	"""
 
 	@staticmethod
-	def parse_document(s):
-		""" Parse a string and return the root of the resulting tree """
-
-		def escape(ch):
-			escape_list = {
-				"\\$": "$",
-				"\\%": "%",
-				"\\+": "+",
-				"\\*": "*",
-				"\\!": "!",
-				"\\/": "/",
-				"\\\\": "\\",
-			}
-			
-			if ch in escape_list:
-				return escape_list[ch]
+	def parse_document(s, lazy = False, index = False, stats = None,
+		limits = None):
+		""" Parse a string and return the root of the resulting tree.
+
+		If lazy is True, the StringNodes keep a reference to the parsed text
+		and the span they cover in it (see StringNode). Plain text without
+		escapes, code snippets and formulas are then only sliced from it when
+		their content is accessed. The parsed text is the supplied string with
+		the trailing blanks of every line removed, so lines and columns are
+		the same as in the original.
+
+		If index is True, the node-type index of the DocumentNode (see
+		DocumentNode.build_index) is built while parsing.
+
+		If stats (a ParseStats) is supplied, statistics about the parse are
+		added to it. Otherwise, collecting them costs nothing.
+
+		For untrusted input, supply limits (a Limits): parsing then stops as
+		soon as one is exceeded, and any malformed construct, with a
+		ParseError telling where. Parsing takes linear time in any case.
+		"""
+
+		_index = {} if index else None
+		if stats is None and limits is None:
+			_element_stack = ElementStack(index = _index)
+			for _ in Parser._parse(_strip_blanks(s), _element_stack, lazy = lazy):
+				pass
+		else:
+			if (limits is not None and limits.max_size is not None and
+				len(s) > limits.max_size):
+				line = s.count('\n', 0, limits.max_size) + 1
+				column = limits.max_size - s.rfind('\n', 0, limits.max_size)
+				raise ParseError('input longer than %d characters' %
+					limits.max_size, line, column, limits.max_size)
+
+			_element_stack = CountingElementStack(index = _index)
+			table = LineTable(s)
+			guard = None
+			if limits is not None:
+				guard = _Guard(limits, table, _element_stack)
+			if stats is not None:
+				stats._start(table)
+			try:
+				for _ in Parser._parse(table.text, _element_stack, lazy = lazy,
+					_stats = stats, _guard = guard):
+					pass
+				if guard is not None:
+					guard.check()
+			except ParseError:
+				raise
+			except _PARSE_FAILURES as error:
+				if guard is None:
+					raise
+				raise guard.failure(error)
+			finally:
+				if stats is not None:
+					stats._finish(_element_stack)
+
+		_root = _element_stack.top()
+		_root._index = _index
+		return _root
+
+	@staticmethod
+	def parse_file(path, encoding = 'utf-8', chunk_size = 1 << 20):
+		""" Parse the file at path and return the root of the resulting tree.
+
+		The file is memory-mapped and fed to an IncrementalParser chunk by
+		chunk, so that only chunk_size bytes of it are decoded at a time and
+		the whole document is never held in memory as a string.
+		"""
+
+		with open(path, 'rb') as f:
+			if os.fstat(f.fileno()).st_size == 0:
+				# Empty files cannot be mapped
+				return Parser.parse_document(u'')
+
+			parser = IncrementalParser()
+			decoder = codecs.getincrementaldecoder(encoding)()
+			m = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+			try:
+				for start in range(0, len(m), chunk_size):
+					parser.feed(decoder.decode(m[start : start+chunk_size]))
+				parser.feed(decoder.decode(b'', True))
+			finally:
+				m.close()
+
+		return parser.close()
+
+	@staticmethod
+	def parse_many(items, workers = None, ordered = True, strings = False,
+		chunksize = 1):
+		""" Parse many documents with a pool of worker processes, yielding a
+		ParseResult for each of them. items are file paths or, if strings is
+		True, the documents themselves.
+
+		Results come in the order of items or, if ordered is False, as soon as
+		they are ready. A document that fails to parse gives a ParseResult
+		with its error set, and does not stop the others. workers defaults to
+		the number of CPUs; with workers = 1, or if custom handlers are
+		registered (which the worker processes would not see), everything is
+		parsed in this process.
+		"""
+
+		jobs = ((index, item, strings) for (index, item) in enumerate(items))
+
+		if workers == 1 or not grammar.is_default():
+			results = (_parse_many_worker(job) for job in jobs)
+			pool = None
+		else:
+			pool = multiprocessing.Pool(workers)
+			if ordered:
+				results = pool.imap(_parse_many_worker, jobs, chunksize)
 			else:
-				return ch
-		
-		# Strip all trailing blanks
-		s = "\n".join(map(lambda x: string.rstrip(x), s.split("\n")))
-		
+				results = pool.imap_unordered(_parse_many_worker, jobs, chunksize)
+
+		try:
+			for (index, path, packed, error) in results:
+				yield ParseResult(
+					index,
+					path,
+					None if packed is None else ElementNode.unpack(packed),
+					error,
+				)
+
+			if pool is not None:
+				pool.close()
+				pool.join()
+		finally:
+			if pool is not None:
+				pool.terminate()
+
+	@staticmethod
+	def parse_parallel(s, workers = None, min_chunk = 1 << 16):
+		""" Parse a string splitting it at its top-level sections, which are
+		parsed in parallel by a pool of worker processes, and return the root
+		of the resulting tree.
+
+		Sections are grouped in chunks of at least min_chunk characters. If a
+		chunk turns out not to be independent from the following one (or
+		fails to parse), the whole document is parsed serially instead, so
+		the result is always the same as that of parse_document. With
+		workers = 1 the chunks are parsed in this process, and if custom
+		handlers are registered (which the worker processes would not see)
+		the document is parsed by parse_document.
+		"""
+
+		if not grammar.is_default():
+			return Parser.parse_document(s)
+
+
+		table = LineTable(s)
+		starts = [table.offsets[line] for line in _split_sections(table, min_chunk)]
+		starts.append(len(table.text))
+		chunks = [table.text[starts[i] : starts[i+1]] for i in range(len(starts) - 1)]
+		if len(chunks) < 2:
+			return Parser.parse_document(s)
+
+		jobs = [(chunk, index + 1 == len(chunks)) for (index, chunk) in enumerate(chunks)]
+		if workers == 1:
+			results = [_parse_chunk_worker(job) for job in jobs]
+		else:
+			pool = multiprocessing.Pool(workers)
+			try:
+				results = pool.map(_parse_chunk_worker, jobs)
+			finally:
+				pool.terminate()
+
+		if None in results:
+			return Parser.parse_document(s)
+
+		_root = ElementNode.unpack(results[0])
+		for packed in results[1:]:
+			_root.append_child(list(ElementNode.unpack(packed).children))
+		return _root
+
+	@staticmethod
+	def parse_editable(s):
+		""" Parse a string like parse_document, but keep on the DocumentNode
+		the string and the span of every top-level section, so that the tree
+		can be updated after an edit with Parser.reparse.
+		"""
+
+		chunks = _parse_chunks(s, True)
+		if chunks is None:
+			# The top-level sections depend on each other: a single chunk
+			chunks = [[0, list(Parser.parse_document(s).children)]]
+
+		_root = DocumentNode()
+		_root._set_depth(0)
+		for (_, nodes) in chunks:
+			_root.append_child(nodes)
+
+		_root.source = s
+		_root._chunks = [[start, len(nodes)] for (start, nodes) in chunks]
+		return _root
+
+	@staticmethod
+	def reparse(root, offset, deleted, inserted):
+		""" Update a tree returned by parse_editable after the edit that
+		replaces deleted characters at offset of its source with the string
+		inserted. Only the top-level sections touched by the edit are parsed
+		again (more of them if the edit makes them depend on the following
+		ones) and their nodes are replaced in root.
+
+		Returns a tuple (removed, added) with the lists of the top-level nodes
+		taken out of root and of those put in their place. If the new
+		document cannot be parsed the exception is raised and root is left
+		unchanged.
+		"""
+
+		assert root._chunks is not None, 'the tree was not made by parse_editable'
+
+		source = root.source
+		new_source = source[:offset] + inserted + source[offset+deleted:]
+		delta = len(inserted) - deleted
+
+		starts = [start for (start, _) in root._chunks]
+		first = bisect.bisect_right(starts, max(offset - 1, 0)) - 1
+		last = bisect.bisect_right(starts, offset + deleted) - 1
+
+		while True:
+			region_start = starts[first]
+			is_last = last + 1 == len(starts)
+			region_end = (len(source) if is_last else starts[last+1]) + delta
+
+			chunks = _parse_chunks(new_source[region_start : region_end], is_last)
+			if chunks is not None:
+				for chunk in chunks:
+					chunk[0] += region_start
+				break
+
+			if is_last:
+				# Give up splitting and parse the whole document again
+				(first, last) = (0, len(starts) - 1)
+				new_root = Parser.parse_editable(new_source)
+				chunks = []
+				nodes = list(new_root.children)
+				for (start, count) in new_root._chunks:
+					chunks.append([start, nodes[:count]])
+					nodes = nodes[count:]
+				break
+
+			last += 1
+
+		children = list(root.children)
+		begin = sum(count for (_, count) in root._chunks[:first])
+		end = begin + sum(count for (_, count) in root._chunks[first:last+1])
+
+		removed = children[begin:end]
+		added = [node for (_, nodes) in chunks for node in nodes]
+		for node in removed:
+			node.parent = None
+		for node in added:
+			node.parent = root
+
+		root.children = children[:begin] + added + children[end:]
+		root._chunks = (
+			root._chunks[:first] +
+			[[start, len(nodes)] for (start, nodes) in chunks] +
+			[[start + delta, count] for (start, count) in root._chunks[last+1:]]
+		)
+		root.source = new_source
+
+		return (removed, added)
+
+	@staticmethod
+	def skim(s):
+		""" Parse only the outline of a string: the directives at its
+		beginning and the titles of its sections, found by scanning the lines
+		starting with '=' outside code blocks and formulas. The body of every
+		section is parsed the first time the children of the SectionNode are
+		accessed (see SectionNode), so that the tree is then the same as that
+		of parse_document.
+
+		If the titles cannot be parsed apart from the rest of the document,
+		the whole of it is parsed right away. If the body of a section turns
+		out to depend on the text that follows it (through an inline construct
+		spanning a line that looks like a title), the whole document is parsed
+		when its children are accessed (see _SkimmedDocument).
+		"""
+
+		table = LineTable(s)
+		titles = list(table.titles())
+		if not titles:
+			return Parser.parse_document(s)
+
+		(text, offsets) = (table.text, table.offsets)
+		lines = [text[:offsets[titles[0][0]]]]
+		for (line, _) in titles:
+			if line + 1 < len(table):
+				lines.append(text[offsets[line] : offsets[line+1]])
+			else:
+				lines.append(text[offsets[line]:] + '\n')
+
 		_element_stack = ElementStack()
+		try:
+			for _ in Parser._parse(''.join(lines), _element_stack):
+				pass
+		except _PARSE_FAILURES:
+			return Parser.parse_document(s)
+		_root = _element_stack.top()
+
+		sections = list(_root.find_all(SectionNode))
+		if len(sections) != len(titles) or any(
+			len(section.children) != 1 + len(section.subsections) or
+			not isinstance(section.parent, (SectionNode, DocumentNode))
+			for section in sections
+		):
+			return Parser.parse_document(s)
+
+		skimmed = _SkimmedDocument(s, _root, sections)
+		starts = [table.starts[line] for (line, _) in titles]
+		ends = starts[1:] + [len(s)]
+		for (index, section, (_, level), start, end) in zip(
+			range(len(sections)), sections, titles, starts, ends
+		):
+			section._pending = functools.partial(skimmed.body, index,
+				start + level, end)
+
+		return _root
+
+	@staticmethod
+	def iterparse(source, discard = False, lazy = False):
+		""" Parse a string and yield ("start", node), ("text", content) and
+		("end", node) events as the nodes are opened and closed, in document
+		order. The "text" event of a StringNode comes right before its "end"
+		event, once its content is complete.
+
+		If discard is True, finished nodes are not appended to their parent,
+		so that memory does not grow with the size of the document. Their
+		parent attribute is still set. lazy is as in parse_document.
+		"""
+
+		_events = []
+		_element_stack = ElementStack(events = _events, discard = discard)
+		for event in Parser._parse(_strip_blanks(source), _element_stack, _events,
+			lazy = lazy):
+			yield event
+
+		_element_stack.pop()
+		for event in _events:
+			yield event
+
+	@staticmethod
+	def parse_flat(s):
+		""" Parse a string into a FlatTree (see markpy.flat). The nodes are
+		discarded as soon as they are closed, so that the ElementNodes of the
+		whole document are never in memory at once.
+		"""
+
+		return FlatTree.from_events(Parser.iterparse(s, discard = True,
+			lazy = True))
+
+	# Custom constructs, see markpy.grammar
+	register_handler = staticmethod(grammar.register_handler)
+	register_block = staticmethod(grammar.register_block)
+	register_span = staticmethod(grammar.register_span)
+	extensions = staticmethod(grammar.extensions)
+
+	@staticmethod
+	def _parse(s, _element_stack, _events = None, partial = False, lazy = False,
+		_stats = None, _guard = None):
+		""" Parse a string, whose trailing blanks have already been stripped,
+		pushing and popping the nodes on _element_stack. This is a generator:
+		it yields the events collected in _events (if any) while parsing, and
+		leaves the DocumentNode on the stack.
+
+		In partial mode s holds whole lines and more of them will follow:
+		when the input runs out, or a construct needs text past its end, the
+		generator yields _NEED_DATA and expects the following lines to be
+		sent back, or None when the input is over. lazy (which cannot be
+		combined with partial) is as in parse_document.
+
+		The text is parsed through the handler tables of markpy.grammar. If
+		_stats (a ParseStats) is supplied, the parser reports to it the
+		handler it runs at every step, and if _guard (a _Guard) is, the
+		parser reports every step to it.
+		"""
+
+		assert not (lazy and partial)
+
+		context = grammar.ParseContext(s, _element_stack, partial, lazy)
+		new_line_handlers = grammar.NEW_LINE_HANDLERS
+		inline_handlers = grammar.INLINE_HANDLERS
+
 		_element_stack.push(
 			DocumentNode()
 		)
 
 		chid = 0
 		new_line = True
+		waiting = False
+		# The position of the last step reported to _stats
+		stats_at = -1
 		
-		while chid < len(s):
+		while True:
+			if _events:
+				for event in _events:
+					yield event
+				del _events[:]
+
+			if waiting or chid >= len(s):
+				if not partial:
+					break
+
+				# Collect the new text until the construct waited for can
+				# end, searching for its end tag in the new text only (and
+				# in the characters before, that the tag may start with)
+				pieces = [s[chid:]]
+				end_tag = context.end_tag if waiting else None
+				overlap = 0 if end_tag is None else len(end_tag) - 1
+				last = pieces[0]
+				while True:
+					more = yield _NEED_DATA
+					if more is None:
+						partial = context.partial = False
+						break
+					pieces.append(more)
+					last = last[len(last) - overlap:] + more
+					if end_tag is None or end_tag in last:
+						break
+				s = context.s = ''.join(pieces)
+				chid = 0
+				waiting = False
+				continue
+
+			# Where to start over from if this construct needs more input
+			resume = (chid, new_line)
+
+			if _guard is not None:
+				_guard.step(chid)
+
 			ch = s[chid]
 			
 			if ch == '\\':
 				chid += 1
 				ch += s[chid]
-			
-			# dbgStr = s[chid:].replace('\n', '\\n')
-			# print "DBG '", dbgStr[0: min(80, len(dbgStr))], "'"
-			# print _element_stack._stack
-			
+
+			# One lookup in the table of the current state
 			if new_line:
-				new_line = False
-				
-				########################################################
-				# Comments                                             #
-				########################################################
-				if ch == '#': # Comment, skip line
-					chid = s.index('\n', chid) + 1
-					new_line = True
-					continue
-
-
-				########################################################
-				# Images                                               #
-				########################################################
-				if ch == '^':
-					
-					# Images are block-level elements
-					_element_stack.pop(until = BlockNode)
-
-					path = ""
-					desc = ""
-					
-					end_of_tag = s.index('^', chid+1)
-					path = s[chid+1 : end_of_tag]
-					
-					_element_stack.push(
-						ImageNode(path = path)
-					)
-					_element_stack.push(
-						ParagraphNode()
-					)						
-						
-					chid = end_of_tag + 1
-					
-					continue
-
-
-				########################################################
-				# Alerts                                               #
-				########################################################
-				if ch == '!':  # Alert
-					
-					# Alerts are block-level elements
-					_element_stack.pop(until = BlockNode)
-					
-					alert_level = 0
-					while s[chid] == '!':
-						alert_level += 1
-						chid += 1
-				
-					_element_stack.push(
-						AlertNode(level = alert_level)
-					)
-					_element_stack.push(
-						ParagraphNode()
-					)
-
-					continue
-
-
-				########################################################
-				# Section                                              #
-				########################################################				
-				if ch == '=':
-
-					title_depth = 0
-					while s[chid] == '=':
-						title_depth += 1
-						chid += 1
-					
-					_element_stack.pop(until = SectionNode)
-					while _element_stack.top().attrib['depth'] >= title_depth:
-						_element_stack.pop()
-						_element_stack.pop(until = SectionNode)
-					assert title_depth - _element_stack.top().attrib['depth'] <= 1
-
-					_element_stack.push(
-						SectionNode()
-					)
-					_element_stack.push(
-						SectionTitleNode()
-					)
-					_element_stack.push(
-						ParagraphNode()
-					)
-
-					continue
-				
-				########################################################
-				# Empty line                                           #
-				########################################################
-				elif ch == '\n':
-
-					while s[chid] == '\n':
-						chid += 1
-					
-					if not _element_stack.count(types = BlockNode):
-						if not isinstance(_element_stack.top(), DocumentNode):
-							_element_stack.pop(until = SectionNode)
-							_element_stack.push(
-								BlockNode()
-							)
-					else:
-						_element_stack.pop(until = BlockNode)
-
-					new_line = True
-					continue
-
-				########################################################
-				# Paragraph continuation                               #
-				########################################################				
-				elif ch == '-' and s[chid+1] == '>':
-					chid += 2
-					continue
-				
-				########################################################
-				# List item                                            #
-				########################################################
-				elif ch == '-' and s[chid+1] == ' ':
-					
-					if not _element_stack.count(types = ListContainerNode):
-						_element_stack.pop(until = [BoxedNode, BlockNode])
-						_element_stack.push(
-							ListContainerNode()
-						)
-					else:
-						_element_stack.pop(until = ListItemNode)
-						_element_stack.pop()
-						
-					_element_stack.push(
-						ListItemNode()
-					)
-					_element_stack.push(
-						ParagraphNode()
-					)
-
-					chid += 1
-					continue
-					
-					
-				########################################################
-				# Full-latex                                           #
-				########################################################				
-				elif (ch == '$' and s[chid+1] == '$') or (ch == '\\['):
-					if not _element_stack.count(FormulaNode):
-						_element_stack.pop(until = BlockNode)
-						
-						end_tag = '$$' if ch == '$' else '\\]'
-						end_of_formula = s.index(end_tag, chid+1)
-						latex = s[chid+1:end_of_formula]
-						
-						_element_stack.push(
-							FormulaNode()
-						)
-						_element_stack.push(
-							StringNode(string = latex)
-						)
-						_element_stack.pop()
-						_element_stack.pop()
-						
-						chid = end_of_formula+len(end_tag)
-					else:
-						_element_stack.pop(until = BlockNode)	
-					
-					continue				
-				
-				
-				########################################################
-				# Code                                                 #
-				########################################################
-				elif ch == '~': 
-					assert s[chid : chid+3] == '~~~'
-					
-					_element_stack.pop(until = BlockNode)
-					
-					end_of_code = s.index('~~~\n', chid+1)
-					
-					snippet = s[chid+3 : end_of_code]
-					
-					_element_stack.push(
-						CodeNode()
-					)
-					_element_stack.push(
-						StringNode(string = snippet)
-					)
-					_element_stack.pop()
-					_element_stack.pop()
-										
-					chid = end_of_code + 4
-					continue
-
-
-				########################################################
-				# End of block                                         #
-				########################################################
-				elif ch == '%': # Endblock
-					
-					# Pop last block
-					assert _element_stack.count(types = BlockNode) > 0
-					
-					_element_stack.pop(until = BlockNode)
-					_element_stack.pop()
-					
-					_element_stack.push(
-						BlockNode()
-					)
-					
-					assert( s[chid+1] == '\n')
-					chid += 2
-					new_line = True
-					
-					continue
-
-
-				########################################################
-				# All other chars                                      #
-				########################################################				
-				else:
-					# After multiple \n
-					if not _element_stack.count(types = ParagraphNode):
-						continue
-					# There is a title
-					elif _element_stack.count(types = SectionTitleNode):
-						_element_stack.pop(until = SectionNode)
-						_element_stack.push(
-							BlockNode()
-						)
-						continue
-					else:
-						raise NotImplementedError
-			
-			
-			else: # new_line = False
-				
-				########################################################
-				# Inline-latex                                         #
-				########################################################				
-				if ch == '$' or ch == '\\(':
-					if not _element_stack.count(FormulaSpanNode):
-						_element_stack.pop(
-							until = [
-								ParagraphNode,
-								BoldfaceSpanNode,
-								ItalicSpanNode,
-								TypewriterSpanNode
-							]
-						)
-						
-						end_tag = '$' if ch == '$' else '\\)'
-						end_of_formula = s.index(end_tag, chid+1)
-						latex = s[chid+1:end_of_formula]
-						
-						_element_stack.push(
-							FormulaSpanNode()
-						)
-						_element_stack.push(
-							StringNode(string = latex)
-						)
-						_element_stack.pop()
-						_element_stack.pop()
-						
-						chid = end_of_formula+len(end_tag)
-						
-					else:
-						_element_stack.pop(
-							until = [
-								ParagraphNode,
-								BoldfaceSpanNode,
-								ItalicSpanNode,
-								TypewriterSpanNode
-							]
-						)
-						
-					continue
-				
-				########################################################
-				# Boldface span                                        #
-				########################################################
-				if ch == '*':
-					if not _element_stack.count(BoldfaceSpanNode):
-						_element_stack.pop(until = ParagraphNode)
-
-						_element_stack.push(
-							BoldfaceSpanNode()
-						)
-					else:
-						_element_stack.pop(until = ParagraphNode)
-						
-					chid += 1
-					continue
-				
-				
-				########################################################
-				# Italic span                                          #
-				########################################################				
-				elif ch == "/":
-					if not _element_stack.count(ItalicSpanNode):
-						_element_stack.pop(until = ParagraphNode)
-
-						_element_stack.push(
-							ItalicSpanNode()
-						)
-					else:
-						_element_stack.pop(until = ParagraphNode)
-						
-						
-					chid += 1
-					continue
-					
-				########################################################
-				# Typewriter span                                      #
-				########################################################
-				elif ch == "+": 
-					if not _element_stack.count(TypewriterSpanNode):
-						_element_stack.pop(until = ParagraphNode)
-
-						_element_stack.push(
-							TypewriterSpanNode()
-						)
-					else:
-						_element_stack.pop(until = ParagraphNode)
-
-						
-					chid += 1
-					continue
-				
-				########################################################
-				# End of line                                          #
-				########################################################	
-				elif ch == "\n":
-					new_line = True
-					chid += 1
-					continue
-				
-				########################################################
-				# Any other char                                       #
-				########################################################				
-				else:
-					
-					if not _element_stack.count(types = ParagraphNode):
-						_element_stack.push(
-							ParagraphNode()
-						)
-					
-					if not _element_stack.count(types = StringNode):
-						_element_stack.push(
-							StringNode(string = escape(ch))
-						)
-					else:
-						assert isinstance(_element_stack.top(), StringNode)
-						
-						_element_stack.top().content += escape(ch)
-					
-					chid += 1
-					continue
+				handler = new_line_handlers.get(ch, grammar.paragraphs)
+			else:
+				handler = inline_handlers.get(ch, grammar.text)
+
+			if _stats is not None:
+				_stats._enter(handler.__name__, resume[0] != stats_at)
+				stats_at = resume[0]
+			if _guard is not None:
+				_guard.handler = handler
+
+			result = handler(context, chid, ch)
+			if result is None:
+				(chid, new_line), waiting = resume, True
+			else:
+				(chid, new_line) = result
 		
 		_element_stack.pop(until = DocumentNode)
-		
-		_root = _element_stack.top()
-		return _root
+
+		if _events:
+			for event in _events:
+				yield event
+			del _events[:]
+
+
+class IncrementalParser(object):
+	""" Push-style parser: the document is supplied in chunks through feed()
+	and parsed line by line as soon as the lines are complete. close() ends
+	the input and returns the root of the resulting tree, which is the same
+	as the one returned by Parser.parse_document on the whole text.
+
+	If events is True, the ("start", node), ("text", content) and
+	("end", node) events of Parser.iterparse are collected and can be
+	retrieved, while feeding, through read_events(). discard has the same
+	meaning as in Parser.iterparse.
+
+	If the document turns out to be malformed, feed() or close() raises the
+	error of the parser, and so do all the later calls to them.
+	"""
+
+	def __init__(self, events = False, discard = False):
+		self._events = [] if events else None
+		self._element_stack = ElementStack(events = self._events, discard = discard)
+		self._parser = Parser._parse('', self._element_stack, self._events, partial = True)
+		self._line = []
+		self._ready = []
+		self._root = None
+		self._error = None
+
+		self._run(None)
+
+	def _run(self, data):
+		""" Send data to the parser and collect the events it produces """
+
+		try:
+			event = self._parser.send(data)
+			while event is not _NEED_DATA:
+				self._ready.append(event)
+				event = next(self._parser)
+		except StopIteration:
+			pass
+		except Exception as error:
+			# The parser cannot go on
+			self._error = error
+			raise
+
+	def feed(self, chunk):
+		""" Feed a chunk of the document to the parser """
+
+		if self._error is not None:
+			raise self._error
+		if self._root is not None:
+			raise ValueError('feed() called after close()')
+
+		end_of_lines = chunk.rfind('\n')
+		if end_of_lines < 0:
+			self._line.append(chunk)
+			return
+
+		self._line.append(chunk[:end_of_lines])
+		lines = ''.join(self._line)
+		self._line = [chunk[end_of_lines+1:]]
+
+		self._run(_strip_blanks(lines) + '\n')
+
+	def read_events(self):
+		""" Yield the events produced so far and not yet read """
+
+		ready, self._ready = self._ready, []
+		for event in ready:
+			yield event
+
+	def close(self):
+		""" Parse what is left of the input and return the root of the tree """
+
+		if self._error is not None:
+			raise self._error
+		if self._root is None:
+			self._run(_strip_blanks(''.join(self._line)))
+			self._run(None)
+			self._line = []
+
+			self._root = self._element_stack.top()
+			if self._events is not None:
+				self._element_stack.pop()
+				self._ready.extend(self._events)
+				del self._events[:]
+
+		return self._root
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MarkPy - github.com/obag/MarkPy
+# Copyright © 2014 Gabriele Farina <gabr.farina@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Rendering of ElementNode trees to HTML. """
+
+from .elementnode import *
+
+
+_HTML_ESCAPES = [
+	('&', '&amp;'),
+	('<', '&lt;'),
+	('>', '&gt;'),
+	('"', '&quot;'),
+]
+_HTML_TABLE = dict((ord(ch), u'%s' % entity) for (ch, entity) in _HTML_ESCAPES)
+
+def escape(text):
+	""" Escape text for use in HTML content and (double-quoted) attribute
+	values
+	"""
+
+	if isinstance(text, bytes):
+		# Python 2 byte strings cannot be translated to longer strings
+		for (ch, entity) in _HTML_ESCAPES:
+			text = text.replace(ch, entity)
+		return text
+	return text.translate(_HTML_TABLE)
+
+class HTMLRenderer(object):
+	""" Renders ElementNode trees to HTML, streaming the output to any object
+	with a write method in chunks of about chunk_size characters.
+
+	Every node is rendered by a handler, a function (renderer, node) that
+	returns a pair (start, end) of strings: start is written before the
+	children of the node and end after them. If end is None, the children
+	are not rendered and start is all the output of the node.
+
+	The handler of a node is the first one found, along the MRO of its
+	class, in the handlers dict supplied to the constructor (mapping classes
+	to handlers) or among the methods of the renderer called render_ plus
+	the class name. Subclasses can therefore override the rendering of a
+	node type by defining the corresponding method.
+
+	If a fragment_cache (see cache.FragmentCache) is supplied, the output of
+	the nodes of the cached_types is reused whenever a subtree with the same
+	structural hash and depth is rendered again. This requires the output of
+	such nodes to depend only on their subtree and depth.
+	"""
+
+	cached_types = (SectionNode, BlockNode)
+
+	def __init__(self, handlers = None, chunk_size = 1 << 13,
+		fragment_cache = None):
+		self.handlers = dict(handlers or {})
+		self.chunk_size = chunk_size
+		self.fragment_cache = fragment_cache
+		self._dispatch = {}
+
+	def _handler(self, cls):
+		""" Returns the handler for nodes of class cls """
+
+		handler = self._dispatch.get(cls)
+		if handler is None:
+			for base in cls.__mro__:
+				if base in self.handlers:
+					handler = self.handlers[base]
+					break
+				method = getattr(type(self), 'render_' + base.__name__, None)
+				if method is not None:
+					handler = method
+					break
+			else:
+				raise TypeError('no handler to render %s' % cls.__name__)
+			self._dispatch[cls] = handler
+		return handler
+
+	def render(self, root, sink):
+		""" Write the HTML of the tree rooted at root to sink """
+
+		self._render(root, sink, True)
+
+	def _render(self, root, sink, cache_root):
+		""" Write the HTML of the tree rooted at root to sink, looking up
+		root in the fragment cache only if cache_root is True
+		"""
+
+		cache = self.fragment_cache
+		chunk = []
+		size = 0
+
+		stack = [root]
+		while stack:
+			item = stack.pop()
+
+			if (cache is not None and isinstance(item, self.cached_types) and
+				(cache_root or item is not root)):
+				key = (
+					item.structural_hash(),
+					item._attrib_items().get('depth'),
+				)
+				fragment = cache.get(key)
+				if fragment is None:
+					parts = []
+					self._render(item, _ListSink(parts), False)
+					fragment = u''.join(parts)
+					cache.put(key, fragment)
+				item = fragment
+
+			elif isinstance(item, ElementNode):
+				(start, end) = self._handler(type(item))(self, item)
+				if end is not None:
+					stack.append(end)
+					stack.extend(reversed(item._children))
+				item = start
+
+			if item:
+				chunk.append(item)
+				size += len(item)
+				if size >= self.chunk_size:
+					sink.write(u''.join(chunk))
+					(chunk, size) = ([], 0)
+
+		if chunk:
+			sink.write(u''.join(chunk))
+
+	def render_to_string(self, root):
+		""" Returns the HTML of the tree rooted at root """
+
+		parts = []
+		self.render(root, _ListSink(parts))
+		return u''.join(parts)
+
+	########################################################################
+	# Default handlers                                                     #
+	########################################################################
+
+	def render_ElementNode(self, node):
+		return ('', '')
+
+	def render_SectionNode(self, node):
+		return ('<section>\n', '</section>\n')
+
+	def render_SectionTitleNode(self, node):
+		# Sections only nest in sections, so their depth is their level
+		level = node.parent._attrib_items().get('depth', 1) if node.parent else 1
+		level = max(1, min(level, 6))
+		return ('<h%d>' % level, '</h%d>\n' % level)
+
+	def render_BlockNode(self, node):
+		return ('<div class="block">\n', '</div>\n')
+
+	def render_ParagraphNode(self, node):
+		if isinstance(node.parent, SectionTitleNode):
+			return ('', '')
+		if isinstance(node.parent, ImageNode):
+			return ('<figcaption>', '</figcaption>\n')
+		return ('<p>', '</p>\n')
+
+	def render_CodeNode(self, node):
+		code = u''.join(child.content for child in node._children)
+		return ('<pre><code>%s</code></pre>\n' % escape(code), None)
+
+	def render_RawHTMLNode(self, node):
+		return (node.content, None)
+
+	def render_StringNode(self, node):
+		return (escape(node.content), None)
+
+	def render_AlertNode(self, node):
+		return (
+			'<div class="alert alert-%d">\n' % node._attrib_items().get('level', 1),
+			'</div>\n',
+		)
+
+	def render_ListContainerNode(self, node):
+		return ('<ul>\n', '</ul>\n')
+
+	def render_ListItemNode(self, node):
+		return ('<li>', '</li>\n')
+
+	def render_BoxedNode(self, node):
+		return ('<div class="boxed">\n', '</div>\n')
+
+	def render_ImageNode(self, node):
+		return (
+			'<figure>\n<img src="%s" alt="">\n' % escape(node._attrib_items().get('path', '')),
+			'</figure>\n',
+		)
+
+	def render_TypewriterSpanNode(self, node):
+		return ('<code>', '</code>')
+
+	def render_BoldfaceSpanNode(self, node):
+		return ('<strong>', '</strong>')
+
+	def render_ItalicSpanNode(self, node):
+		return ('<em>', '</em>')
+
+	def render_FormulaSpanNode(self, node):
+		latex = u''.join(child.content for child in node._children)
+		return ('<span class="math">\\(%s\\)</span>' % escape(latex), None)
+
+	def render_FormulaNode(self, node):
+		latex = u''.join(child.content for child in node._children)
+		# The content of $$ formulas starts with the second $
+		if node._attrib_items().get('delimiter') == '$$':
+			latex = latex[1:]
+		return ('<div class="math">\\[%s\\]</div>\n' % escape(latex), None)
+
+class _ListSink(object):
+	""" A sink collecting the written chunks in a list """
+
+	def __init__(self, parts):
+		self.write = parts.append
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MarkPy - github.com/obag/MarkPy
+# Copyright © 2014 Gabriele Farina <gabr.farina@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" A small selector language to query ElementNode trees, in the spirit of
+CSS selectors:
+
+	SectionNode[depth=2] BoldfaceSpanNode > FormulaSpanNode
+
+- a type name matches the nodes of that class or of its subclasses, and *
+  matches any node;
+- [name] requires the attrib name to be set, and [name OP value], with OP
+  among = != < <= > >=, compares it to an integer or a (possibly quoted)
+  string;
+- a space between two compound selectors means "descendant of", a > means
+  "child of";
+- selectors separated by commas match the nodes matching any of them.
+
+Selectors are compiled once (see compile, which caches them) and evaluated
+in a single pass over the tree.
+"""
+
+import collections
+import operator
+import re
+
+from .elementnode import ElementNode, ResultForest
+
+
+_TOKEN = re.compile(r'''
+	\s*(?:
+		(?P<type>\*|[A-Za-z_]\w*)
+		| \[\s*(?P<name>[A-Za-z_]\w*)\s*
+			(?:(?P<op>!=|<=|>=|=|<|>)\s*
+				(?:(?P<int>-?\d+)|"(?P<dq>[^"]*)"|'(?P<sq>[^']*)'|(?P<word>[^\]\s]+))
+			\s*)?\]
+		| (?P<child>>)
+		| (?P<comma>,)
+	)''', re.VERBOSE)
+
+_OPERATORS = {
+	'=': operator.eq,
+	'!=': operator.ne,
+	'<': operator.lt,
+	'<=': operator.le,
+	'>': operator.gt,
+	'>=': operator.ge,
+}
+
+_CACHE_SIZE = 256
+_cache = collections.OrderedDict()
+
+def compile(selector):
+	""" Returns the Selector for the string selector, reusing the compiled
+	one if it has been used recently
+	"""
+
+	compiled = _cache.pop(selector, None)
+	if compiled is None:
+		compiled = Selector(selector)
+		if len(_cache) >= _CACHE_SIZE:
+			_cache.popitem(last = False)
+	_cache[selector] = compiled
+	return compiled
+
+def select(root, selector):
+	""" Yields, in document order, the nodes of the tree rooted at root that
+	match selector
+	"""
+
+	return compile(selector).iter(root)
+
+def select_forest(root, selector):
+	""" Returns a ResultForest, as ElementNode.filter does, of the nodes of
+	the tree rooted at root that match selector
+	"""
+
+	return compile(selector).forest(root)
+
+def _node_types():
+	""" Returns a dict mapping the names of ElementNode and all its
+	subclasses to the classes
+	"""
+
+	types = {}
+	pending = [ElementNode]
+	while pending:
+		cls = pending.pop()
+		types.setdefault(cls.__name__, cls)
+		pending.extend(cls.__subclasses__())
+	return types
+
+class Selector(object):
+	""" A compiled selector. Every selector of the comma-separated list is a
+	chain of steps, each one being a pair (child_only, test): child_only
+	tells whether the step must match a child (rather than any descendant)
+	of the node matching the previous step, and test is a function telling
+	whether a node matches the step.
+	"""
+
+	def __init__(self, selector):
+		self.selector = selector
+		self._chains = []
+		self._parse(selector)
+
+	def _parse(self, selector):
+		types = _node_types()
+
+		chain = []
+		child_only = False
+		# The compound selector being read: (type, predicates)
+		compound = None
+
+		pos = 0
+		selector = selector.rstrip()
+		while True:
+			m = _TOKEN.match(selector, pos) if pos < len(selector) else None
+			if m is None and pos < len(selector):
+				raise ValueError('invalid selector %r at position %d' % (selector, pos))
+
+			# A compound selector ends at a combinator, a comma, the end of
+			# the selector, or a type name after some white space
+			ends_compound = (
+				m is None or
+				m.group('child') or m.group('comma') or
+				m.group(0)[:1].isspace() or
+				(m.group('type') and compound is not None)
+			)
+			if compound is not None and ends_compound:
+				chain.append((child_only, Selector._test(*compound)))
+				(compound, child_only) = (None, False)
+
+			if m is None:
+				break
+			pos = m.end()
+
+			if m.group('type'):
+				if m.group('type') == '*':
+					cls = ElementNode
+				elif m.group('type') in types:
+					cls = types[m.group('type')]
+				else:
+					raise ValueError('unknown node type %r in selector %r' %
+						(m.group('type'), selector))
+				compound = (cls, [])
+			elif m.group('name'):
+				if compound is None:
+					compound = (ElementNode, [])
+				compound[1].append(Selector._predicate(m))
+			elif m.group('child'):
+				if not chain or child_only:
+					raise ValueError('misplaced > in selector %r' % selector)
+				child_only = True
+			else:
+				if not chain or child_only:
+					raise ValueError('misplaced , in selector %r' % selector)
+				self._chains.append(chain)
+				chain = []
+
+		if not chain or child_only:
+			raise ValueError('incomplete selector %r' % selector)
+		self._chains.append(chain)
+
+	@staticmethod
+	def _predicate(m):
+		""" Returns a function testing the attribute predicate matched by m
+		against an attrib dict
+		"""
+
+		name = m.group('name')
+		if m.group('op') is None:
+			return lambda attrib: name in attrib
+
+		compare = _OPERATORS[m.group('op')]
+		if m.group('int') is not None:
+			value = int(m.group('int'))
+		else:
+			value = next(v for v in m.group('dq', 'sq', 'word') if v is not None)
+
+		def predicate(attrib):
+			if name not in attrib:
+				return False
+			try:
+				return compare(attrib[name], value)
+			except TypeError:
+				return False
+		return predicate
+
+	@staticmethod
+	def _test(cls, predicates):
+		""" Returns a function telling whether a node is an instance of cls
+		satisfying all the predicates
+		"""
+
+		if not predicates:
+			return lambda node: isinstance(node, cls)
+
+		def test(node):
+			if not isinstance(node, cls):
+				return False
+			attrib = node._attrib_items()
+			for predicate in predicates:
+				if not predicate(attrib):
+					return False
+			return True
+		return test
+
+	def _step(self, pending, node):
+		""" Match node against the pending steps, which are pairs (chain,
+		step). Returns whether node matches the whole selector and the steps
+		pending for its children.
+		"""
+
+		matches = False
+		child_pending = []
+		for (chain, step) in pending:
+			(child_only, test) = self._chains[chain][step]
+			if not child_only:
+				# Any descendant can still match this step
+				child_pending.append((chain, step))
+			if test(node):
+				if step + 1 == len(self._chains[chain]):
+					matches = True
+				else:
+					child_pending.append((chain, step + 1))
+		return (matches, tuple(set(child_pending)))
+
+	def iter(self, root):
+		""" Yields, in document order, the nodes of the tree rooted at root
+		that match the selector
+		"""
+
+		stack = [(root, tuple((chain, 0) for chain in range(len(self._chains))))]
+		while stack:
+			(node, pending) = stack.pop()
+			(matches, child_pending) = self._step(pending, node)
+			if matches:
+				yield node
+			if child_pending:
+				stack.extend((child, child_pending) for child in reversed(node._children))
+
+	def forest(self, root):
+		""" Returns a ResultForest, as ElementNode.filter does, of the nodes
+		of the tree rooted at root that match the selector
+		"""
+
+		res = ResultForest()
+
+		stack = [(root, tuple((chain, 0) for chain in range(len(self._chains))), None)]
+		while stack:
+			(node, pending, ancestor) = stack.pop()
+			(matches, child_pending) = self._step(pending, node)
+			if matches:
+				result_node = ResultForest.ResultNode(node)
+				if ancestor is None:
+					res.trees.append(result_node)
+				else:
+					ancestor.append_child(result_node)
+				ancestor = result_node
+			if child_pending:
+				stack.extend(
+					(child, child_pending, ancestor)
+					for child in reversed(node._children)
+				)
+
+		return res
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MarkPy - github.com/obag/MarkPy
+# Copyright © 2014 Gabriele Farina <gabr.farina@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import sys
+import unittest
+
+from markpy import binary
+from markpy.elementnode import AlertNode
+from markpy.parser import Parser
+
+from tests.helpers import dump
+
+
+SOURCE = u'''= Title
+
+Some *bold* and /italic/ text, $x^2$, \\(y\\) and +tt *nested*+.
+
+== Sub
+
+- one
+- two
+
+~~~
+print 'è'
+~~~
+
+$$y = 1$$
+'''
+
+
+class RoundTripTest(unittest.TestCase):
+
+	def test_round_trip(self):
+		root = Parser.parse_document(SOURCE)
+		types = set(node[0] for node in dump(root))
+		self.assertTrue(types.issuperset([
+			'BoldfaceSpanNode', 'ItalicSpanNode', 'TypewriterSpanNode',
+			'FormulaSpanNode', 'FormulaNode', 'CodeNode', 'ListItemNode',
+		]))
+		self.assertEqual(dump(binary.loads(binary.dumps(root))), dump(root))
+
+	def test_lazy_round_trip(self):
+		root = Parser.parse_document(SOURCE)
+		loaded = binary.loads(binary.dumps(root), lazy = True)
+		self.assertEqual(dump(loaded), dump(root))
+
+	def test_attrib_and_extra(self):
+		root = Parser.parse_document(SOURCE)
+		node = AlertNode(2, {'kind': u'note', 'ratio': 0.5, 'done': True})
+		node.extra['count'] = 3
+		root.append_child(node)
+		loaded = binary.loads(binary.dumps(root))
+		self.assertEqual(loaded.children[-1].attrib, node.attrib)
+		self.assertEqual(loaded.children[-1].extra, {'count': 3})
+
+
+class BadInputTest(unittest.TestCase):
+
+	def setUp(self):
+		self.data = binary.dumps(Parser.parse_document(SOURCE))
+
+	def test_not_a_tree(self):
+		self.assertRaises(ValueError, binary.loads, b'')
+		self.assertRaises(ValueError, binary.loads, b'x' * 64)
+
+	def test_truncated(self):
+		for size in range(len(self.data)):
+			self.assertRaises(ValueError, binary.loads, self.data[:size])
+
+	def test_corrupted(self):
+		rng = random.Random(0)
+		data = bytearray(self.data)
+		for _ in range(2000):
+			corrupted = bytearray(data)
+			for _ in range(rng.randint(1, 4)):
+				corrupted[rng.randrange(len(data))] = rng.randrange(256)
+			try:
+				binary.loads(bytes(corrupted))
+			except ValueError:
+				pass
+
+	def test_unknown_types_are_not_imported(self):
+		name = 'wsgiref.handlers'
+		sys.modules.pop(name, None)
+		original = b'markpy.elementnode:DocumentNode'
+		data = self.data.replace(
+			original,
+			('%s:BaseHandler' % name).encode('ascii').ljust(len(original)),
+		)
+		# The string table ends stay the same with the padding
+		self.assertEqual(len(data), len(self.data))
+		self.assertRaises(ValueError, binary.loads, data)
+		self.assertNotIn(name, sys.modules)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MarkPy - github.com/obag/MarkPy
+# Copyright © 2014 Gabriele Farina <gabr.farina@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from markpy.cache import ParseCache
+from markpy.elementnode import AlertNode, ElementNode, ImageNode
+from markpy.parser import Parser
+
+
+DOCUMENT = u'= Title\n\n!! warning\n\n^picture.png^\n'
+
+class HighlightNode(ElementNode):
+	__slots__ = ()
+
+class ParseCacheTest(unittest.TestCase):
+
+	def test_hits_return_new_trees(self):
+		cache = ParseCache()
+		first = cache.parse_document(DOCUMENT)
+		second = cache.parse_document(DOCUMENT)
+		self.assertIsNot(first, second)
+		self.assertEqual(cache.stats()['hits'], 1)
+		self.assertEqual(cache.stats()['misses'], 1)
+
+	def test_changes_to_a_tree_do_not_reach_the_cache(self):
+		cache = ParseCache()
+		root = cache.parse_document(DOCUMENT)
+		alert = next(root.find_all(AlertNode))
+		level = alert.attrib['level']
+		alert.attrib['level'] = 99
+		next(root.find_all(ImageNode)).attrib['path'] = 'evil'
+		root.extra['key'] = 'value'
+
+		root = cache.parse_document(DOCUMENT)
+		self.assertEqual(next(root.find_all(AlertNode)).attrib['level'], level)
+		self.assertEqual(next(root.find_all(ImageNode)).attrib['path'],
+			'picture.png')
+		self.assertEqual(root.extra, {})
+
+	def test_registrations_change_the_key(self):
+		cache = ParseCache()
+		source = u'some @highlighted@ text\n'
+		key = ParseCache.key(source)
+		self.assertFalse(list(cache.parse_document(source).find_all(HighlightNode)))
+		with Parser.extensions():
+			Parser.register_span('@', HighlightNode)
+			self.assertNotEqual(ParseCache.key(source), key)
+			root = cache.parse_document(source)
+			self.assertTrue(list(root.find_all(HighlightNode)))
+		self.assertEqual(ParseCache.key(source), key)
+		self.assertEqual(cache.stats()['misses'], 2)
+
+if __name__ == '__main__':
+	unittest.main()
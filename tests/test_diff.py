@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MarkPy - github.com/obag/MarkPy
+# Copyright © 2014 Gabriele Farina <gabr.farina@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from markpy.diff import diff
+from markpy.elementnode import (
+	AlertNode, BlockNode, ParagraphNode, StringNode
+)
+from markpy.parser import Parser
+
+
+SOURCE = u'= A\n\nfirst text\n\nsecond text\n\n= B\n\n!! warning\n'
+
+def parse(s):
+	return Parser.parse_document(s)
+
+def paragraph(root, text):
+	""" The ParagraphNode of root whose text is text """
+
+	for node in root.find_all(ParagraphNode):
+		if u''.join(s.content for s in node.find_all(StringNode)) == text:
+			return node
+	raise LookupError(text)
+
+class DiffTest(unittest.TestCase):
+
+	def assertOperations(self, ops, expected):
+		self.assertEqual(
+			[
+				(op.kind, type(op.old if op.new is None else op.new), op.index)
+				for op in ops
+			],
+			expected,
+		)
+
+	def test_same_trees(self):
+		self.assertEqual(diff(parse(SOURCE), parse(SOURCE)), [])
+
+	def test_insert(self):
+		new = parse(SOURCE.replace(u'second text\n', u'second text\n\nnew\n'))
+		ops = diff(parse(SOURCE), new)
+		self.assertOperations(ops, [('insert', ParagraphNode, 2)])
+		self.assertIs(ops[0].new, paragraph(new, u'new'))
+
+	def test_delete(self):
+		old = parse(SOURCE)
+		ops = diff(old, parse(SOURCE.replace(u'first text\n\n', u'')))
+		self.assertOperations(ops, [('delete', ParagraphNode, 0)])
+		self.assertIs(ops[0].old, paragraph(old, u'first text'))
+		self.assertIs(ops[0].parent, ops[0].old.parent)
+
+	def test_update(self):
+		ops = diff(parse(SOURCE), parse(SOURCE.replace(u'!! ', u'!!! ')))
+		self.assertOperations(ops, [('update', AlertNode, 0)])
+		self.assertEqual(ops[0].new.attrib['level'], 3)
+
+	def test_move_among_siblings(self):
+		new = parse(u'= A\n\nsecond text\n\nfirst text\n\n= B\n\n!! warning\n')
+		ops = diff(parse(SOURCE), new)
+		self.assertOperations(ops, [('move', ParagraphNode, 0)])
+		self.assertIs(ops[0].new, paragraph(new, u'second text'))
+
+	def test_move_across_parents(self):
+		new = parse(u'= A\n\nfirst text\n\n= B\n\n!! warning\n\nsecond text\n')
+		ops = diff(parse(SOURCE), new)
+		self.assertOperations(ops, [('move', ParagraphNode, 1)])
+		self.assertIs(ops[0].new, paragraph(new, u'second text'))
+		self.assertIs(ops[0].parent, list(new.find_all(BlockNode))[1])
+
+	def test_edits_in_place_as_a_reparse(self):
+		tree = parse(SOURCE)
+		diff(tree, parse(SOURCE))
+
+		next(tree.find_all(AlertNode)).attrib['level'] = 3
+		edited = SOURCE.replace(u'!! ', u'!!! ')
+		self.assertEqual(diff(tree, parse(edited)), [])
+
+		first = paragraph(tree, u'first text')
+		first.parent.children.remove(first)
+		edited = edited.replace(u'first text\n\n', u'')
+		self.assertEqual(diff(tree, parse(edited)), [])
+
+		string = next(paragraph(tree, u'second text').find_all(StringNode))
+		string.content = u'other text'
+		edited = edited.replace(u'second text', u'other text')
+		self.assertEqual(diff(tree, parse(edited)), [])
+
+	def test_edits_in_place_are_seen(self):
+		tree = parse(SOURCE)
+		self.assertEqual(diff(tree, parse(SOURCE)), [])
+		next(tree.find_all(AlertNode)).attrib['level'] = 3
+		self.assertOperations(
+			diff(tree, parse(SOURCE)), [('update', AlertNode, 0)]
+		)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MarkPy - github.com/obag/MarkPy
+# Copyright © 2014 Gabriele Farina <gabr.farina@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy as copy_module
+import pickle
+import re
+import sys
+import unittest
+
+from markpy.elementnode import (
+	AlertNode, BoldfaceSpanNode, ElementNode, ParagraphNode, SectionNode,
+	StringNode, _NO_CHILDREN
+)
+from markpy.parser import Parser
+
+
+class ChildrenTest(unittest.TestCase):
+
+	def test_children_of_a_leaf_can_be_changed_in_place(self):
+		node = ParagraphNode()
+		child = StringNode(string = u'text')
+		node.children.append(child)
+		self.assertEqual(node.children, [child])
+
+	def test_children_set_to_an_empty_list(self):
+		node = ParagraphNode()
+		node.children = []
+		node.children.append(StringNode(string = u'text'))
+		self.assertEqual(len(node.children), 1)
+
+	def test_leaves_do_not_share_their_children(self):
+		(first, second) = (ParagraphNode(), ParagraphNode())
+		first.children.append(StringNode(string = u'text'))
+		self.assertEqual(second.children, [])
+
+	def test_reading_the_children_of_leaves_keeps_no_list(self):
+		root = Parser.parse_document(u'= A\n\nsome *bold* text\n')
+		leaves = [
+			node for node in root.iter_preorder() if not node.children
+		]
+		self.assertTrue(leaves)
+		for node in leaves:
+			self.assertIs(node._children, _NO_CHILDREN)
+
+	def test_copies_of_a_changed_leaf(self):
+		node = ParagraphNode()
+		node.children.append(StringNode(string = u'text'))
+		for copy in (
+			pickle.loads(pickle.dumps(node)), copy_module.deepcopy(node)
+		):
+			self.assertIs(type(copy._children), list)
+			self.assertEqual(copy.children[0].content, u'text')
+
+	def test_append_child(self):
+		node = ParagraphNode()
+		child = StringNode(string = u'text')
+		node.append_child(child)
+		self.assertEqual(node.children, [child])
+		self.assertIs(child.parent, node)
+
+class HashTest(unittest.TestCase):
+
+	SOURCE = u'= A\n\n!! warning\n\nsome text\n'
+
+	def assertChanges(self, change):
+		""" Check that change(root) changes the hash of root, and that the
+		new hash is the one of a fresh copy of the changed tree
+		"""
+
+		root = Parser.parse_document(self.SOURCE)
+		before = root.structural_hash()
+		change(root)
+		after = root.structural_hash()
+		self.assertNotEqual(after, before)
+		self.assertEqual(
+			after, pickle.loads(pickle.dumps(root)).structural_hash()
+		)
+
+	def test_attrib_changed_in_place(self):
+		def change(root):
+			next(root.find_all(AlertNode)).attrib['level'] = 3
+		self.assertChanges(change)
+
+	def test_attrib_updated_in_place(self):
+		def change(root):
+			next(root.find_all(AlertNode)).attrib.update(level = 3)
+		self.assertChanges(change)
+
+	def test_attrib_removed_in_place(self):
+		def change(root):
+			del next(root.find_all(AlertNode)).attrib['level']
+		self.assertChanges(change)
+
+	def test_child_appended_in_place(self):
+		def change(root):
+			paragraph = list(root.find_all(ParagraphNode))[-1]
+			paragraph.children.append(StringNode(string = u' more'))
+		self.assertChanges(change)
+
+	def test_child_removed_in_place(self):
+		def change(root):
+			paragraph = list(root.find_all(ParagraphNode))[-1]
+			paragraph.parent.children.remove(paragraph)
+		self.assertChanges(change)
+
+	def test_child_replaced_in_place(self):
+		def change(root):
+			paragraph = list(root.find_all(ParagraphNode))[-1]
+			paragraph.children[0] = StringNode(string = u'other text')
+		self.assertChanges(change)
+
+	def test_children_of_a_leaf_changed_in_place(self):
+		def change(root):
+			string = list(root.find_all(StringNode))[-1]
+			string.children.append(ParagraphNode())
+		self.assertChanges(change)
+
+	def test_setters_copy(self):
+		root = Parser.parse_document(self.SOURCE)
+		alert = next(root.find_all(AlertNode))
+		(attrib, children) = ({'level': 1}, [])
+		alert.attrib = attrib
+		alert.children = children
+		before = root.structural_hash()
+		attrib['level'] = 3
+		children.append(ParagraphNode())
+		self.assertEqual(root.structural_hash(), before)
+		self.assertEqual(alert.attrib, {'level': 1})
+		self.assertEqual(alert.children, [])
+
+	def test_depth_is_not_hashed(self):
+		root = Parser.parse_document(self.SOURCE)
+		before = root.structural_hash()
+		next(root.find_all(SectionNode)).attrib['depth'] = 2
+		self.assertEqual(root.structural_hash(), before)
+
+def _preorder(node, nodes):
+	nodes.append(node)
+	for child in node.children:
+		_preorder(child, nodes)
+	return nodes
+
+def _postorder(node, nodes):
+	for child in node.children:
+		_postorder(child, nodes)
+	nodes.append(node)
+	return nodes
+
+def _forest(trees):
+	return [(tree.node_ptr, _forest(tree.children)) for tree in trees]
+
+class TraversalTest(unittest.TestCase):
+
+	SOURCE = u'= A\n\nsome *bold* text\n\n== B\n\n- *item*\n\n= C\n\nthird\n'
+
+	def setUp(self):
+		self.root = Parser.parse_document(self.SOURCE)
+
+	def deep_tree(self):
+		""" A chain of nodes deeper than the recursion limit """
+
+		root = node = ParagraphNode()
+		for _ in range(sys.getrecursionlimit() + 100):
+			child = ParagraphNode()
+			node.append_child(child)
+			node = child
+		node.append_child(StringNode(string = u'leaf'))
+		return root
+
+	def test_orders(self):
+		self.assertEqual(
+			list(self.root.iter_preorder()), _preorder(self.root, []))
+		self.assertEqual(
+			list(self.root.iter_postorder()), _postorder(self.root, []))
+
+	def test_find_all(self):
+		for types in ([StringNode], [BoldfaceSpanNode, SectionNode], []):
+			self.assertEqual(
+				list(self.root.find_all(types)),
+				[
+					node for node in _preorder(self.root, [])
+					if isinstance(node, tuple(types))
+				],
+			)
+		self.assertIs(
+			self.root.find_any(BoldfaceSpanNode),
+			next(self.root.find_all(BoldfaceSpanNode)),
+		)
+		self.assertIsNone(self.root.find_any(AlertNode))
+
+	def test_filter(self):
+		sections = list(self.root.find_all(SectionNode))
+		bolds = list(self.root.find_all(BoldfaceSpanNode))
+		self.assertEqual(
+			_forest(self.root.filter([SectionNode, BoldfaceSpanNode]).trees),
+			[
+				(sections[0], [(bolds[0], []), (sections[1], [(bolds[1], [])])]),
+				(sections[2], []),
+			],
+		)
+
+	def test_to_string(self):
+		root = Parser.parse_document(u'= A\n\nsome *bold*\n')
+		self.assertEqual(
+			re.sub(r' \[0x[0-9a-fA-F]+\]', u'', root.to_string()),
+			"DocumentNode {'depth': 0} {}\n"
+			"  +--* SectionNode {'depth': 1} {}\n"
+			"     +--* SectionTitleNode {'depth': 2} {}\n"
+			"     |  +--* ParagraphNode {'depth': 3} {}\n"
+			"     |     +--- StringNode {'depth': 4} {}\n"
+			"     +--* BlockNode {'depth': 2} {}\n"
+			"        +--* ParagraphNode {'depth': 3} {}\n"
+			"           +--- StringNode {'depth': 4} {}\n"
+			"           +--* BoldfaceSpanNode {'depth': 4} {}\n"
+			"              +--- StringNode {'depth': 5} {}\n"
+		)
+
+	def test_deep_trees(self):
+		root = self.deep_tree()
+		depth = sys.getrecursionlimit() + 102
+		self.assertEqual(len(list(root.iter_preorder())), depth)
+		self.assertIsInstance(list(root.iter_postorder())[0], StringNode)
+		self.assertIsInstance(root.find_any(StringNode), StringNode)
+		self.assertEqual(len(root.filter([StringNode]).trees), 1)
+		self.assertEqual(root.to_string().count('\n'), depth)
+		self.assertEqual(
+			root.structural_hash(), self.deep_tree().structural_hash())
+
+class IndexTest(unittest.TestCase):
+
+	SOURCE = u'= A\n\nfirst\n\n== B\n\nsecond\n\n= C\n\nthird\n'
+
+	def assertIndexed(self, root):
+		for types in ([StringNode], [ParagraphNode, SectionNode], []):
+			self.assertEqual(
+				list(root.find_all(types)),
+				list(ElementNode.find_all(root, types)),
+			)
+
+	def test_append_child_keeps_the_index(self):
+		root = Parser.parse_document(self.SOURCE, index = True)
+		sections = list(root.find_all(SectionNode))
+		for section in sections:
+			paragraph = ParagraphNode()
+			paragraph.append_child(StringNode(string = u'new'))
+			section.append_child(paragraph)
+			self.assertIsNotNone(root._index)
+			self.assertIndexed(root)
+		sections[1].append_child([
+			ParagraphNode(), SectionNode({'depth': 3})
+		])
+		root.append_child(ParagraphNode())
+		self.assertIndexed(root)
+
+	def test_many_appends_at_the_same_place(self):
+		root = Parser.parse_document(self.SOURCE, index = True)
+		section = next(root.find_all(SectionNode))
+		for _ in range(100):
+			section.children[0].append_child(StringNode(string = u'new'))
+		self.assertIndexed(root)
+
+	def test_moving_a_node(self):
+		root = Parser.parse_document(self.SOURCE, index = True)
+		sections = list(root.find_all(SectionNode))
+		paragraph = next(sections[2].find_all(ParagraphNode))
+		paragraph.parent.children.remove(paragraph)
+		sections[0].append_child(paragraph)
+		self.assertIndexed(root)
+
+	def test_changing_children_in_place_drops_the_index(self):
+		root = Parser.parse_document(self.SOURCE, index = True)
+		section = next(root.find_all(SectionNode))
+		section.children.append(ParagraphNode())
+		self.assertIsNone(root._index)
+		self.assertIndexed(root)
+
+	def test_setting_children_drops_the_index(self):
+		root = Parser.parse_document(self.SOURCE, index = True)
+		root.children = root.children[:1]
+		self.assertIsNone(root._index)
+		self.assertIndexed(root)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MarkPy - github.com/obag/MarkPy
+# Copyright © 2014 Gabriele Farina <gabr.farina@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import unittest
+
+from markpy.elementnode import (
+	BoldfaceSpanNode, ElementNode, FormulaSpanNode, SectionNode, StringNode
+)
+from markpy.flat import FlatTree
+from markpy.parser import Parser
+
+from tests.helpers import dump
+
+
+SOURCE = (
+	u'= A\n\n!! alert *with $x$ bold*\n\n'
+	u'== B\n\nsome *bold /it $y$/ $z$* text\n\n^a.png^\n\n'
+	u'= C\n\n~~~\ncode\n~~~\n\n- item\n'
+)
+
+class FlatTreeTest(unittest.TestCase):
+
+	def setUp(self):
+		self.root = Parser.parse_document(SOURCE)
+		self.nodes = list(self.root.iter_preorder())
+		self.flat = FlatTree.from_tree(self.root)
+
+	def test_round_trip(self):
+		self.assertEqual(dump(self.flat.to_tree()), dump(self.root))
+		self.assertEqual(dump(Parser.parse_flat(SOURCE).to_tree()), dump(self.root))
+
+	def test_round_trip_of_attribs_and_extras(self):
+		self.nodes[3].attrib['name'] = u'value'
+		self.root.extra['key'] = u'value'
+		tree = FlatTree.from_tree(self.root).to_tree()
+		self.assertEqual(dump(tree), dump(self.root))
+		self.assertEqual(tree.extra, {'key': u'value'})
+
+	def test_columns(self):
+		flat = self.flat
+		self.assertEqual(len(flat), len(self.nodes))
+		for (index, node) in enumerate(self.nodes):
+			self.assertIs(flat.node_type(index), type(node))
+			self.assertEqual(flat.content(index), getattr(node, 'content', None))
+			self.assertEqual(
+				[self.nodes[child] for child in flat.children(index)],
+				list(node.children),
+			)
+			self.assertEqual(
+				[self.nodes[i] for i in flat.descendants(index)],
+				list(node.iter_preorder())[1:],
+			)
+			parent = flat.parents[index]
+			self.assertIs(
+				None if parent < 0 else self.nodes[parent], node.parent)
+
+	def test_count(self):
+		self.assertEqual(
+			self.flat.count(),
+			dict(collections.Counter(type(node) for node in self.nodes)),
+		)
+
+	def test_find_all(self):
+		for types in (
+			[StringNode], [BoldfaceSpanNode, FormulaSpanNode], [ElementNode], []
+		):
+			self.assertEqual(
+				list(self.flat.find_all(types)),
+				[
+					index for (index, node) in enumerate(self.nodes)
+					if isinstance(node, tuple(types))
+				],
+			)
+
+	def test_find_all_within(self):
+		section = self.nodes.index(list(self.root.find_all(SectionNode))[1])
+		self.assertEqual(
+			[self.nodes[i] for i in self.flat.find_all(FormulaSpanNode, section)],
+			list(self.nodes[section].find_all(FormulaSpanNode)),
+		)
+
+if __name__ == '__main__':
+	unittest.main()
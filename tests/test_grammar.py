@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MarkPy - github.com/obag/MarkPy
+# Copyright © 2014 Gabriele Farina <gabr.farina@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from markpy import grammar
+from markpy.elementnode import (
+	AlertNode, ElementNode, FormulaSpanNode, ParagraphNode, StringNode
+)
+from markpy import parser as parser_module
+from markpy.parser import Parser
+from tests.helpers import dump
+
+
+class HighlightNode(ElementNode):
+	__slots__ = ()
+
+class NoteNode(ElementNode):
+	__slots__ = ()
+
+def _types(s):
+	return [
+		type(node).__name__
+		for node in Parser.parse_document(s).iter_preorder()
+	]
+
+
+class RegistrationTest(unittest.TestCase):
+
+	def test_span(self):
+		with Parser.extensions():
+			Parser.register_span('@', HighlightNode)
+			root = Parser.parse_document(u'a @b $x$@ c\n')
+			(span,) = root.find_all(HighlightNode)
+			self.assertEqual(
+				[type(node) for node in span.children],
+				[StringNode, FormulaSpanNode],
+			)
+			self.assertIn(HighlightNode, grammar._SPAN_CONTAINERS)
+		self.assertNotIn('HighlightNode', _types(u'a @b@ c\n'))
+		self.assertNotIn(HighlightNode, grammar._SPAN_CONTAINERS)
+
+	def test_block(self):
+		with Parser.extensions():
+			Parser.register_block('&', NoteNode)
+			self.assertEqual(
+				_types(u'& note\n')[1:4],
+				['NoteNode', 'ParagraphNode', 'StringNode'],
+			)
+		self.assertNotIn('NoteNode', _types(u'& note\n'))
+
+	def test_backslash_pair_inside_text(self):
+		def bell(context, chid, ch):
+			context.stack.pop(until = ParagraphNode)
+			context.stack.push(AlertNode(0))
+			context.stack.pop()
+			return (chid + 1, False)
+
+		with Parser.extensions():
+			Parser.register_handler('\\b', bell, inline = True)
+			types = _types(u'some text \\b more\n')
+			self.assertEqual(types.count('AlertNode'), 1)
+			self.assertEqual(types.count('StringNode'), 2)
+		self.assertNotIn('AlertNode', _types(u'some text \\b more\n'))
+
+	def test_extensions_restore_replaced_handlers(self):
+		star = grammar.INLINE_HANDLERS['*']
+		with Parser.extensions():
+			Parser.register_handler('*', None, inline = True)
+			self.assertNotIn('*', grammar.INLINE_HANDLERS)
+			self.assertEqual(
+				_types(u'a *b*\n'),
+				['DocumentNode', 'ParagraphNode', 'StringNode'],
+			)
+		self.assertIs(grammar.INLINE_HANDLERS['*'], star)
+		self.assertIn('BoldfaceSpanNode', _types(u'a *b*\n'))
+
+	def test_fingerprint(self):
+		self.assertTrue(grammar.is_default())
+		self.assertEqual(grammar.fingerprint(), u'')
+		fingerprints = []
+		for node_class in (HighlightNode, HighlightNode, NoteNode):
+			with Parser.extensions():
+				Parser.register_span('@', node_class)
+				self.assertFalse(grammar.is_default())
+				fingerprints.append(grammar.fingerprint())
+		self.assertEqual(fingerprints[0], fingerprints[1])
+		self.assertNotEqual(fingerprints[0], fingerprints[2])
+		self.assertNotEqual(fingerprints[0], u'')
+		self.assertTrue(grammar.is_default())
+
+class ProcessesTest(unittest.TestCase):
+	""" Worker processes do not see the registrations """
+
+	SOURCE = u'\n'.join(
+		u'= Section %d\n\nsome @highlighted@ text\n' % i for i in range(4)
+	)
+
+	def setUp(self):
+		def pool(*args, **kwargs):
+			raise AssertionError('worker processes were started')
+		self.pool = parser_module.multiprocessing.Pool
+		parser_module.multiprocessing.Pool = pool
+
+	def tearDown(self):
+		parser_module.multiprocessing.Pool = self.pool
+
+	def test_parse_parallel(self):
+		with Parser.extensions():
+			Parser.register_span('@', HighlightNode)
+			root = Parser.parse_parallel(self.SOURCE, workers = 2, min_chunk = 1)
+			self.assertEqual(len(list(root.find_all(HighlightNode))), 4)
+			self.assertEqual(
+				dump(root), dump(Parser.parse_document(self.SOURCE))
+			)
+
+	def test_parse_many(self):
+		with Parser.extensions():
+			Parser.register_span('@', HighlightNode)
+			results = list(Parser.parse_many(
+				[self.SOURCE, u'x @a@ and @b@ y\n'], workers = 2, strings = True
+			))
+		self.assertEqual([result.index for result in results], [0, 1])
+		self.assertEqual(
+			[len(list(result.root.find_all(HighlightNode))) for result in results],
+			[4, 2],
+		)
+
+if __name__ == '__main__':
+	unittest.main()
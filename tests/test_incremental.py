@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MarkPy - github.com/obag/MarkPy
+# Copyright © 2014 Gabriele Farina <gabr.farina@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from markpy.elementnode import DocumentNode
+from markpy.parser import IncrementalParser, Parser
+
+from tests.helpers import dump
+
+
+SOURCE = u'''= Title
+
+Some *bold* and /italic/ text, $x$.
+
+~~~
+code
+= not a title
+~~~
+
+== Sub
+
+- one
+- two
+
+$$
+y = 1
+$$
+'''
+
+def feed(parser, s, size):
+	for start in range(0, len(s), size):
+		parser.feed(s[start : start+size])
+
+
+class IncrementalParserTest(unittest.TestCase):
+
+	def test_same_tree_as_parse_document(self):
+		expected = dump(Parser.parse_document(SOURCE))
+		for size in (1, 2, 3, 7, 64, len(SOURCE)):
+			parser = IncrementalParser()
+			feed(parser, SOURCE, size)
+			root = parser.close()
+			self.assertIsInstance(root, DocumentNode)
+			self.assertEqual(dump(root), expected)
+
+	def test_constructs_spanning_many_chunks(self):
+		s = (u'= T\n\n~~~\n' + u'code ~~ line\n' * 200 + u'~~~\n\n' +
+			u'$$\n' + u'x $ y\n' * 200 + u'$$\n\ntext $a\n' + u'b\n' * 200 + u'$\n')
+		expected = dump(Parser.parse_document(s))
+		for size in (1, 5, 13):
+			parser = IncrementalParser()
+			feed(parser, s, size)
+			self.assertEqual(dump(parser.close()), expected)
+
+	def test_close_twice(self):
+		parser = IncrementalParser()
+		parser.feed(SOURCE)
+		self.assertIs(parser.close(), parser.close())
+
+	def test_feed_after_close(self):
+		parser = IncrementalParser()
+		parser.close()
+		self.assertRaises(ValueError, parser.feed, u'text\n')
+
+	def test_read_events(self):
+		expected = list(Parser.iterparse(SOURCE))
+		parser = IncrementalParser(events = True)
+		events = []
+		for start in range(0, len(SOURCE), 5):
+			parser.feed(SOURCE[start : start+5])
+			events.extend(parser.read_events())
+		# The document is only complete once closed
+		self.assertFalse([
+			item for (kind, item) in events
+			if kind == 'end' and isinstance(item, DocumentNode)
+		])
+		root = parser.close()
+		events.extend(parser.read_events())
+		self.assertEqual(
+			[(kind, type(item).__name__) for (kind, item) in events],
+			[(kind, type(item).__name__) for (kind, item) in expected],
+		)
+		self.assertEqual(events[-1], ('end', root))
+		self.assertEqual(list(parser.read_events()), [])
+
+	def test_error_in_feed(self):
+		parser = IncrementalParser()
+		self.assertRaises(ValueError, parser.feed, u'= A\n\n=== C\n\ntext\n')
+		# The parser stays broken
+		self.assertRaises(ValueError, parser.feed, u'more text\n')
+		self.assertRaises(ValueError, parser.close)
+		self.assertRaises(ValueError, parser.close)
+
+	def test_error_in_close(self):
+		parser = IncrementalParser()
+		parser.feed(u'= A\n\n~~~\nunterminated code\n')
+		self.assertRaises(ValueError, parser.close)
+		self.assertRaises(ValueError, parser.close)
+		self.assertRaises(ValueError, parser.feed, u'~~~\n')
+
+if __name__ == '__main__':
+	unittest.main()
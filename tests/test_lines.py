@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MarkPy - github.com/obag/MarkPy
+# Copyright © 2014 Gabriele Farina <gabr.farina@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from markpy import lines
+from markpy.lines import LineTable
+
+
+class LineTableTest(unittest.TestCase):
+
+	def test_kinds(self):
+		table = LineTable(u'# c\n= A\n\n- item\n! alert\n^img^\n%\ntext\n')
+		self.assertEqual(list(table.kinds), [
+			lines.COMMENT, lines.TITLE, lines.BLANK, lines.LIST, lines.ALERT,
+			lines.IMAGE, lines.BLOCK_END, lines.TEXT, lines.BLANK,
+		])
+		self.assertEqual(list(table.titles()), [(1, 1)])
+
+	def test_code_block(self):
+		table = LineTable(u'= A\n\n~~~\n= x\n~~~\n\n== B\n')
+		self.assertEqual(table.kinds[2], lines.CODE)
+		self.assertEqual(table.kinds[3], lines.TEXT)
+		self.assertEqual(list(table.titles()), [(0, 1), (6, 2)])
+
+	def test_line_after_a_code_block(self):
+		# The parser goes on inline right after the closing ~~~
+		table = LineTable(u'= a\n\nfoo\n~~~\nx\n~~~\n== b\n$$x$$\n')
+		self.assertEqual(table.kinds[6], lines.TEXT)
+		self.assertEqual(table.levels[6], 0)
+		self.assertEqual(table.kinds[7], lines.FORMULA)
+		self.assertEqual(list(table.titles()), [(0, 1)])
+
+		# Nor does a formula open there
+		table = LineTable(u'~~~\nx\n~~~\n$$\n= y\n')
+		self.assertEqual(table.kinds[3], lines.TEXT)
+		self.assertEqual(list(table.titles()), [(4, 1)])
+
+	def test_formulas(self):
+		table = LineTable(u'$$\n= x\n$$\n= y\n\\[\n= z\n\\]\n$ text\n')
+		self.assertEqual(table.kinds[0], lines.FORMULA)
+		self.assertEqual(table.kinds[4], lines.FORMULA)
+		self.assertEqual(table.kinds[7], lines.TEXT)
+		self.assertEqual(list(table.titles()), [(3, 1)])
+
+	def test_unterminated_code_block(self):
+		table = LineTable(u'= A\n~~~\n= B\n')
+		self.assertEqual(list(table.titles()), [(0, 1)])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,432 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MarkPy - github.com/obag/MarkPy
+# Copyright © 2014 Gabriele Farina <gabr.farina@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from markpy.elementnode import (
+	DocumentNode, ParagraphNode, SectionNode, StringNode
+)
+from markpy.elementstack import CountingElementStack
+from markpy.lines import LineTable
+from markpy.parser import (
+	Limits, ParseError, Parser, ParseStats, _split_sections
+)
+
+from tests.helpers import dump
+
+
+# A bare code fence hiding a line that looks like a title
+FENCED = u'= A\n\ntext\n\n~~~\n= not a title\n~~~\n\n= B\n\nmore text\n'
+
+class ParseParallelTest(unittest.TestCase):
+
+	def test_same_tree_as_parse_document(self):
+		document = FENCED * 5
+		self.assertEqual(
+			dump(Parser.parse_parallel(document, workers = 1, min_chunk = 1)),
+			dump(Parser.parse_document(document)),
+		)
+
+	def test_code_blocks_are_not_split(self):
+		table = LineTable(FENCED)
+		self.assertEqual(
+			[table.offsets[line] for line in _split_sections(table, 1)],
+			[0, FENCED.index(u'= B')],
+		)
+
+class SkimTest(unittest.TestCase):
+
+	DOCUMENTS = [
+		FENCED,
+		# The line after a code block is not at the beginning of a line
+		u'= a\n\nfoo\n~~~\nx\n~~~\n== b\n\ntext\n',
+		# An inline formula spanning a line that looks like a title
+		u'= a\n\nfoo $x\n== b\n\n$ text\n\n= c\n\nmore\n',
+		# A title continuing past its line
+		u'= a\n\nx\n\n= b $y\n$\n\ntext\n\n== c\n\nmore $z\n= d\n$\n',
+	]
+
+	def test_same_tree_as_parse_document(self):
+		for document in self.DOCUMENTS:
+			expected = dump(Parser.parse_document(document))
+			self.assertEqual(dump(Parser.skim(document)), expected)
+
+	def _outline(self, root):
+		""" The sections of a skimmed document, without loading them """
+
+		sections = []
+		pending = [
+			node for node in reversed(root.children)
+			if isinstance(node, SectionNode)
+		]
+		while pending:
+			section = pending.pop()
+			sections.append(section)
+			pending.extend(reversed(section.subsections))
+		return sections
+
+	def test_sections_loaded_in_any_order(self):
+		for document in self.DOCUMENTS:
+			expected = dump(Parser.parse_document(document))
+			root = Parser.skim(document)
+			for section in reversed(self._outline(root)):
+				section.children
+			self.assertEqual(dump(root), expected)
+
+	def test_outline_is_not_parsed(self):
+		sections = self._outline(Parser.skim(FENCED))
+		self.assertEqual(len(sections), 2)
+		self.assertFalse(any(section.loaded for section in sections))
+
+class ParseStatsTest(unittest.TestCase):
+
+	def test_stack_calls_are_counted_once(self):
+		stack = CountingElementStack()
+		for node in (DocumentNode(), ParagraphNode(), StringNode(u'text')):
+			stack.push(node)
+		stack.pop(until = DocumentNode)
+		self.assertEqual(stack.count(StringNode), 0)
+		self.assertEqual((stack.pushes, stack.pops, stack.counts), (3, 1, 1))
+
+	def test_paragraph_steps_are_counted_once(self):
+		stats = ParseStats()
+		Parser.parse_document(u'= T\n\none\n\ntwo\n', stats = stats)
+		# The text of the paragraphs is in the steps of paragraphs
+		self.assertEqual(stats.calls, {
+			'sections': 1, 'text': 1, 'paragraphs': 2, 'line_ends': 3,
+			'blank_lines': 2,
+		})
+		self.assertEqual(set(stats.times), set(stats.calls))
+
+class IterparseTest(unittest.TestCase):
+
+	SOURCE = u'= A\n\nsome *bold* text\n\n- item\n\n== B\n\n!! warning\n'
+
+	def test_events_follow_the_tree(self):
+		root = Parser.parse_document(self.SOURCE)
+		events = list(Parser.iterparse(self.SOURCE))
+		self.assertEqual(
+			[type(node) for (event, node) in events if event == 'start'],
+			[type(node) for node in root.iter_preorder()],
+		)
+		self.assertEqual(
+			[type(node) for (event, node) in events if event == 'end'],
+			[type(node) for node in root.iter_postorder()],
+		)
+		self.assertEqual(dump(events[-1][1]), dump(root))
+
+	def test_text_comes_before_the_end_of_its_string(self):
+		events = list(Parser.iterparse(self.SOURCE))
+		texts = 0
+		for (position, (event, value)) in enumerate(events):
+			if event == 'text':
+				(end, node) = events[position + 1]
+				self.assertEqual(end, 'end')
+				self.assertIsInstance(node, StringNode)
+				self.assertEqual(node.content, value)
+				texts += 1
+		self.assertEqual(texts, sum(
+			1 for node in Parser.parse_document(self.SOURCE).iter_preorder()
+			if isinstance(node, StringNode)
+		))
+
+	def test_discard(self):
+		kept = list(Parser.iterparse(self.SOURCE))
+		discarded = list(Parser.iterparse(self.SOURCE, discard = True))
+		self.assertEqual(
+			[(event, type(value)) for (event, value) in discarded],
+			[(event, type(value)) for (event, value) in kept],
+		)
+		self.assertEqual(discarded[-1][1].children, [])
+		for (event, node) in discarded:
+			if event == 'start' and not isinstance(node, DocumentNode):
+				self.assertIsNotNone(node.parent)
+
+	def test_lazy(self):
+		self.assertEqual(
+			[
+				value for (event, value) in
+				Parser.iterparse(self.SOURCE, lazy = True) if event == 'text'
+			],
+			[
+				value for (event, value) in
+				Parser.iterparse(self.SOURCE) if event == 'text'
+			],
+		)
+
+class ParseFileTest(unittest.TestCase):
+
+	SOURCE = (
+		u'= Caf\xe9\n\nna\xefve *gr\xfc\xdfe* and $$\u03b1 + \u03b2$$\n\n'
+		u'~~~\ncode \u2014 here\n~~~\n\n== \u65e5\u672c\n\n- item\n'
+	)
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def write(self, data):
+		path = os.path.join(self.directory, 'document.mp')
+		with open(path, 'wb') as f:
+			f.write(data)
+		return path
+
+	def test_chunk_boundaries(self):
+		path = self.write(self.SOURCE.encode('utf-8'))
+		expected = dump(Parser.parse_document(self.SOURCE))
+		for chunk_size in (1, 2, 3, 5, 7, 64, 1 << 20):
+			self.assertEqual(
+				dump(Parser.parse_file(path, chunk_size = chunk_size)), expected,
+				'chunk_size %d' % chunk_size,
+			)
+
+	def test_encoding(self):
+		source = u'= Caf\xe9\n\nna\xefve text\n'
+		path = self.write(source.encode('latin-1'))
+		self.assertEqual(
+			dump(Parser.parse_file(path, encoding = 'latin-1', chunk_size = 2)),
+			dump(Parser.parse_document(source)),
+		)
+
+	def test_empty_file(self):
+		self.assertEqual(
+			dump(Parser.parse_file(self.write(b''))),
+			dump(Parser.parse_document(u'')),
+		)
+
+class ParseManyTest(unittest.TestCase):
+
+	DOCUMENTS = [
+		u'= Document %d\n\nsome *text*\n' % index for index in range(6)
+	]
+	# An unterminated code block
+	BROKEN = u'= A\n\n~~~\ncode\n'
+
+	def check(self, results, documents):
+		for result in results:
+			self.assertEqual(
+				dump(result.root),
+				dump(Parser.parse_document(documents[result.index])),
+			)
+			self.assertIsNone(result.error)
+
+	def test_ordered(self):
+		for workers in (1, 2):
+			results = list(Parser.parse_many(
+				self.DOCUMENTS, workers = workers, strings = True))
+			self.assertEqual(
+				[result.index for result in results],
+				list(range(len(self.DOCUMENTS))),
+			)
+			self.check(results, self.DOCUMENTS)
+
+	def test_unordered(self):
+		results = list(Parser.parse_many(
+			self.DOCUMENTS, workers = 2, ordered = False, strings = True))
+		self.assertEqual(
+			sorted(result.index for result in results),
+			list(range(len(self.DOCUMENTS))),
+		)
+		self.check(results, self.DOCUMENTS)
+
+	def test_errors(self):
+		documents = list(self.DOCUMENTS)
+		documents[2] = self.BROKEN
+		for workers in (1, 2):
+			results = list(Parser.parse_many(
+				documents, workers = workers, strings = True))
+			self.assertEqual(len(results), len(documents))
+			self.assertIsNone(results[2].root)
+			self.assertEqual(
+				results[2].error, 'ValueError: substring not found')
+			self.check(results[:2] + results[3:], documents)
+
+	def test_files(self):
+		directory = tempfile.mkdtemp()
+		try:
+			paths = []
+			for (index, document) in enumerate(self.DOCUMENTS[:3]):
+				paths.append(os.path.join(directory, '%d.mp' % index))
+				with open(paths[-1], 'wb') as f:
+					f.write(document.encode('utf-8'))
+			paths.append(os.path.join(directory, 'missing.mp'))
+
+			results = list(Parser.parse_many(paths, workers = 2))
+		finally:
+			shutil.rmtree(directory)
+
+		self.assertEqual([result.path for result in results], paths)
+		self.check(results[:3], self.DOCUMENTS)
+		self.assertIsNone(results[3].root)
+		self.assertIn('No such file', results[3].error)
+
+class ReparseTest(unittest.TestCase):
+
+	SOURCE = (
+		u'= A\n\nfirst *text*\n\n== A.1\n\nmore\n\n'
+		u'= B\n\nsecond text\n\n= C\n\nthird text\n'
+	)
+
+	def edit(self, root, old, new, start = 0):
+		""" Replace the first occurrence of old after start in the source of
+		root with new, through Parser.reparse
+		"""
+
+		offset = root.source.index(old, start)
+		return Parser.reparse(root, offset, len(old), new)
+
+	def assertSameAsParse(self, root):
+		self.assertEqual(dump(root), dump(Parser.parse_document(root.source)))
+
+	def test_edits(self):
+		root = Parser.parse_editable(self.SOURCE)
+		self.assertSameAsParse(root)
+		for (old, new) in [
+			(u'second', u'2nd'),
+			(u'= C\n', u'= C\n\n!! new alert\n'),
+			(u'more\n', u'more\n\n= New\n\nnew section\n'),
+			(u'= B\n\n2nd text\n\n', u''),
+			(u'first', u'the *first*'),
+		]:
+			self.edit(root, old, new)
+			self.assertSameAsParse(root)
+
+	def test_only_touched_sections_are_replaced(self):
+		root = Parser.parse_editable(self.SOURCE)
+		(a, b, c) = root.children
+		(removed, added) = self.edit(root, u'second', u'2nd')
+		self.assertEqual(removed, [b])
+		self.assertEqual(list(root.children), [a] + added + [c])
+		self.assertIs(b.parent, None)
+		self.assertSameAsParse(root)
+
+	def test_edit_joining_sections(self):
+		# An open code block swallows the sections that follow
+		root = Parser.parse_editable(self.SOURCE)
+		tail = self.SOURCE[self.SOURCE.index(u'second'):]
+		self.edit(root, tail, u'~~~\n%s~~~\n' % tail)
+		self.assertSameAsParse(root)
+		self.assertEqual(len(root.children), 2)
+		self.edit(root, u'~~~\n%s~~~\n' % tail, tail)
+		self.assertSameAsParse(root)
+		self.assertEqual(len(root.children), 3)
+
+	def test_failed_edit_leaves_the_tree(self):
+		root = Parser.parse_editable(self.SOURCE)
+		before = dump(root)
+		self.assertRaises(
+			Exception, self.edit, root, u'third text\n', u'~~~\nthird text\n')
+		self.assertEqual(dump(root), before)
+		self.assertEqual(root.source, self.SOURCE)
+
+class LazyTest(unittest.TestCase):
+
+	SOURCE = u'= A\n\nfirst \\* line\n\nsecond *bold*\n'
+
+	def strings(self, lazy):
+		root = Parser.parse_document(self.SOURCE, lazy = lazy)
+		return list(root.find_all(StringNode))
+
+	def test_same_tree(self):
+		self.assertEqual(
+			dump(Parser.parse_document(self.SOURCE, lazy = True)),
+			dump(Parser.parse_document(self.SOURCE)),
+		)
+
+	def test_spans(self):
+		strings = self.strings(True)
+		for node in strings:
+			# The source is shared, not copied
+			self.assertIs(node.source, strings[0].source)
+			if node._content is None:
+				self.assertEqual(
+					node.content, self.SOURCE[node.start : node.end])
+		(_, escaped, _, _) = strings
+		# The content differs from the source, and is kept
+		self.assertEqual(escaped.content, u'first * line')
+		self.assertEqual(
+			self.SOURCE[escaped.start : escaped.end], u'first \\* line')
+
+	def test_position(self):
+		self.assertEqual(
+			[node.position() for node in self.strings(True)],
+			[(1, 2), (3, 1), (5, 1), (5, 9)],
+		)
+		self.assertEqual(
+			[node.position() for node in self.strings(False)],
+			[None] * 4,
+		)
+
+	def test_content_set(self):
+		node = self.strings(True)[-1]
+		node.content = u'other'
+		self.assertEqual(node.content, u'other')
+		self.assertEqual(node.position(), (5, 9))
+
+class HardenedTest(unittest.TestCase):
+
+	def assertParseError(self, s, limits, message, line):
+		try:
+			Parser.parse_document(s, limits = limits)
+		except ParseError as error:
+			self.assertEqual(
+				(str(error).split(' at line ')[0], error.line), (message, line))
+		else:
+			self.fail('no ParseError')
+
+	def test_limits(self):
+		self.assertParseError(u'text ' * 10, Limits(max_size = 10),
+			'input longer than 10 characters', 1)
+		self.assertParseError(u'= A\n\n' + u'- item\n' * 10,
+			Limits(max_nodes = 20), 'more than 20 nodes', 7)
+		self.assertParseError(u'= A\n\n== B\n\n=== C\n\ntext\n',
+			Limits(max_depth = 4), 'tree deeper than 4 levels', 1)
+
+	def test_malformed_input(self):
+		for (s, message, line) in [
+			(u'= A\n\n=== C\n', 'malformed sections', 3),
+			(u'%\n', 'malformed block_ends', 1),
+			(u'= A\n\ntext\n%text\n', 'malformed block_ends', 4),
+			(u'= A\n\n~~~\ncode\n', 'unterminated code', 3),
+		]:
+			self.assertParseError(s, Limits(), message, line)
+
+	def test_malformed_input_without_asserts(self):
+		# The checks must not be assert statements, which -O removes
+		script = (
+			'from markpy.parser import Parser, Limits, ParseError\n'
+			'for s in (u"= A\\n\\n=== C\\n", u"%\\n", u"= A\\n\\nx\\n%x\\n"):\n'
+			'	try:\n'
+			'		Parser.parse_document(s, limits = Limits())\n'
+			'	except ParseError:\n'
+			'		continue\n'
+			'	raise SystemExit(1)\n'
+		)
+		root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+		self.assertEqual(
+			subprocess.call([sys.executable, '-O', '-c', script], cwd = root), 0)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MarkPy - github.com/obag/MarkPy
+# Copyright © 2014 Gabriele Farina <gabr.farina@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from markpy.cache import FragmentCache
+from markpy.elementnode import AlertNode, ParagraphNode, StringNode
+from markpy.parser import Parser
+from markpy.render import HTMLRenderer
+
+
+class _Sink(object):
+
+	def __init__(self):
+		self.parts = []
+		self.write = self.parts.append
+
+def render(s, renderer = None):
+	return render_tree(Parser.parse_document(s), renderer)
+
+def render_tree(root, renderer = None):
+	sink = _Sink()
+	(renderer or HTMLRenderer()).render(root, sink)
+	return u''.join(sink.parts)
+
+
+class FormulaTest(unittest.TestCase):
+
+	def test_dollar_display_formula(self):
+		self.assertIn(
+			u'<div class="math">\\[x+1\\]</div>', render(u'$$x+1$$\n')
+		)
+
+	def test_bracket_display_formula(self):
+		self.assertIn(
+			u'<div class="math">\\[x+1\\]</div>', render(u'\\[x+1\\]\n')
+		)
+
+	def test_dollar_inside_bracket_display_formula(self):
+		self.assertIn(
+			u'<div class="math">\\[$x\\]</div>', render(u'\\[$x\\]\n')
+		)
+
+	def test_dollar_inside_dollar_display_formula(self):
+		self.assertIn(
+			u'<div class="math">\\[ $x \\]</div>', render(u'$$ $x $$\n')
+		)
+
+	def test_formula_span(self):
+		self.assertIn(
+			u'<span class="math">\\(x\\)</span>', render(u'text $x$ text\n')
+		)
+
+class FragmentCacheTest(unittest.TestCase):
+
+	SOURCE = u'= A\n\n!! warning\n\nsome text\n\n= B\n\nother text\n'
+
+	def setUp(self):
+		self.cache = FragmentCache()
+		self.renderer = HTMLRenderer(fragment_cache = self.cache)
+
+	def test_same_output(self):
+		self.assertEqual(
+			render(self.SOURCE, self.renderer), render(self.SOURCE)
+		)
+		self.assertEqual(
+			render(self.SOURCE, self.renderer), render(self.SOURCE)
+		)
+		self.assertTrue(self.cache.hits)
+
+	def test_fragments_reused_across_parses(self):
+		render(self.SOURCE, self.renderer)
+		misses = self.cache.misses
+		render(self.SOURCE.replace(u'other', u'changed'), self.renderer)
+		self.assertTrue(self.cache.hits)
+		self.assertLess(self.cache.misses - misses, misses)
+
+	def assertRendersChange(self, change):
+		root = Parser.parse_document(self.SOURCE)
+		render_tree(root, self.renderer)
+		change(root)
+		self.assertEqual(
+			render_tree(root, self.renderer), render_tree(root)
+		)
+
+	def test_attrib_changed_in_place(self):
+		def change(root):
+			next(root.find_all(AlertNode)).attrib['level'] = 3
+		self.assertRendersChange(change)
+
+	def test_children_changed_in_place(self):
+		def change(root):
+			paragraph = list(root.find_all(ParagraphNode))[-1]
+			paragraph.children.append(StringNode(string = u' more'))
+		self.assertRendersChange(change)
+
+	def test_content_changed(self):
+		def change(root):
+			list(root.find_all(StringNode))[-1].content = u'changed'
+		self.assertRendersChange(change)
+
+if __name__ == '__main__':
+	unittest.main()
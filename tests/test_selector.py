@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MarkPy - github.com/obag/MarkPy
+# Copyright © 2014 Gabriele Farina <gabr.farina@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from markpy import selector
+from markpy.elementnode import (
+	AlertNode, FormulaSpanNode, ImageNode, SectionNode
+)
+from markpy.parser import Parser
+
+
+SOURCE = (
+	u'= A\n\n!! alert *with $x$ bold*\n\n'
+	u'== B\n\nsome *bold /it $y$/ $z$* text\n\n!!! more\n\n^a.png^\n\n'
+	u'= C\n\n^b.png^\n'
+)
+
+def _forest(trees):
+	return [(tree.node_ptr, _forest(tree.children)) for tree in trees]
+
+class SelectTest(unittest.TestCase):
+
+	def setUp(self):
+		self.root = Parser.parse_document(SOURCE)
+		self.alerts = list(self.root.find_all(AlertNode))
+		self.formulas = list(self.root.find_all(FormulaSpanNode))
+		self.images = list(self.root.find_all(ImageNode))
+		self.sections = list(self.root.find_all(SectionNode))
+
+	def select(self, s):
+		return list(selector.select(self.root, s))
+
+	def test_types(self):
+		self.assertEqual(self.select('FormulaSpanNode'), self.formulas)
+		self.assertEqual(self.select('*'), list(self.root.iter_preorder()))
+		# Subclasses match too
+		self.assertEqual(
+			self.select('ElementNode'), list(self.root.iter_preorder()))
+
+	def test_attribs(self):
+		self.assertEqual(self.select('[level]'), self.alerts)
+		self.assertEqual(self.select('AlertNode[level=2]'), self.alerts[:1])
+		self.assertEqual(self.select('AlertNode[level>=3]'), self.alerts[1:])
+		self.assertEqual(self.select('AlertNode[level < 3]'), self.alerts[:1])
+		self.assertEqual(self.select('ImageNode[path=a.png]'), self.images[:1])
+		self.assertEqual(self.select("ImageNode[path='b.png']"), self.images[1:])
+		self.assertEqual(self.select('[path!="a.png"]'), self.images[1:])
+		self.assertEqual(
+			self.select('SectionNode[depth=1]'),
+			[self.sections[0], self.sections[2]],
+		)
+
+	def test_descendants(self):
+		self.assertEqual(
+			self.select('AlertNode FormulaSpanNode'), self.formulas[:1])
+		self.assertEqual(
+			self.select('SectionNode[depth=2] FormulaSpanNode'),
+			self.formulas[1:],
+		)
+		self.assertEqual(
+			self.select('SectionNode SectionNode ImageNode'), self.images[:1])
+
+	def test_children(self):
+		self.assertEqual(
+			self.select('BoldfaceSpanNode > FormulaSpanNode'), self.formulas[:1])
+		self.assertEqual(
+			self.select('ParagraphNode > FormulaSpanNode'), self.formulas[2:])
+		self.assertEqual(
+			self.select('ParagraphNode FormulaSpanNode'), self.formulas)
+		self.assertEqual(
+			self.select('SectionNode > BlockNode > ImageNode'), self.images)
+
+	def test_union(self):
+		self.assertEqual(
+			self.select('ImageNode, AlertNode'),
+			[self.alerts[0], self.alerts[1], self.images[0], self.images[1]],
+		)
+		self.assertEqual(self.select('AlertNode, [level]'), self.alerts)
+
+	def test_forest(self):
+		types = [SectionNode, FormulaSpanNode]
+		self.assertEqual(
+			_forest(selector.select_forest(
+				self.root, 'SectionNode, FormulaSpanNode').trees),
+			_forest(self.root.filter(types).trees),
+		)
+		self.assertEqual(
+			_forest(selector.select_forest(
+				self.root, 'SectionNode FormulaSpanNode').trees),
+			[(formula, []) for formula in self.formulas],
+		)
+
+	def test_invalid(self):
+		for s in (
+			'NoSuchNode', 'AlertNode >', '> AlertNode', 'AlertNode,',
+			'AlertNode > > ImageNode', 'AlertNode[level', '',
+		):
+			self.assertRaises(ValueError, selector.compile, s)
+
+	def test_compiled_once(self):
+		self.assertIs(
+			selector.compile('AlertNode ImageNode'),
+			selector.compile('AlertNode ImageNode'),
+		)
+
+if __name__ == '__main__':
+	unittest.main()